@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alarms', '0007_performance_indexes'),
+        ('flocks', '0010_add_production_and_processing_stage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeightDeviationCheck',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('enqueued_at', models.DateTimeField(auto_now_add=True)),
+                ('flock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flocks.flock')),
+            ],
+            options={
+                'unique_together': {('flock', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alarms', '0008_weightdeviationcheck'),
+        ('flocks', '0012_flockmovement_opening_balances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlarmStreak',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('last_date', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('configuration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='streaks', to='alarms.alarmconfiguration')),
+                ('flock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flocks.flock')),
+            ],
+            options={
+                'unique_together': {('configuration', 'flock')},
+            },
+        ),
+    ]
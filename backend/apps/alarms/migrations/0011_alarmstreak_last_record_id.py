@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alarms', '0010_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alarmstreak',
+            name='last_record_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
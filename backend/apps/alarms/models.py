@@ -145,3 +145,60 @@ class NotificationLog(BaseModel):
     def is_read(self):
         return self.read_at is not None
 
+
+
+class NotificationOutbox(models.Model):
+    """Notificación pendiente de entrega (bandeja de salida).
+
+    Los productores escriben las filas dentro de su transacción; deliver_notifications_task
+    las entrega y las borra. Las que agotan los reintentos quedan en FAILED.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pendiente'),
+        ('FAILED', 'Fallida'),
+    ]
+
+    alarm = models.ForeignKey(Alarm, on_delete=models.CASCADE, related_name='+')
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    channel = models.CharField(max_length=20)
+    payload = models.JSONField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+
+class WeightDeviationCheck(models.Model):
+    """Cola de (lote, fecha) con pesajes pendientes de evaluar contra la curva de la raza.
+
+    El guardado de DailyWeightRecord solo encola; la tarea periódica drena la cola en lote.
+    """
+    flock = models.ForeignKey('flocks.Flock', on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['flock', 'date']
+
+
+class AlarmStreak(models.Model):
+    """Racha de incumplimientos consecutivos por (configuración, lote).
+
+    last_record_id es la marca de agua: cada evaluación solo procesa registros insertados después.
+    last_date es la fecha del último registro contado en la racha.
+    """
+    configuration = models.ForeignKey(AlarmConfiguration, on_delete=models.CASCADE, related_name='streaks')
+    flock = models.ForeignKey('flocks.Flock', on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    last_date = models.DateField()
+    last_record_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['configuration', 'flock']
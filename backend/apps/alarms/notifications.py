@@ -1,7 +1,7 @@
 from typing import Protocol, Any, Dict, Optional
 import logging
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 
 logger = logging.getLogger(__name__)
 
@@ -23,20 +23,61 @@ class FCMAdapter:
 
 
 class EmailAdapter:
+    """Email adapter that reuses one backend connection across sends.
+
+    The connection is opened on the first send and kept until close(), so a
+    dispatch cycle that mails many recipients pays a single SMTP/TLS handshake.
+    With settings.ALARMS_EMAIL_DIGEST, send_many merges the alarms of one
+    recipient into a single message.
+    """
+
+    def __init__(self, connection=None):
+        self.connection = connection
+
+    def _open(self):
+        if self.connection is None:
+            self.connection = get_connection()
+            # opened here so send_messages keeps it alive between batches
+            self.connection.open()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                logger.exception('Closing email connection failed')
+            self.connection = None
+
     def send(self, alarm, recipient, payload=None):
+        return self.send_many([alarm], recipient, payload)[0]
+
+    def send_many(self, alarms, recipient, payload=None):
+        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
+        if not from_email:
+            return [{'status': 'skipped', 'reason': 'no-from-email'} for _ in alarms]
+        # recipient.email expected
+        if not getattr(recipient, 'email', None):
+            return [{'status': 'skipped', 'reason': 'no-email'} for _ in alarms]
+
+        if len(alarms) > 1 and getattr(settings, 'ALARMS_EMAIL_DIGEST', False):
+            subject = f'Alarmas: {len(alarms)} nuevas'
+            body = '\n'.join(f'- [{a.priority}] {a.alarm_type}: {a.description}' for a in alarms)
+            messages = [EmailMessage(subject, body, from_email, [recipient.email])]
+        else:
+            messages = [
+                EmailMessage(f'Alarma: {a.alarm_type} [{a.priority}]', a.description, from_email, [recipient.email])
+                for a in alarms
+            ]
+
         try:
-            subject = f'Alarma: {alarm.alarm_type} [{alarm.priority}]'
-            body = alarm.description
-            from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
-            if not from_email:
-                return {'status': 'skipped', 'reason': 'no-from-email'}
-
-            # recipient.email expected
-            send_mail(subject, body, from_email, [recipient.email])
-            return {'status': 'sent'}
+            self._open().send_messages(messages)
         except Exception as e:
             logger.exception('Email send failed')
-            return {'status': 'error', 'error': str(e)}
+            # a broken connection is not reused for the next recipient
+            self.close()
+            return [{'status': 'error', 'error': str(e)} for _ in alarms]
+        return [{'status': 'sent'} for _ in alarms]
 
 
 class LocalFallbackAdapter:
@@ -53,12 +94,32 @@ class LocalFallbackAdapter:
             logger.exception('LocalFallbackAdapter failed')
             return {'status': 'error', 'error': str(e)}
 
+    def send_many(self, alarms, recipient, payload=None):
+        """Write the logs for several alarms of one recipient with a single bulk insert."""
+        try:
+            from .models import NotificationLog
+            logs = NotificationLog.objects.bulk_create([
+                NotificationLog(alarm=alarm, recipient=recipient, notification_type='PUSH', status='SENT')
+                for alarm in alarms
+            ])
+            return [{'status': 'sent', 'log_id': nl.id} for nl in logs]
+        except Exception as e:
+            logger.exception('LocalFallbackAdapter failed')
+            return [{'status': 'error', 'error': str(e)} for _ in alarms]
 
-def get_default_adapter():
-    # decide adapter from settings; fallback to LocalFallbackAdapter
-    adapter_name = getattr(settings, 'ALARMS_NOTIFICATION_ADAPTER', 'local')
+
+def default_adapter_name():
+    return getattr(settings, 'ALARMS_NOTIFICATION_ADAPTER', 'local')
+
+
+def get_adapter(adapter_name):
     if adapter_name == 'fcm':
         return FCMAdapter()
     if adapter_name == 'email':
         return EmailAdapter()
     return LocalFallbackAdapter()
+
+
+def get_default_adapter():
+    # decide adapter from settings; fallback to LocalFallbackAdapter
+    return get_adapter(default_adapter_name())
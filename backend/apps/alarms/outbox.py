@@ -0,0 +1,205 @@
+import json
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import NotificationLog, NotificationOutbox
+from .notifications import default_adapter_name, get_adapter
+
+logger = logging.getLogger(__name__)
+
+# Tipo de NotificationLog según el canal (el resto son push)
+LOG_TYPES = {'email': 'EMAIL', 'sms': 'SMS'}
+
+
+class NotificationOutboxService:
+    """Bandeja de salida: los productores encolan en su transacción y un worker entrega en lote."""
+
+    @staticmethod
+    def enqueue(pairs, channel=None, payload=None):
+        """Escribir pares (alarma, destinatario) en la bandeja con un solo bulk_create.
+
+        Acepta instancias o pk. Los pares repetidos se descartan y la entrega se dispara
+        tras el commit, así que una transacción revertida no notifica nada.
+
+        Returns the number of rows written.
+        """
+        channel = channel or default_adapter_name()
+        rows = {}
+        for alarm, recipient in pairs:
+            alarm_id = getattr(alarm, 'pk', alarm)
+            recipient_id = getattr(recipient, 'pk', recipient)
+            if alarm_id and recipient_id:
+                rows[(alarm_id, recipient_id)] = NotificationOutbox(
+                    alarm_id=alarm_id, recipient_id=recipient_id, channel=channel, payload=payload,
+                )
+        if not rows:
+            return 0
+
+        NotificationOutbox.objects.bulk_create(rows.values(), batch_size=500)
+        transaction.on_commit(NotificationOutboxService.kick)
+        return len(rows)
+
+    @staticmethod
+    def enqueue_alarms(alarms):
+        """Encolar las alarmas para los destinatarios de su configuración (resueltos una vez por configuración)."""
+        recipients = {}
+        pairs = []
+        for alarm in alarms:
+            if alarm.pk is None or alarm.configuration_id is None:
+                continue
+            if alarm.configuration_id not in recipients:
+                recipients[alarm.configuration_id] = alarm.configuration.get_notification_recipients()
+            pairs.extend((alarm, user) for user in recipients[alarm.configuration_id])
+        return NotificationOutboxService.enqueue(pairs)
+
+    @staticmethod
+    def kick():
+        """Pedir una ronda de entrega; si el broker no responde, la tarea periódica la hará."""
+        from .tasks import deliver_notifications_task
+
+        try:
+            deliver_notifications_task.delay()
+        except Exception:
+            logger.warning('Could not enqueue notification delivery, leaving it to the periodic task')
+
+    @staticmethod
+    def drain(limit=None):
+        """Tomar un lote de filas vencidas, entregarlas por canal y destinatario, y registrar el resultado.
+
+        Tres pasos, sin transacción abierta durante el envío:
+        - reclamar: con SKIP LOCKED se toman las filas y se corre available_at un plazo de
+          ALARM_NOTIFICATION_LEASE_SECONDS, en una transacción corta; otro worker no las ve, y si
+          este muere a mitad del envío vuelven a la cola al vencer el plazo
+        - entregar: fuera de toda transacción; las filas repetidas de un mismo (alarma,
+          destinatario, canal) se entregan una vez
+        - registrar: en otra transacción corta se insertan los NotificationLog en bloque, se borran
+          las filas entregadas u omitidas y las fallidas se reprograman con espera exponencial
+          hasta ALARM_NOTIFICATION_MAX_ATTEMPTS
+
+        Returns a dict with counts.
+        """
+        limit = limit or getattr(settings, 'ALARM_NOTIFICATION_BATCH_SIZE', 100)
+        max_attempts = getattr(settings, 'ALARM_NOTIFICATION_MAX_ATTEMPTS', 5)
+        backoff = getattr(settings, 'ALARM_NOTIFICATION_BACKOFF_SECONDS', 60)
+        lease = getattr(settings, 'ALARM_NOTIFICATION_LEASE_SECONDS', 300)
+        summary = {'claimed': 0, 'sent': 0, 'skipped': 0, 'coalesced': 0, 'retried': 0, 'failed': 0}
+
+        now = timezone.now()
+        with transaction.atomic():
+            queue = NotificationOutbox.objects.filter(
+                status='PENDING', available_at__lte=now,
+            ).select_related('alarm', 'recipient').order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                # Bloquear solo las filas de la bandeja, no las alarmas ni los usuarios del JOIN
+                of = ('self',) if connection.features.has_select_for_update_of else ()
+                queue = queue.select_for_update(skip_locked=True, of=of)
+            rows = list(queue[:limit])
+            if not rows:
+                return summary
+            NotificationOutbox.objects.filter(id__in=[row.pk for row in rows]).update(
+                available_at=now + timedelta(seconds=lease),
+            )
+        summary['claimed'] = len(rows)
+
+        groups = defaultdict(list)
+        for row in rows:
+            groups[(row.channel, row.recipient_id)].append(row)
+
+        # Un adaptador por canal y ronda: EmailAdapter reutiliza su conexión entre destinatarios
+        adapters = {}
+        outcomes = []
+        try:
+            for (channel, _), group in groups.items():
+                if channel not in adapters:
+                    adapters[channel] = get_adapter(channel)
+                outcomes.extend(NotificationOutboxService._deliver(adapters[channel], group))
+        finally:
+            for adapter in adapters.values():
+                if hasattr(adapter, 'close'):
+                    adapter.close()
+
+        now = timezone.now()
+        logs, done, retry = [], [], []
+        for duplicates, result in outcomes:
+            head = duplicates[0]
+            done.extend(row.pk for row in duplicates[1:])
+            summary['coalesced'] += len(duplicates) - 1
+
+            status = result.get('status')
+            if status != 'error':
+                done.append(head.pk)
+                summary['sent' if status == 'sent' else 'skipped'] += 1
+                # LocalFallbackAdapter ya escribió su log
+                if status == 'sent' and 'log_id' not in result:
+                    logs.append(NotificationOutboxService._log(head, 'SENT'))
+                continue
+
+            head.attempts += 1
+            head.last_error = str(result.get('error', ''))
+            if head.attempts >= max_attempts:
+                head.status = 'FAILED'
+                summary['failed'] += 1
+                logs.append(NotificationOutboxService._log(head, 'ERROR'))
+            else:
+                head.available_at = now + timedelta(seconds=backoff * 2 ** (head.attempts - 1))
+                summary['retried'] += 1
+            retry.append(head)
+
+        with transaction.atomic():
+            NotificationLog.objects.bulk_create(logs, batch_size=500)
+            NotificationOutbox.objects.filter(id__in=done).delete()
+            NotificationOutbox.objects.bulk_update(retry, ['attempts', 'last_error', 'status', 'available_at'], batch_size=500)
+
+        return summary
+
+    @staticmethod
+    def _deliver(adapter, rows):
+        """Entregar las filas de un destinatario; devuelve [(filas repetidas, resultado)].
+
+        Sin payload propio, todas las alarmas van en una llamada a send_many si el adaptador la tiene.
+        """
+        unique = {}
+        for row in rows:
+            key = (row.alarm_id, json.dumps(row.payload, sort_keys=True) if row.payload else None)
+            unique.setdefault(key, []).append(row)
+
+        recipient = rows[0].recipient
+        plain = [dups for (_, payload), dups in unique.items() if payload is None]
+        outcomes = []
+        if plain:
+            alarms = [dups[0].alarm for dups in plain]
+            try:
+                if hasattr(adapter, 'send_many'):
+                    results = adapter.send_many(alarms, recipient)
+                else:
+                    results = [adapter.send(alarm, recipient) for alarm in alarms]
+            except Exception as e:
+                logger.exception('Adapter failed for recipient %s', recipient.pk)
+                results = [{'status': 'error', 'error': str(e)} for _ in alarms]
+            outcomes.extend(zip(plain, results))
+
+        for (_, payload), dups in unique.items():
+            if payload is None:
+                continue
+            try:
+                result = adapter.send(dups[0].alarm, recipient, payload=dups[0].payload)
+            except Exception as e:
+                logger.exception('Adapter failed for recipient %s', recipient.pk)
+                result = {'status': 'error', 'error': str(e)}
+            outcomes.append((dups, result))
+        return outcomes
+
+    @staticmethod
+    def _log(row, status):
+        return NotificationLog(
+            alarm_id=row.alarm_id,
+            recipient_id=row.recipient_id,
+            notification_type=LOG_TYPES.get(row.channel, 'PUSH'),
+            status=status,
+            error_message=row.last_error if status == 'ERROR' else '',
+        )
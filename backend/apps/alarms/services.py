@@ -1,52 +1,131 @@
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.utils import timezone
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.functions import Coalesce, Greatest
 
 from apps.farms.models import Farm
 
 from .models import AlarmConfiguration, Alarm
+from .streaks import StreakTracker
 
 logger = logging.getLogger(__name__)
 
 
+def _evaluation_mode():
+    """'chord' (una tarea Celery por unidad), 'threads' (pool en proceso) o 'serial'."""
+    return getattr(settings, 'ALARM_EVALUATION_MODE', 'chord')
+
+
 class AlarmEvaluationEngine:
+    # Evaluadores por tipo de configuración; los tipos sin evaluador se omiten
+    EVALUATORS = {
+        'MORTALITY': '_evaluate_mortality_alarms',
+        'NO_RECORDS': '_evaluate_missing_records_alarms',
+        'STOCK': '_evaluate_stock_alarms',
+    }
+
     @staticmethod
-    def evaluate_all_farms():
-        active_farms = Farm.objects.filter(alarm_configs__is_active=True).distinct()
-        results = {'farms_evaluated': 0, 'alarms_generated': 0, 'errors': 0}
+    def evaluate_all_farms(mode=None):
+        """Evaluar todas las granjas con configuraciones activas, en serie o con un pool de hilos.
 
-        for farm in active_farms:
-            try:
-                res = AlarmEvaluationEngine.evaluate_farm(farm)
-                results['farms_evaluated'] += 1
-                results['alarms_generated'] += res.get('alarms_created', 0)
-            except Exception as e:
-                results['errors'] += 1
-                logger.exception(e)
+        El modo 'chord' reparte las unidades en tareas Celery (ver evaluate_all_alarms_task);
+        llamado directamente aquí se evalúa en el pool de hilos del proceso.
+        """
+        mode = mode or _evaluation_mode()
+        units = AlarmEvaluationEngine.evaluation_units()
+
+        if mode == 'serial':
+            results = [AlarmEvaluationEngine.evaluate_unit(farm_id, alarm_type) for farm_id, alarm_type in units]
+        else:
+            workers = getattr(settings, 'ALARM_EVALUATION_WORKERS', 4)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='alarm-eval') as pool:
+                results = list(pool.map(lambda unit: AlarmEvaluationEngine._evaluate_unit_in_thread(*unit), units))
 
-        return results
+        return AlarmEvaluationEngine.aggregate(results)
 
     @staticmethod
-    def evaluate_farm(farm: Farm):
+    def evaluation_units():
+        """Unidades de trabajo: (granja, None) o, con ALARM_EVALUATION_SPLIT_BY_TYPE, (granja, tipo).
+
+        Una sola consulta sobre las configuraciones activas.
+        """
+        pairs = AlarmConfiguration.objects.filter(
+            is_active=True, alarm_type__in=AlarmEvaluationEngine.EVALUATORS,
+        ).values_list('farm_id', 'alarm_type').order_by('farm_id', 'alarm_type').distinct()
+
+        if getattr(settings, 'ALARM_EVALUATION_SPLIT_BY_TYPE', False):
+            return list(pairs)
+        return [(farm_id, None) for farm_id in dict.fromkeys(farm_id for farm_id, _ in pairs)]
+
+    @staticmethod
+    def evaluate_unit(farm_id, alarm_type=None):
+        """Evaluar una granja (o solo un tipo de configuración) y medir cuánto tarda.
+
+        Nunca lanza: los errores quedan en el resultado para que el agregado los cuente.
+        """
+        started = time.monotonic()
+        result = {'farm_id': farm_id, 'alarm_type': alarm_type, 'alarms_created': 0, 'errors': 0}
+        try:
+            farm = Farm.objects.get(pk=farm_id)
+            res = AlarmEvaluationEngine.evaluate_farm(farm, [alarm_type] if alarm_type else None)
+            result['alarms_created'] = res['alarms_created']
+            result['errors'] = res['errors']
+        except Exception:
+            result['errors'] += 1
+            logger.exception('Error evaluating farm %s', farm_id)
+        result['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+        return result
+
+    @staticmethod
+    def _evaluate_unit_in_thread(farm_id, alarm_type):
+        try:
+            return AlarmEvaluationEngine.evaluate_unit(farm_id, alarm_type)
+        finally:
+            # Cada hilo abre su propia conexión; cerrarla para no agotar el pool de la base
+            connection.close()
+
+    @staticmethod
+    def aggregate(results):
+        """Combinar los resultados por unidad: totales, tiempo por granja y granjas lentas."""
+        summary = {'farms_evaluated': 0, 'alarms_generated': 0, 'errors': 0, 'farm_timings_ms': {}, 'slow_farms': []}
+        farms = set()
+        for res in results:
+            farms.add(res['farm_id'])
+            summary['alarms_generated'] += res['alarms_created']
+            summary['errors'] += res['errors']
+            timings = summary['farm_timings_ms']
+            timings[res['farm_id']] = round(timings.get(res['farm_id'], 0) + res['duration_ms'], 1)
+        summary['farms_evaluated'] = len(farms)
+
+        slow_ms = getattr(settings, 'ALARM_SLOW_FARM_SECONDS', 30) * 1000
+        summary['slow_farms'] = sorted(farm_id for farm_id, ms in summary['farm_timings_ms'].items() if ms >= slow_ms)
+        for farm_id in summary['slow_farms']:
+            logger.warning('Slow alarm evaluation for farm %s: %.1f ms', farm_id, summary['farm_timings_ms'][farm_id])
+        return summary
+
+    @staticmethod
+    def evaluate_farm(farm: Farm, alarm_types=None):
         configs = farm.alarm_configs.filter(is_active=True)
+        if alarm_types:
+            configs = configs.filter(alarm_type__in=alarm_types)
         alarms_created = 0
+        errors = 0
 
         for config in configs:
+            evaluator = AlarmEvaluationEngine.EVALUATORS.get(config.alarm_type)
+            if evaluator is None:
+                continue
             try:
-                if config.alarm_type == 'MORTALITY':
-                    created = AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config)
-                elif config.alarm_type == 'NO_RECORDS':
-                    created = AlarmEvaluationEngine._evaluate_missing_records_alarms(farm, config)
-                elif config.alarm_type == 'STOCK':
-                    created = AlarmEvaluationEngine._evaluate_stock_alarms(farm, config)
-                else:
-                    created = 0
-
-                alarms_created += created
+                alarms_created += getattr(AlarmEvaluationEngine, evaluator)(farm, config)
             except Exception:
+                errors += 1
                 logger.exception('Error evaluating config %s', config.id)
 
-        return {'alarms_created': alarms_created}
+        return {'alarms_created': alarms_created, 'errors': errors}
 
     @staticmethod
     def _evaluate_mortality_alarms(farm: Farm, config: AlarmConfiguration):
@@ -55,18 +134,21 @@ class AlarmEvaluationEngine:
 
         Behavior:
         - look back over the config.evaluation_period_hours window (rounded to days)
-        - for each flock in the farm, examine MortalityRecord entries in that window
+        - load only the farm's MortalityRecord entries inserted after each flock's streak
+          watermark, in one query (a periodic run costs the size of the new data); flocks
+          that received back-dated records are re-evaluated over the whole window
         - compute daily mortality rate for each record and compare to config.threshold_value
-        - create an Alarm for each offending MortalityRecord unless an unresolved
-          Alarm for the same flock and day already exists (avoid duplicates)
+        - advance the per-flock streak of consecutive breaching days (StreakTracker)
+        - collect an Alarm for each offending MortalityRecord once the streak reaches
+          config.consecutive_occurrences, unless an unresolved Alarm for the same
+          record already exists (avoid duplicates; for re-evaluated records any Alarm does)
         - set priority to HIGH if exceeds critical_threshold (if set)
-        - call AlarmNotificationService.send_alarm_notifications for created alarms
+        - bulk-create the alarms and queue their notifications in the outbox
 
         Returns number of alarms created.
         """
         from datetime import timedelta
-        from apps.flocks.models import MortalityRecord, Flock
-        created = 0
+        from apps.flocks.models import MortalityRecord
 
         # convert hours window to days (at least 1)
         hours = max(1, config.evaluation_period_hours)
@@ -74,189 +156,187 @@ class AlarmEvaluationEngine:
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=days)
 
-        # Batch: fetch all mortality records for all flocks of this farm in one query
-        records = MortalityRecord.objects.filter(
+        # Batch: fetch the new mortality records for all flocks of this farm in one query
+        streaks = StreakTracker(config)
+        records = streaks.pending(MortalityRecord.objects.filter(
             flock__shed__farm=farm,
             date__range=[start_date, end_date]
-        ).select_related('flock', 'flock__shed')
+        ).select_related('flock', 'flock__shed'))
 
-        if not records.exists():
+        if not records:
             return 0
 
-        # Batch: fetch all existing unresolved alarm source_ids for these records in one query
-        record_ids = [r.id for r in records]
-        existing_alarm_ids = set(
-            Alarm.objects.filter(
+        # Batch: fetch all existing alarms for these records in one query; a resolved alarm only
+        # blocks records that were already evaluated, so a replay does not reopen it
+        replayed = {r.id for r in records if getattr(r, 'replayed', False)}
+        existing_alarm_ids = {
+            source_id for source_id, status in Alarm.objects.filter(
                 alarm_type='MORTALITY',
                 source_type='mortality',
-                source_id__in=record_ids,
-            ).exclude(status='RESOLVED').values_list('source_id', flat=True)
-        )
-
+                source_id__in=[r.id for r in records],
+            ).values_list('source_id', 'status')
+            if status != 'RESOLVED' or source_id in replayed
+        }
+
+        threshold = float(config.threshold_value)
+        critical = float(config.critical_threshold) if config.critical_threshold else None
+        alarms = []
         for rec in records:
-            try:
-                flock = rec.flock
-                original_quantity = flock.current_quantity + rec.deaths
-                if original_quantity == 0:
-                    continue
-
-                daily_mortality_rate = (rec.deaths / original_quantity) * 100
-
-                if daily_mortality_rate >= float(config.threshold_value):
-                    if rec.id in existing_alarm_ids:
-                        continue
-
-                    priority = 'HIGH' if (config.critical_threshold and daily_mortality_rate >= float(config.critical_threshold)) else 'MEDIUM'
-
-                    alarm = Alarm.objects.create(
-                        alarm_type='MORTALITY',
-                        description=f'Mortalidad alta en {flock.shed.name} - {rec.date}: {daily_mortality_rate:.1f}% (umbral: {config.threshold_value}%)',
-                        priority=priority,
-                        farm=farm,
-                        flock=flock,
-                        configuration=config,
-                        source_type='mortality',
-                        source_date=rec.date,
-                        source_id=rec.id,
-                    )
-
-                    created += 1
-
-                    try:
-                        AlarmNotificationService.send_alarm_notifications(alarm, config)
-                    except Exception:
-                        logger.exception('Failed sending notifications for alarm %s', alarm.id)
-            except Exception:
-                logger.exception('Error evaluating mortality record %s', rec.id)
+            flock = rec.flock
+            original_quantity = flock.current_quantity + rec.deaths
+            daily_mortality_rate = (rec.deaths / original_quantity) * 100 if original_quantity else 0
+
+            streak = streaks.observe(rec, daily_mortality_rate >= threshold and original_quantity > 0)
+            if not streak or rec.id in existing_alarm_ids:
+                continue
+
+            description = f'Mortalidad alta en {flock.shed.name} - {rec.date}: {daily_mortality_rate:.1f}% (umbral: {config.threshold_value}%)'
+            if streaks.required > 1:
+                description += f' - {streak} días consecutivos'
+            alarms.append(Alarm(
+                alarm_type='MORTALITY',
+                description=description,
+                priority='HIGH' if critical is not None and daily_mortality_rate >= critical else 'MEDIUM',
+                farm=farm,
+                flock=flock,
+                configuration=config,
+                source_type='mortality',
+                source_date=rec.date,
+                source_id=rec.id,
+            ))
+
+        # alarms, streak state and outbox rows commit together or not at all
+        with transaction.atomic():
+            AlarmEvaluationEngine._bulk_create_alarms(alarms)
+            streaks.save()
+            AlarmNotificationService.dispatch(alarms)
+        return len(alarms)
 
-        return created
+    @staticmethod
+    def _bulk_create_alarms(alarms):
+        """bulk_create de alarmas nuevas; en backends sin RETURNING (MySQL) recupera los pk por origen."""
+        if not alarms:
+            return
+        Alarm.objects.bulk_create(alarms, batch_size=500)
+
+        if not connection.features.can_return_rows_from_bulk_insert:
+            ids = {
+                (alarm_type, source_type, source_id): pk
+                for pk, alarm_type, source_type, source_id in Alarm.objects.filter(
+                    alarm_type__in={a.alarm_type for a in alarms},
+                    source_type__in={a.source_type for a in alarms},
+                    source_id__in={a.source_id for a in alarms},
+                    status='PENDING',
+                ).values_list('id', 'alarm_type', 'source_type', 'source_id')
+            }
+            for alarm in alarms:
+                alarm.pk = ids.get((alarm.alarm_type, alarm.source_type, alarm.source_id))
 
     @staticmethod
     def _evaluate_missing_records_alarms(farm: Farm, config: AlarmConfiguration):
-        # Placeholder implementation
-        return 0
+        """Create alarms for active flocks with no recent DailyRecord, DailyWeightRecord
+        or MortalityRecord.
+
+        Behavior:
+        - the window is config.evaluation_period_hours rounded up to days (at least 1)
+        - one query per farm: each active flock is annotated with its latest record date
+          per table (Max subqueries over the (flock, date) indexes) and its last activity
+          is the most recent of those and the arrival date, so new flocks get a grace period
+        - flocks with an unresolved NO_RECORDS alarm are excluded with an anti-join (NOT EXISTS)
+        - priority is HIGH when the gap reaches config.critical_threshold days (if set)
+        - alarms are bulk-created and their notifications queued in the outbox
+
+        Returns number of alarms created.
+        """
+        from datetime import timedelta
+        from apps.flocks.models import DailyRecord, DailyWeightRecord, Flock, MortalityRecord
+
+        hours = max(1, config.evaluation_period_hours)
+        days = max(1, int((hours + 23) // 24))
+        today = timezone.now().date()
+        cutoff = today - timedelta(days=days)
+
+        def latest(model):
+            return models.Subquery(
+                model.objects.filter(flock=models.OuterRef('pk'))
+                .values('flock').annotate(last=models.Max('date')).values('last')[:1],
+                output_field=models.DateField(),
+            )
+
+        open_alarm = Alarm.objects.filter(
+            alarm_type='NO_RECORDS', flock=models.OuterRef('pk'),
+        ).exclude(status='RESOLVED')
+
+        # Greatest devuelve NULL con cualquier argumento NULL en MySQL/SQLite: Coalesce con la llegada
+        arrival = models.F('arrival_date')
+        stale = (
+            Flock.objects.filter(shed__farm=farm, status='ACTIVE')
+            .annotate(last_activity=Greatest(
+                arrival,
+                Coalesce(latest(DailyRecord), arrival),
+                Coalesce(latest(DailyWeightRecord), arrival),
+                Coalesce(latest(MortalityRecord), arrival),
+            ))
+            .filter(last_activity__lt=cutoff)
+            .exclude(models.Exists(open_alarm))
+            .select_related('shed')
+            .order_by('pk')
+        )
+
+        critical = float(config.critical_threshold) if config.critical_threshold else None
+        alarms = []
+        for flock in stale:
+            gap = (today - flock.last_activity).days
+            alarms.append(Alarm(
+                alarm_type='NO_RECORDS',
+                description=f'Sin registros en {flock.shed.name} (lote {flock.id}) desde {flock.last_activity}: {gap} días',
+                priority='HIGH' if critical is not None and gap >= critical else 'MEDIUM',
+                farm=farm,
+                flock=flock,
+                shed=flock.shed,
+                configuration=config,
+                source_type='no_records',
+                source_date=flock.last_activity,
+                source_id=flock.id,
+            ))
+
+        AlarmEvaluationEngine._bulk_create_alarms(alarms)
+        AlarmNotificationService.dispatch(alarms)
+        return len(alarms)
 
     @staticmethod
     def _evaluate_stock_alarms(farm: Farm, config: AlarmConfiguration):
         """Evaluate inventory items for low/critical stock and create alarms.
-        
-        Behavior:
-        - Check all inventory items for the farm
-        - Create alarms for items with CRITICAL or LOW stock status
-        - Update existing unresolved alarms if status changed
-        - Set priority based on stock status (CRITICAL = HIGH, LOW = MEDIUM)
-        
+
+        Delegates to StockAlarmService, which filters OUT_OF_STOCK/CRITICAL/LOW items
+        in SQL, updates or auto-resolves the open alarms and bulk-creates the new ones
+        (priority URGENT/HIGH/MEDIUM respectively).
+
         Returns number of alarms created.
         """
-        from apps.inventory.models import InventoryItem
-        created = 0
-        
-        # Batch: load all inventory items with related data in one query
-        inventory_items = InventoryItem.objects.filter(farm=farm).select_related('farm', 'shed')
-        
-        if not inventory_items.exists():
-            return 0
-        
-        # Batch: load all existing unresolved STOCK alarms for this farm in one query
-        existing_alarms = {}
-        for alarm in Alarm.objects.filter(
-            alarm_type='STOCK',
-            farm=farm,
-            status__in=['PENDING', 'ESCALATED']
-        ).select_related('inventory_item'):
-            if alarm.inventory_item_id:
-                existing_alarms[alarm.inventory_item_id] = alarm
-        
-        for item in inventory_items:
-            try:
-                status_info = item.stock_status
-                status = status_info['status']
-                
-                # Use pre-fetched existing alarm instead of per-item query
-                existing_alarm = existing_alarms.get(item.id)
-                
-                # Si el estado es normal y hay alarma existente, resolverla
-                if status not in ['CRITICAL', 'LOW', 'OUT_OF_STOCK']:
-                    if existing_alarm:
-                        existing_alarm.status = 'RESOLVED'
-                        existing_alarm.save(update_fields=['status'])
-                        logger.info(f"Auto-resolved STOCK alarm for {item.name} - status is now {status}")
-                    continue
-                
-                # Si ya existe una alarma pendiente, actualizarla
-                if existing_alarm:
-                    # Actualizar descripción y prioridad si cambiaron
-                    if status == 'OUT_OF_STOCK':
-                        new_priority = 'URGENT'
-                        new_description = f'Stock agotado: {item.name} en {item.location_display}'
-                    elif status == 'CRITICAL':
-                        new_priority = 'HIGH'
-                        new_description = f'Stock crítico: {item.name} en {item.location_display} - {status_info["message"]}'
-                    else:  # LOW
-                        new_priority = 'MEDIUM'
-                        new_description = f'Stock bajo: {item.name} en {item.location_display} - {status_info["message"]}'
-                    
-                    if existing_alarm.description != new_description or existing_alarm.priority != new_priority:
-                        existing_alarm.description = new_description
-                        existing_alarm.priority = new_priority
-                        existing_alarm.source_date = timezone.now().date()
-                        existing_alarm.save(update_fields=['description', 'priority', 'source_date'])
-                        logger.info(f"Updated existing STOCK alarm for {item.name}")
-                    continue
-                
-                # Crear nueva alarma
-                if status == 'OUT_OF_STOCK':
-                    priority = 'URGENT'
-                    description = f'Stock agotado: {item.name} en {item.location_display}'
-                elif status == 'CRITICAL':
-                    priority = 'HIGH'
-                    description = f'Stock crítico: {item.name} en {item.location_display} - {status_info["message"]}'
-                else:  # LOW
-                    priority = 'MEDIUM'
-                    description = f'Stock bajo: {item.name} en {item.location_display} - {status_info["message"]}'
-                
-                alarm = Alarm.objects.create(
-                    alarm_type='STOCK',
-                    description=description,
-                    priority=priority,
-                    farm=farm,
-                    inventory_item=item,
-                    configuration=config,
-                    source_type='inventory',
-                    source_date=timezone.now().date(),
-                    source_id=item.id,
-                )
-                
-                created += 1
-                logger.info(f"Created new STOCK alarm for {item.name}")
-                
-                try:
-                    AlarmNotificationService.send_alarm_notifications(alarm, config)
-                except Exception:
-                    logger.exception('Failed sending notifications for alarm %s', alarm.id)
-                    
-            except Exception:
-                logger.exception('Error evaluating inventory item %s', item.id)
-        
-        return created
+        from apps.inventory.services import StockAlarmService
+
+        return StockAlarmService.evaluate(config=config)['alarms_created']
 
 
 class AlarmNotificationService:
     @staticmethod
-    def send_alarm_notifications(alarm: Alarm, config: AlarmConfiguration):
-        from .notifications import get_default_adapter
+    def dispatch(alarms):
+        """Queue the notifications of newly created alarms in the outbox.
 
-        adapter = get_default_adapter()
-        recipients = config.get_notification_recipients()
-        results = []
-        for r in recipients:
-            try:
-                res = adapter.send(alarm, r)
-                results.append(res)
-            except Exception:
-                logger.exception('Adapter failed for recipient %s', getattr(r, 'id', r))
+        Rows are written inside the caller's transaction and delivered by
+        deliver_notifications_task after commit, so evaluation never waits on
+        adapters and a broker outage only delays delivery.
+        """
+        from .outbox import NotificationOutboxService
+
+        return NotificationOutboxService.enqueue_alarms(alarms)
+
+    @staticmethod
+    def send_alarm_notifications(alarm: Alarm, config: AlarmConfiguration):
+        from .outbox import NotificationOutboxService
 
-        return results
+        return NotificationOutboxService.enqueue((alarm, r) for r in config.get_notification_recipients())
 
     @staticmethod
     def send_direct_notification(alarm: Alarm, recipient, adapter_name=None):
@@ -275,6 +355,9 @@ class AlarmNotificationService:
         except Exception:
             logger.exception('Direct send failed')
             return {'status': 'error'}
+        finally:
+            if hasattr(adapter, 'close'):
+                adapter.close()
 
 
 # re-export escalation service for tasks import
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery
+
+from .models import AlarmStreak
+
+
+class StreakTracker:
+    """Rachas de incumplimientos consecutivos de una AlarmConfiguration, persistidas entre corridas.
+
+    Uso:
+    - pending(window) devuelve los registros de la ventana insertados después de la marca de
+      agua de cada lote, anotados con la racha guardada, en la misma consulta
+    - observe() se llama por registro en orden (lote, fecha) y devuelve la racha si alcanza
+      consecutive_occurrences
+    - save() guarda las rachas tocadas con un único upsert
+
+    Solo días de calendario seguidos cuentan como consecutivos: un día sin registro corta la racha.
+    La marca de agua es el id del último registro evaluado, así que los registros sincronizados
+    tarde o con fecha atrasada también se evalúan; si llegan con fecha anterior a la última contada,
+    la racha del lote se recalcula sobre toda la ventana. Un registro editado (mismo id) no se
+    vuelve a evaluar.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.required = max(1, config.consecutive_occurrences)
+        # flock_id -> (racha, última fecha contada, último id evaluado)
+        self._state = {}
+
+    def pending(self, window):
+        """Registros a evaluar en orden (lote, fecha).
+
+        Los registros ya evaluados que se repasan por llegar otros atrasados quedan con replayed=True.
+        """
+        saved = AlarmStreak.objects.filter(configuration=self.config, flock=OuterRef('flock'))
+        records = list(window.annotate(
+            streak_count=Subquery(saved.values('count')[:1]),
+            streak_date=Subquery(saved.values('last_date')[:1]),
+            streak_last_id=Subquery(saved.values('last_record_id')[:1]),
+        ).filter(Q(streak_last_id__isnull=True) | Q(id__gt=F('streak_last_id'))).order_by('flock_id', 'date'))
+
+        late = {r.flock_id: r.streak_last_id for r in records if r.streak_date is not None and r.date <= r.streak_date}
+        if not late:
+            return records
+
+        replay = list(window.filter(flock_id__in=late).order_by('flock_id', 'date'))
+        for record in replay:
+            record.replayed = record.id <= late[record.flock_id]
+        for flock_id, last_id in late.items():
+            self._state[flock_id] = (0, None, last_id)
+        return [r for r in records if r.flock_id not in late] + replay
+
+    def observe(self, record, breached):
+        """Avanzar la racha del lote con un registro; devuelve su largo si corresponde alarmar, si no 0."""
+        flock_id = record.flock_id
+        if flock_id in self._state:
+            count, last_date, last_id = self._state[flock_id]
+        else:
+            count, last_date, last_id = record.streak_count or 0, record.streak_date, 0
+
+        if not breached:
+            count = 0
+        elif last_date is not None and record.date == last_date + timedelta(days=1):
+            count += 1
+        else:
+            count = 1
+
+        self._state[flock_id] = (count, record.date, max(last_id, record.id))
+        return count if count >= self.required else 0
+
+    def save(self):
+        if not self._state:
+            return
+        # MySQL (ON DUPLICATE KEY UPDATE) no acepta columnas de conflicto explícitas
+        target = {'unique_fields': ['configuration', 'flock']} if connection.features.supports_update_conflicts_with_target else {}
+        AlarmStreak.objects.bulk_create(
+            [
+                AlarmStreak(
+                    configuration=self.config, flock_id=flock_id, count=count, last_date=last_date, last_record_id=last_id,
+                )
+                for flock_id, (count, last_date, last_id) in self._state.items()
+            ],
+            update_conflicts=True,
+            update_fields=['count', 'last_date', 'last_record_id', 'updated_at'],
+            **target,
+        )
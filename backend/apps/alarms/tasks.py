@@ -1,10 +1,77 @@
-from celery import shared_task
-from .services import AlarmEvaluationEngine
+from celery import chord, shared_task
+from django.conf import settings
+
+from .services import AlarmEvaluationEngine, _evaluation_mode
 
 
 @shared_task
 def evaluate_all_alarms_task():
-    return AlarmEvaluationEngine.evaluate_all_farms()
+    """Evaluate alarms for every farm with active configurations.
+
+    In 'chord' mode each farm (or farm x alarm type) runs as its own task and
+    aggregate_alarm_evaluations_task combines the results; 'threads' and 'serial'
+    evaluate inside this task.
+    """
+    mode = _evaluation_mode()
+    if mode != 'chord':
+        return AlarmEvaluationEngine.evaluate_all_farms(mode)
+
+    units = AlarmEvaluationEngine.evaluation_units()
+    if not units:
+        return AlarmEvaluationEngine.aggregate([])
+
+    chord(
+        evaluate_farm_alarms_task.s(farm_id, alarm_type) for farm_id, alarm_type in units
+    )(aggregate_alarm_evaluations_task.s())
+    return {'units_dispatched': len(units)}
+
+
+@shared_task
+def evaluate_farm_alarms_task(farm_id, alarm_type=None):
+    return AlarmEvaluationEngine.evaluate_unit(farm_id, alarm_type)
+
+
+@shared_task
+def aggregate_alarm_evaluations_task(results):
+    return AlarmEvaluationEngine.aggregate(results)
+
+
+@shared_task
+def deliver_notifications_task():
+    """Drain the notification outbox in batches."""
+    from .outbox import NotificationOutboxService
+
+    totals = {}
+    while True:
+        res = NotificationOutboxService.drain()
+        for key, value in res.items():
+            totals[key] = totals.get(key, 0) + value
+        if res['claimed'] < getattr(settings, 'ALARM_NOTIFICATION_BATCH_SIZE', 100):
+            return totals
+
+
+@shared_task
+def dispatch_alarm_notifications_task(alarm_ids):
+    """Queue in the outbox the alarms of dispatch messages sent before it existed."""
+    from .models import Alarm
+    from .outbox import NotificationOutboxService
+
+    alarms = Alarm.objects.filter(pk__in=alarm_ids).select_related('configuration__farm__farm_manager')
+    return NotificationOutboxService.enqueue_alarms(alarms)
+
+
+@shared_task
+def evaluate_weight_deviations_task():
+    """Drain the (flock, date) weight deviation queue in batches."""
+    from .weight_deviation import WeightDeviationService
+
+    totals = {'checked': 0, 'alarms_created': 0}
+    while True:
+        res = WeightDeviationService.drain()
+        totals['checked'] += res['checked']
+        totals['alarms_created'] += res['alarms_created']
+        if res['checked'] < WeightDeviationService.DRAIN_BATCH_SIZE:
+            return totals
 
 
 @shared_task
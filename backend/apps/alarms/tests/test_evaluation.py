@@ -1,10 +1,14 @@
+import threading
+
 import pytest
 from django.utils import timezone
 
 from django.contrib.auth import get_user_model
 
 from apps.alarms.services import AlarmEvaluationEngine
-from apps.alarms.models import Alarm, AlarmConfiguration
+from apps.alarms.models import Alarm, AlarmConfiguration, NotificationLog, NotificationOutbox
+from apps.alarms.outbox import NotificationOutboxService
+from apps.alarms.tasks import deliver_notifications_task
 from apps.farms.models import Farm, Shed
 from apps.flocks.models import Flock, MortalityRecord
 
@@ -13,7 +17,7 @@ User = get_user_model()
 
 
 @pytest.mark.django_db
-def test_mortality_threshold_creates_alarm_and_notifies(monkeypatch):
+def test_mortality_threshold_creates_alarm_and_notifies(monkeypatch, django_capture_on_commit_callbacks):
     # create a farm manager user and assign (Farm.farm_manager is required)
     user = User.objects.create(username='fm', email='fm@example.com')
     # Setup farm, shed, flock
@@ -32,25 +36,28 @@ def test_mortality_threshold_creates_alarm_and_notifies(monkeypatch):
         notify_farm_manager=True,
     )
 
-    # monkeypatch notification sending to capture call
-    called = {'count': 0}
-
-    def fake_send(alarm, cfg):
-        called['count'] += 1
-
-    monkeypatch.setattr('apps.alarms.services.AlarmNotificationService.send_alarm_notifications', fake_send)
+    # capture the delivery kick instead of talking to the broker
+    kicks = []
+    monkeypatch.setattr('apps.alarms.tasks.deliver_notifications_task.delay', lambda: kicks.append(1))
 
     # create a mortality record that exceeds threshold
     today = timezone.now().date()
     # deaths such that rate > 1%: 2 deaths on 102 original ~1.96%
     MortalityRecord.objects.create(flock=flock, date=today, deaths=2, recorded_by=user)
 
-    created = AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config)
+    with django_capture_on_commit_callbacks(execute=True):
+        created = AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config)
 
     assert created == 1
     alarm = Alarm.objects.filter(alarm_type='MORTALITY', flock=flock).first()
     assert alarm is not None
-    assert called['count'] == 1
+    assert kicks == [1]
+    assert list(NotificationOutbox.objects.values_list('alarm_id', 'recipient_id')) == [(alarm.id, user.id)]
+
+    summary = NotificationOutboxService.drain()
+    assert (summary['claimed'], summary['sent'], summary['failed']) == (1, 1, 0)
+    assert NotificationLog.objects.filter(alarm=alarm, recipient=user).exists()
+    assert not NotificationOutbox.objects.exists()
 
 
 @pytest.mark.django_db
@@ -110,3 +117,225 @@ def test_priority_high_when_exceeds_critical(monkeypatch):
     alarm = Alarm.objects.filter(alarm_type='MORTALITY', flock=flock).first()
     assert alarm is not None
     assert alarm.priority == 'HIGH'
+
+
+def _stock_farms(count):
+    from apps.inventory.models import InventoryItem
+
+    user = User.objects.create(username='fan', email='fan@example.com')
+    farms = []
+    for i in range(count):
+        farm = Farm.objects.create(name=f'Fan Farm {i}', location='', farm_manager=user)
+        AlarmConfiguration.objects.create(
+            alarm_type='STOCK', farm=farm, threshold_value=0, notify_farm_manager=False, notify_veterinarian=False,
+        )
+        AlarmConfiguration.objects.create(alarm_type='MORTALITY', farm=farm, threshold_value=1.0)
+        InventoryItem.objects.create(name='Inicio', unit='KG', farm=farm, current_stock=0)
+        farms.append(farm)
+    return farms
+
+
+@pytest.mark.django_db
+def test_serial_evaluation_reports_per_farm_timings(settings):
+    farms = _stock_farms(2)
+    settings.ALARM_SLOW_FARM_SECONDS = 0
+
+    result = AlarmEvaluationEngine.evaluate_all_farms('serial')
+
+    assert (result['farms_evaluated'], result['alarms_generated'], result['errors']) == (2, 2, 0)
+    assert set(result['farm_timings_ms']) == {f.id for f in farms}
+    assert result['slow_farms'] == sorted(f.id for f in farms)
+
+    settings.ALARM_EVALUATION_SPLIT_BY_TYPE = True
+    assert AlarmEvaluationEngine.evaluation_units() == [
+        (farms[0].id, 'MORTALITY'), (farms[0].id, 'STOCK'), (farms[1].id, 'MORTALITY'), (farms[1].id, 'STOCK'),
+    ]
+
+
+@pytest.mark.django_db
+def test_thread_pool_evaluation(settings, monkeypatch):
+    farms = _stock_farms(3)
+    settings.ALARM_EVALUATION_WORKERS = 3
+    # The units only finish once all three run at the same time, one per pool thread
+    barrier = threading.Barrier(3, timeout=5)
+    seen = {}
+
+    def fake_unit(farm_id, alarm_type=None):
+        barrier.wait()
+        seen[farm_id] = threading.current_thread().name
+        return {'farm_id': farm_id, 'alarm_type': alarm_type, 'alarms_created': 1, 'errors': int(farm_id == farms[2].id), 'duration_ms': 1.0}
+
+    # No database work in the threads: the test database is not shared across connections
+    monkeypatch.setattr(AlarmEvaluationEngine, 'evaluate_unit', staticmethod(fake_unit))
+
+    result = AlarmEvaluationEngine.evaluate_all_farms('threads')
+
+    assert sorted(seen) == [farm.id for farm in farms]
+    assert len(set(seen.values())) == 3
+    assert all(name.startswith('alarm-eval') for name in seen.values())
+    assert (result['farms_evaluated'], result['alarms_generated'], result['errors']) == (3, 3, 1)
+    assert result['farm_timings_ms'] == {farm.id: 1.0 for farm in farms}
+
+
+@pytest.mark.django_db
+def test_chord_fans_out_one_task_per_farm(settings, monkeypatch):
+    from apps.alarms import tasks
+
+    farms = _stock_farms(2)
+    settings.ALARM_EVALUATION_MODE = 'chord'
+    dispatched = {}
+
+    def fake_chord(header):
+        dispatched['header'] = list(header)
+        return lambda callback: dispatched.setdefault('callback', callback)
+
+    monkeypatch.setattr(tasks, 'chord', fake_chord)
+
+    assert tasks.evaluate_all_alarms_task() == {'units_dispatched': 2}
+    assert [sig.args for sig in dispatched['header']] == [(farms[0].id, None), (farms[1].id, None)]
+
+    results = [sig.apply().get() for sig in dispatched['header']]
+    summary = dispatched['callback'].apply(args=(results,)).get()
+    assert (summary['farms_evaluated'], summary['alarms_generated']) == (2, 2)
+
+
+@pytest.mark.django_db
+def test_outbreak_alarms_are_bulk_created(monkeypatch, django_assert_max_num_queries, django_capture_on_commit_callbacks, settings):
+    user = User.objects.create(username='out', email='out@example.com')
+    farm = Farm.objects.create(name='Outbreak Farm', location='', farm_manager=user)
+    config = AlarmConfiguration.objects.create(alarm_type='MORTALITY', farm=farm, threshold_value=1.0)
+    today = timezone.now().date()
+    for i in range(12):
+        shed = Shed.objects.create(name=f'Shed O{i}', farm=farm, capacity=100)
+        flock = Flock.objects.create(arrival_date=today, initial_quantity=100, current_quantity=100, initial_weight=40, breed='B', gender='X', supplier='S', shed=shed)
+        MortalityRecord.objects.create(flock=flock, date=today, deaths=5, recorded_by=user)
+
+    settings.ALARM_NOTIFICATION_BATCH_SIZE = 5
+    kicks = []
+    monkeypatch.setattr('apps.alarms.tasks.deliver_notifications_task.delay', lambda: kicks.append(1))
+
+    # records, open alarms, then in one savepoint: alarm insert, streak upsert, vets, outbox insert
+    with django_capture_on_commit_callbacks(execute=True):
+        with django_assert_max_num_queries(8):
+            created = AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config)
+
+    assert created == 12
+    assert kicks == [1]
+    assert NotificationOutbox.objects.filter(recipient=user).count() == 12
+    assert deliver_notifications_task() == {'claimed': 12, 'sent': 12, 'skipped': 0, 'coalesced': 0, 'retried': 0, 'failed': 0}
+    assert AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config) == 0
+
+
+@pytest.mark.django_db
+def test_consecutive_occurrences_streak_with_watermark(monkeypatch, django_assert_max_num_queries):
+    from datetime import timedelta
+    from apps.alarms.models import AlarmStreak
+
+    user = User.objects.create(username='st', email='st@example.com')
+    farm = Farm.objects.create(name='Streak Farm', location='', farm_manager=user)
+    shed = Shed.objects.create(name='Shed S', farm=farm, capacity=1000)
+    flock = Flock.objects.create(arrival_date=timezone.now().date(), initial_quantity=1000, current_quantity=1000, initial_weight=40, breed='B', gender='X', supplier='S', shed=shed)
+    config = AlarmConfiguration.objects.create(alarm_type='MORTALITY', farm=farm, threshold_value=1.0, consecutive_occurrences=3, evaluation_period_hours=24 * 10)
+    monkeypatch.setattr('apps.alarms.services.AlarmNotificationService.dispatch', lambda alarms: None)
+    today = timezone.now().date()
+
+    def day(offset, deaths):
+        return MortalityRecord.objects.create(flock=flock, date=today - timedelta(days=offset), deaths=deaths, recorded_by=user)
+
+    # breach, calm, breach, breach: the streak is reset and only reaches 2
+    for offset, deaths in [(6, 20), (5, 0), (4, 20), (3, 20)]:
+        day(offset, deaths)
+    assert AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config) == 0
+    streak = AlarmStreak.objects.get(configuration=config, flock=flock)
+    assert (streak.count, streak.last_date) == (2, today - timedelta(days=3))
+
+    # only the new record is read; the third consecutive breach raises the alarm
+    # (records, open alarms, savepoint, alarm insert, streak upsert, release)
+    third = day(2, 20)
+    with django_assert_max_num_queries(6):
+        assert AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config) == 1
+    alarm = Alarm.objects.get(alarm_type='MORTALITY')
+    assert alarm.source_id == third.id
+    assert alarm.description.endswith('3 días consecutivos')
+
+    # nothing new: nothing to evaluate
+    assert AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config) == 0
+
+    # a missing day breaks the streak
+    day(0, 20)
+    assert AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config) == 0
+    assert AlarmStreak.objects.get(configuration=config, flock=flock).count == 1
+
+
+@pytest.mark.django_db
+def test_late_synced_breach_replays_the_window(monkeypatch):
+    from datetime import timedelta
+    from apps.alarms.models import AlarmStreak
+
+    user = User.objects.create(username='late', email='late@example.com')
+    farm = Farm.objects.create(name='Late Farm', location='', farm_manager=user)
+    shed = Shed.objects.create(name='Shed L', farm=farm, capacity=1000)
+    flock = Flock.objects.create(arrival_date=timezone.now().date(), initial_quantity=1000, current_quantity=1000, initial_weight=40, breed='B', gender='X', supplier='S', shed=shed)
+    config = AlarmConfiguration.objects.create(alarm_type='MORTALITY', farm=farm, threshold_value=1.0, consecutive_occurrences=2, evaluation_period_hours=24 * 10)
+    monkeypatch.setattr('apps.alarms.services.AlarmNotificationService.dispatch', lambda alarms: None)
+    today = timezone.now().date()
+
+    def day(offset):
+        return MortalityRecord.objects.create(flock=flock, date=today - timedelta(days=offset), deaths=20, recorded_by=user)
+
+    # breaches two days apart: no streak yet
+    day(3)
+    last = day(1)
+    assert AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config) == 0
+
+    # the missing day arrives from an offline device, dated before the watermark
+    middle = day(2)
+    assert AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config) == 2
+    assert set(Alarm.objects.values_list('source_id', flat=True)) == {middle.id, last.id}
+    streak = AlarmStreak.objects.get(configuration=config, flock=flock)
+    assert (streak.count, streak.last_date, streak.last_record_id) == (3, today - timedelta(days=1), middle.id)
+
+    # a resolved alarm is not reopened when another late record replays the window
+    Alarm.objects.filter(source_id=last.id).update(status='RESOLVED')
+    day(5)
+    assert AlarmEvaluationEngine._evaluate_mortality_alarms(farm, config) == 0
+
+
+@pytest.mark.django_db
+def test_no_records_alarms_for_stale_flocks(monkeypatch, django_assert_max_num_queries):
+    from datetime import timedelta
+    from apps.flocks.models import DailyRecord
+
+    user = User.objects.create(username='nr', email='nr@example.com')
+    farm = Farm.objects.create(name='Quiet Farm', location='', farm_manager=user)
+    today = timezone.now().date()
+
+    def flock(name, arrived_days_ago):
+        shed = Shed.objects.create(name=name, farm=farm, capacity=100)
+        return Flock.objects.create(
+            arrival_date=today - timedelta(days=arrived_days_ago), initial_quantity=50, current_quantity=50,
+            initial_weight=40, breed='B', gender='X', supplier='S', shed=shed,
+        )
+
+    active = flock('Activo', 20)
+    DailyRecord.objects.create(flock=active, date=today - timedelta(days=1), recorded_by=user)
+    stale = flock('Atrasado', 20)
+    MortalityRecord.objects.create(flock=stale, date=today - timedelta(days=4), deaths=1, recorded_by=user)
+    flock('Recien llegado', 1)
+    silent = flock('Sin datos', 10)
+
+    config = AlarmConfiguration.objects.create(
+        alarm_type='NO_RECORDS', farm=farm, threshold_value=0, critical_threshold=7, evaluation_period_hours=48,
+    )
+    monkeypatch.setattr('apps.alarms.services.AlarmNotificationService.dispatch', lambda alarms: None)
+
+    with django_assert_max_num_queries(2):
+        created = AlarmEvaluationEngine._evaluate_missing_records_alarms(farm, config)
+
+    assert created == 2
+    alarms = {a.flock_id: a for a in Alarm.objects.filter(alarm_type='NO_RECORDS')}
+    assert set(alarms) == {stale.id, silent.id}
+    assert (alarms[stale.id].priority, alarms[stale.id].source_date) == ('MEDIUM', today - timedelta(days=4))
+    assert alarms[silent.id].priority == 'HIGH'
+
+    assert AlarmEvaluationEngine._evaluate_missing_records_alarms(farm, config) == 0
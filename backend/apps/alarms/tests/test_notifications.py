@@ -24,3 +24,59 @@ def test_local_fallback_writes_log():
 
     assert res['status'] == 'sent'
     assert NotificationLog.objects.filter(alarm=alarm, recipient=user).exists()
+
+
+@pytest.fixture
+def email_alarms(settings, monkeypatch):
+    from apps.alarms import notifications
+
+    settings.DEFAULT_FROM_EMAIL = 'alarmas@example.com'
+    opened = []
+    get_connection = notifications.get_connection
+
+    def counting_connection(*args, **kwargs):
+        opened.append(1)
+        return get_connection(*args, **kwargs)
+
+    monkeypatch.setattr(notifications, 'get_connection', counting_connection)
+
+    manager = User.objects.create(username='em1', email='m@example.com', identification='em-1')
+    vet = User.objects.create(username='em2', email='v@example.com', identification='em-2')
+    farm = Farm.objects.create(name='EFarm', location='', farm_manager=manager)
+    alarms = [
+        Alarm.objects.create(alarm_type='MORTALITY', description=f'Mortalidad {i}', priority='HIGH', farm=farm)
+        for i in range(3)
+    ]
+    return opened, manager, vet, alarms
+
+
+@pytest.mark.django_db
+def test_email_outbox_cycle_reuses_one_connection(email_alarms, mailoutbox):
+    from apps.alarms.outbox import NotificationOutboxService
+
+    opened, manager, vet, alarms = email_alarms
+    NotificationOutboxService.enqueue([(a, u) for a in alarms for u in (manager, vet)], channel='email')
+
+    assert NotificationOutboxService.drain()['sent'] == 6
+    assert len(mailoutbox) == 6
+    assert opened == [1]
+    assert NotificationLog.objects.filter(notification_type='EMAIL', status='SENT').count() == 6
+
+
+@pytest.mark.django_db
+def test_email_digest_merges_alarms_per_recipient(email_alarms, mailoutbox, settings):
+    from apps.alarms.notifications import EmailAdapter
+
+    settings.ALARMS_EMAIL_DIGEST = True
+    opened, manager, vet, alarms = email_alarms
+    adapter = EmailAdapter()
+    results = adapter.send_many(alarms, manager) + adapter.send_many(alarms[:1], vet)
+    adapter.close()
+
+    assert [r['status'] for r in results] == ['sent'] * 4
+    assert [(m.subject, m.to) for m in mailoutbox] == [
+        ('Alarmas: 3 nuevas', ['m@example.com']),
+        ('Alarma: MORTALITY [HIGH]', ['v@example.com']),
+    ]
+    assert 'Mortalidad 2' in mailoutbox[0].body
+    assert opened == [1]
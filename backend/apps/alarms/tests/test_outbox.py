@@ -0,0 +1,100 @@
+import pytest
+from datetime import timedelta
+
+from django.utils import timezone
+
+from apps.alarms.models import Alarm, NotificationLog, NotificationOutbox
+from apps.alarms.outbox import NotificationOutboxService
+from apps.farms.models import Farm
+from apps.users.models import User
+
+
+@pytest.fixture
+def alarms():
+    user = User.objects.create(username='ob', email='ob@example.com', identification='ob-1')
+    farm = Farm.objects.create(name='OB Farm', location='', farm_manager=user)
+    created = [
+        Alarm.objects.create(alarm_type='MORTALITY', description=f'a{i}', priority='MEDIUM', farm=farm)
+        for i in range(2)
+    ]
+    return user, created
+
+
+@pytest.mark.django_db
+def test_duplicates_are_coalesced_and_logged_in_bulk(alarms, django_assert_max_num_queries):
+    user, (first, second) = alarms
+    assert NotificationOutboxService.enqueue([(first, user), (first, user), (second.pk, user.pk)]) == 2
+    NotificationOutboxService.enqueue([(first, user)])
+
+    # claim (savepoint, select with alarm and recipient, lease update, release), one send_many
+    # insert, then the result write (savepoint, delete, release)
+    with django_assert_max_num_queries(8):
+        summary = NotificationOutboxService.drain()
+
+    assert (summary['claimed'], summary['sent'], summary['coalesced']) == (3, 2, 1)
+    assert NotificationLog.objects.filter(recipient=user).count() == 2
+    assert not NotificationOutbox.objects.exists()
+
+
+@pytest.mark.django_db
+def test_failed_delivery_backs_off_then_gives_up(alarms, settings, monkeypatch):
+    user, (first, _) = alarms
+    settings.ALARM_NOTIFICATION_MAX_ATTEMPTS = 2
+    settings.ALARM_NOTIFICATION_BACKOFF_SECONDS = 60
+
+    def boom(self, alarms, recipient, payload=None):
+        raise ConnectionError('push gateway down')
+
+    monkeypatch.setattr('apps.alarms.notifications.LocalFallbackAdapter.send_many', boom)
+    NotificationOutboxService.enqueue([(first, user)])
+
+    assert NotificationOutboxService.drain()['retried'] == 1
+    row = NotificationOutbox.objects.get()
+    assert (row.attempts, row.status, row.last_error) == (1, 'PENDING', 'push gateway down')
+    assert row.available_at > timezone.now() + timedelta(seconds=50)
+
+    # not due yet
+    assert NotificationOutboxService.drain()['claimed'] == 0
+
+    NotificationOutbox.objects.update(available_at=timezone.now())
+    assert NotificationOutboxService.drain()['failed'] == 1
+    assert NotificationOutbox.objects.get().status == 'FAILED'
+    log = NotificationLog.objects.get()
+    assert (log.status, log.error_message) == ('ERROR', 'push gateway down')
+
+
+@pytest.mark.django_db
+def test_email_channel_logs_results(alarms, settings, mailoutbox):
+    user, (first, second) = alarms
+    settings.DEFAULT_FROM_EMAIL = 'alarmas@example.com'
+    NotificationOutboxService.enqueue([(first, user)], channel='email')
+    NotificationOutboxService.enqueue([(second, user)], channel='email', payload={'title': 'Conflicto'})
+
+    assert NotificationOutboxService.drain()['sent'] == 2
+    assert len(mailoutbox) == 2
+    assert set(NotificationLog.objects.values_list('notification_type', 'status')) == {('EMAIL', 'SENT')}
+
+
+@pytest.mark.django_db
+def test_worker_crash_leaves_rows_leased_not_lost(alarms, settings, monkeypatch):
+    user, (first, _) = alarms
+    settings.ALARM_NOTIFICATION_LEASE_SECONDS = 300
+
+    def crash(self, alarms, recipient, payload=None):
+        raise SystemExit('worker killed')
+
+    monkeypatch.setattr('apps.alarms.notifications.LocalFallbackAdapter.send_many', crash)
+    NotificationOutboxService.enqueue([(first, user)])
+    with pytest.raises(SystemExit):
+        NotificationOutboxService.drain()
+
+    # the claim was committed before sending: another worker skips the row until the lease expires
+    row = NotificationOutbox.objects.get()
+    assert (row.attempts, row.status) == (0, 'PENDING')
+    assert row.available_at > timezone.now() + timedelta(seconds=250)
+    assert NotificationOutboxService.drain()['claimed'] == 0
+
+    monkeypatch.undo()
+    NotificationOutbox.objects.update(available_at=timezone.now())
+    assert NotificationOutboxService.drain()['sent'] == 1
+    assert not NotificationOutbox.objects.exists()
@@ -0,0 +1,64 @@
+import pytest
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+
+from apps.alarms.models import Alarm, AlarmConfiguration, WeightDeviationCheck
+from apps.alarms.tasks import evaluate_weight_deviations_task
+from apps.farms.models import Farm, Shed
+from apps.flocks.breed_curves import breed_curve_cache
+from apps.flocks.models import Flock, BreedReference, DailyWeightRecord
+
+User = get_user_model()
+
+
+@pytest.fixture
+def setup_farm():
+    breed_curve_cache.invalidate()
+    BreedReference.objects.create(breed='Ross', age_days=7, expected_weight=200, tolerance_range=10)
+    BreedReference.objects.create(breed='Ross', age_days=14, expected_weight=400, tolerance_range=10)
+
+    user = User.objects.create(username='fm', email='fm@example.com', identification='wd-1')
+    farm = Farm.objects.create(name='WD Farm', location='', farm_manager=user)
+    shed = Shed.objects.create(name='Shed W', farm=farm, capacity=1000)
+    arrival = date(2026, 4, 1)
+    flock = Flock.objects.create(arrival_date=arrival, initial_quantity=100, current_quantity=100, initial_weight=40, breed='Ross', gender='X', supplier='s', shed=shed)
+    return user, farm, flock, arrival
+
+
+@pytest.mark.django_db
+def test_save_only_enqueues_and_task_creates_deduped_alarms(setup_farm):
+    user, farm, flock, arrival = setup_farm
+    config = AlarmConfiguration.objects.create(alarm_type='WEIGHT_DEVIATION', farm=farm, threshold_value=10, is_active=True)
+
+    # Día 7: 30% bajo el esperado (HIGH); día 10: interpolado 285.7g, 5% (sin alarma); día 14: 15% (MEDIUM)
+    for day, weight in [(7, 140), (10, 300), (14, 460)]:
+        DailyWeightRecord.objects.create(flock=flock, date=arrival + timedelta(days=day), average_weight=weight, recorded_by=user)
+    record = DailyWeightRecord.objects.get(flock=flock, date=arrival + timedelta(days=7))
+    record.average_weight = 150
+    record.save()
+
+    assert Alarm.objects.count() == 0
+    assert WeightDeviationCheck.objects.count() == 3
+
+    res = evaluate_weight_deviations_task()
+
+    assert res == {'checked': 3, 'alarms_created': 2}
+    assert WeightDeviationCheck.objects.count() == 0
+    alarms = {a.source_date: a for a in Alarm.objects.filter(alarm_type='WEIGHT_DEVIATION')}
+    assert alarms[arrival + timedelta(days=7)].priority == 'HIGH'
+    assert alarms[arrival + timedelta(days=14)].priority == 'MEDIUM'
+    assert all(a.configuration == config and a.flock == flock and a.source_type == 'daily_weight' for a in alarms.values())
+
+    # Re-encolar el mismo día no duplica la alarma pendiente
+    record.save()
+    assert evaluate_weight_deviations_task() == {'checked': 1, 'alarms_created': 0}
+
+
+@pytest.mark.django_db
+def test_farm_without_config_drains_without_alarms(setup_farm):
+    user, farm, flock, arrival = setup_farm
+    DailyWeightRecord.objects.create(flock=flock, date=arrival + timedelta(days=7), average_weight=100, recorded_by=user)
+
+    assert evaluate_weight_deviations_task() == {'checked': 1, 'alarms_created': 0}
+    assert not Alarm.objects.exists()
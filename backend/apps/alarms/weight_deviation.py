@@ -0,0 +1,129 @@
+import logging
+from collections import defaultdict
+
+import numpy as np
+from django.db import connection, transaction
+
+from .models import Alarm, AlarmConfiguration, WeightDeviationCheck
+
+logger = logging.getLogger(__name__)
+
+
+class WeightDeviationService:
+    """Evaluación diferida de desviaciones de peso contra las curvas de BreedReference."""
+
+    DRAIN_BATCH_SIZE = 2000
+
+    @staticmethod
+    def enqueue(keys):
+        """Encolar pares (flock_id, date); los repetidos se descartan por la restricción única."""
+        checks = [WeightDeviationCheck(flock_id=flock_id, date=date) for flock_id, date in set(keys)]
+        if checks:
+            WeightDeviationCheck.objects.bulk_create(checks, ignore_conflicts=True)
+
+    @staticmethod
+    def drain(limit=None):
+        """Tomar un lote de la cola, evaluarlo por granja y crear las alarmas con bulk_create.
+
+        Returns a dict with counts.
+        """
+        limit = limit or WeightDeviationService.DRAIN_BATCH_SIZE
+        with transaction.atomic():
+            queue = WeightDeviationCheck.objects.order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                queue = queue.select_for_update(skip_locked=True)
+            claimed = list(queue.values_list('id', 'flock_id', 'date')[:limit])
+            if not claimed:
+                return {'checked': 0, 'alarms_created': 0}
+
+            WeightDeviationCheck.objects.filter(id__in=[c[0] for c in claimed]).delete()
+            alarms = WeightDeviationService._evaluate({(flock_id, date) for _, flock_id, date in claimed})
+            Alarm.objects.bulk_create(alarms)
+
+        return {'checked': len(claimed), 'alarms_created': len(alarms)}
+
+    @staticmethod
+    def _evaluate(keys):
+        from apps.flocks.models import DailyWeightRecord
+        from apps.flocks.breed_curves import breed_curve_cache
+
+        rows = [
+            r for r in DailyWeightRecord.objects.filter(
+                flock_id__in={k[0] for k in keys},
+                date__in={k[1] for k in keys},
+            ).values(
+                'id', 'flock_id', 'date', 'average_weight', 'expected_weight',
+                'flock__breed', 'flock__arrival_date', 'flock__shed_id', 'flock__shed__name', 'flock__shed__farm_id',
+            )
+            if (r['flock_id'], r['date']) in keys
+        ]
+        if not rows:
+            return []
+
+        by_farm = defaultdict(list)
+        for r in rows:
+            by_farm[r['flock__shed__farm_id']].append(r)
+
+        configs = {
+            c.farm_id: c for c in AlarmConfiguration.objects.filter(
+                alarm_type='WEIGHT_DEVIATION', farm_id__in=by_farm.keys(), is_active=True,
+            )
+        }
+        already_alarmed = set(
+            Alarm.objects.filter(
+                alarm_type='WEIGHT_DEVIATION',
+                source_type='daily_weight',
+                flock_id__in={r['flock_id'] for r in rows},
+                source_date__in={r['date'] for r in rows},
+            ).exclude(status='RESOLVED').values_list('flock_id', 'source_date')
+        )
+
+        alarms = []
+        for farm_id, farm_rows in by_farm.items():
+            config = configs.get(farm_id)
+            if config is None:
+                continue
+            farm_rows = [r for r in farm_rows if (r['flock_id'], r['date']) not in already_alarmed]
+            if not farm_rows:
+                continue
+
+            ages = np.array([(r['date'] - r['flock__arrival_date']).days for r in farm_rows])
+            actual = np.array([float(r['average_weight']) for r in farm_rows])
+            stored = np.array([float(r['expected_weight'] or 'nan') for r in farm_rows])
+            curve_expected = np.full(len(farm_rows), np.nan)
+            tolerance = np.full(len(farm_rows), np.nan)
+
+            breeds = np.array([r['flock__breed'] for r in farm_rows])
+            for breed in set(breeds):
+                curve = breed_curve_cache.get_curve(breed)
+                if curve is None:
+                    continue
+                mask = breeds == breed
+                curve_expected[mask] = curve.weights_for(ages[mask])
+                tolerance[mask] = curve.tolerance_for(ages[mask])
+
+            expected = np.where(stored > 0, stored, curve_expected)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                deviation = np.abs(actual - expected) / expected * 100
+            offending = np.flatnonzero(np.nan_to_num(deviation) > np.nan_to_num(tolerance, nan=np.inf))
+
+            for i in offending:
+                r = farm_rows[i]
+                alarms.append(Alarm(
+                    alarm_type='WEIGHT_DEVIATION',
+                    description=(
+                        f'Peso fuera de rango en {r["flock__shed__name"]} - {r["date"]}: '
+                        f'{actual[i]:.1f}g vs esperado {expected[i]:.1f}g. '
+                        f'Desviación: {deviation[i]:.1f}% (tolerancia: {tolerance[i]:.1f}%)'
+                    ),
+                    priority='HIGH' if deviation[i] > tolerance[i] * 2 else 'MEDIUM',
+                    farm_id=farm_id,
+                    flock_id=r['flock_id'],
+                    shed_id=r['flock__shed_id'],
+                    configuration=config,
+                    source_type='daily_weight',
+                    source_date=r['date'],
+                    source_id=r['id'],
+                ))
+
+        return alarms
@@ -0,0 +1,44 @@
+"""
+Management command to verify or rebuild the Shed.occupancy counter from the
+current_quantity of the active flocks in each shed.
+
+Usage:
+    python manage.py rebuild_shed_occupancy
+    python manage.py rebuild_shed_occupancy --verify
+    python manage.py rebuild_shed_occupancy --shed 3 --shed 7
+"""
+from django.core.management.base import BaseCommand
+
+from apps.farms.services import ShedOccupancyService
+
+
+class Command(BaseCommand):
+    help = 'Verify the shed occupancy counters against active flocks and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shed',
+            type=int,
+            action='append',
+            dest='sheds',
+            help='Shed id to check (repeatable). Defaults to every shed',
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report drifted sheds, do not write',
+        )
+
+    def handle(self, *args, **options):
+        summary = ShedOccupancyService.rebuild(options['sheds'], fix=not options['verify'])
+
+        if options['verify']:
+            style = self.style.WARNING if summary['drifted'] else self.style.SUCCESS
+            self.stdout.write(style(
+                f"Checked {summary['sheds_checked']} sheds, {len(summary['drifted'])} drifted: {summary['drifted']}"
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {summary['sheds_checked']} sheds, fixed {summary['sheds_fixed']}"
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:41
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_occupancy(apps, schema_editor):
+    """Initialize the counter from the active flocks of each shed."""
+    Shed = apps.get_model('farms', 'Shed')
+    Flock = apps.get_model('flocks', 'Flock')
+
+    totals = Flock.objects.filter(status='ACTIVE').values('shed_id').annotate(total=Sum('current_quantity'))
+    sheds = []
+    for row in totals:
+        sheds.append(Shed(pk=row['shed_id'], occupancy=row['total'] or 0))
+    Shed.objects.bulk_update(sheds, ['occupancy'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farms', '0005_alter_farm_farm_manager'),
+        ('flocks', '0012_flockmovement_opening_balances'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shed',
+            name='occupancy',
+            field=models.PositiveIntegerField(default=0, help_text='Aves en lotes activos'),
+        ),
+        migrations.RunPython(fill_occupancy, migrations.RunPython.noop),
+    ]
@@ -54,6 +54,9 @@ class Shed(BaseModel):
 	capacity = models.PositiveIntegerField()
 	farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='sheds')
 
+	# Aves en lotes activos; lo mantiene ShedOccupancyService junto con los contadores del lote
+	occupancy = models.PositiveIntegerField(default=0, help_text="Aves en lotes activos")
+
 	# Un galponero por galpón (puede tener múltiples galpones)
 	assigned_worker = models.ForeignKey(
 		settings.AUTH_USER_MODEL,
@@ -73,9 +76,8 @@ class Shed(BaseModel):
 
 	@property
 	def current_occupancy(self):
-		"""Ocupación actual calculada en tiempo real"""
-		active_flocks = self.sheds_related_flocks() if False else self.flocks.filter(status='ACTIVE')
-		return sum(getattr(flock, 'current_quantity', 0) for flock in active_flocks)
+		"""Ocupación actual (contador mantenido; ver rebuild_shed_occupancy)"""
+		return self.occupancy
 
 	def sheds_related_flocks(self):
 		# helper placeholder - kept for compatibility if needed
@@ -1,6 +1,13 @@
+from collections import defaultdict
+
 from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
 import logging
 
+from .models import Shed
+
 logger = logging.getLogger(__name__)
 
 
@@ -43,3 +50,67 @@ class ShedCapacityService:
             })
 
         return report
+
+
+class ShedOccupancyService:
+    """Contador Shed.occupancy: suma de current_quantity de los lotes activos del galpón.
+
+    Se ajusta con deltas basados en F() dentro de la misma transacción que cambia el
+    lote (creación, estado, galpón o cantidad), así que leer la ocupación es leer una
+    columna. rebuild() lo recalcula desde los lotes para detectar y corregir desvíos.
+    """
+
+    @staticmethod
+    def contribution(status, quantity):
+        """Aves que un lote aporta a la ocupación de su galpón."""
+        return (quantity or 0) if status == 'ACTIVE' else 0
+
+    @staticmethod
+    def adjust(deltas):
+        """Aplicar {shed_id: delta} en orden de id para evitar deadlocks entre galpones."""
+        for shed_id in sorted(deltas):
+            delta = deltas[shed_id]
+            if delta:
+                Shed.objects.filter(pk=shed_id).update(occupancy=Greatest(F('occupancy') + delta, Value(0)))
+
+    @staticmethod
+    def record_change(before, after):
+        """Ajustar por el cambio de un lote; before/after son (shed_id, status, current_quantity) o None."""
+        deltas = defaultdict(int)
+        if before:
+            deltas[before[0]] -= ShedOccupancyService.contribution(*before[1:])
+        if after:
+            deltas[after[0]] += ShedOccupancyService.contribution(*after[1:])
+        ShedOccupancyService.adjust(deltas)
+
+    @staticmethod
+    def rebuild(shed_ids=None, fix=True):
+        """Comparar el contador con la suma real de los lotes activos y corregir los que difieran.
+
+        Con fix=False solo informa. Returns a dict with counts and the drifted shed ids.
+        """
+        from apps.flocks.models import Flock
+        from apps.flocks.services_dashboard import ShedDashboardService
+
+        active_total = Flock.objects.filter(shed=OuterRef('pk'), status='ACTIVE').values('shed').annotate(
+            total=Sum('current_quantity')
+        ).values('total')
+        expected = Coalesce(Subquery(active_total), Value(0))
+
+        sheds = Shed.objects.all()
+        if shed_ids:
+            sheds = sheds.filter(pk__in=shed_ids)
+
+        drifted = [
+            shed_id for shed_id, stored, actual in sheds.annotate(actual=expected).values_list('pk', 'occupancy', 'actual')
+            if stored != actual
+        ]
+
+        if drifted and fix:
+            with transaction.atomic():
+                # Bloquear los galpones y recalcular en el mismo UPDATE
+                list(Shed.objects.select_for_update().filter(pk__in=drifted).order_by('pk').values_list('pk'))
+                Shed.objects.filter(pk__in=drifted).update(occupancy=expected)
+            ShedDashboardService.invalidate_on_commit(drifted)
+
+        return {'sheds_checked': sheds.count(), 'sheds_fixed': len(drifted) if fix else 0, 'drifted': drifted}
@@ -0,0 +1,163 @@
+"""
+Caché en proceso de las curvas de referencia por raza (BreedReference).
+
+Cada raza activa se carga una sola vez como arreglos densos indexados por edad
+(peso esperado, consumo esperado y tolerancia), de modo que las consultas por
+edad son O(1) y las edades sin fila en la tabla se interpolan linealmente entre
+las edades conocidas más cercanas.
+
+La invalidación se propaga entre procesos con un contador de generación en el
+caché de Django: cada proceso compara su generación local como máximo cada
+``BREED_CURVE_CHECK_SECONDS`` segundos.
+"""
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+GENERATION_KEY = 'flocks:breed_curves:generation'
+
+CurvePoint = namedtuple('CurvePoint', ['age_days', 'expected_weight', 'expected_consumption', 'tolerance_range', 'interpolated'])
+
+
+def _to_decimal(value):
+    return Decimal(str(round(float(value), 2)))
+
+
+class BreedCurve:
+    """Curva densa de una raza entre la edad mínima y máxima registradas."""
+
+    __slots__ = ('breed', 'min_age', 'weight', 'consumption', 'tolerance', 'known')
+
+    def __init__(self, breed, ages, weight, consumption, tolerance):
+        self.breed = breed
+        self.min_age = int(ages[0])
+        dense_ages = np.arange(self.min_age, int(ages[-1]) + 1)
+
+        self.weight = np.interp(dense_ages, ages, weight)
+        self.consumption = np.interp(dense_ages, ages, consumption)
+        self.tolerance = np.interp(dense_ages, ages, tolerance)
+        self.known = np.zeros(len(dense_ages), dtype=bool)
+        self.known[ages - self.min_age] = True
+
+    @property
+    def max_age(self):
+        return self.min_age + len(self.weight) - 1
+
+    def at(self, age_days):
+        """Punto de la curva para una edad, o None si está fuera del rango de la tabla."""
+        idx = age_days - self.min_age
+        if idx < 0 or idx >= len(self.weight):
+            return None
+        return CurvePoint(
+            age_days=age_days,
+            expected_weight=_to_decimal(self.weight[idx]),
+            expected_consumption=_to_decimal(self.consumption[idx]),
+            tolerance_range=_to_decimal(self.tolerance[idx]),
+            interpolated=not self.known[idx],
+        )
+
+    def weights_for(self, ages):
+        """Pesos esperados para un arreglo de edades (NaN fuera de rango)."""
+        return self._take(self.weight, ages)
+
+    def consumption_for(self, ages):
+        """Consumo esperado (g/ave/día) para un arreglo de edades (NaN fuera de rango)."""
+        return self._take(self.consumption, ages)
+
+    def tolerance_for(self, ages):
+        """Tolerancia (%) para un arreglo de edades (NaN fuera de rango)."""
+        return self._take(self.tolerance, ages)
+
+    def _take(self, values, ages):
+        idx = np.asarray(ages, dtype=np.int64) - self.min_age
+        inside = (idx >= 0) & (idx < len(values))
+        out = np.full(idx.shape, np.nan)
+        out[inside] = values[idx[inside]]
+        return out
+
+
+class BreedCurveCache:
+    """Curvas de todas las razas activas, cargadas perezosamente en una sola consulta."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._curves = None
+        self._generation = None
+        self._checked_at = 0.0
+
+    def get_curve(self, breed):
+        return self._load().get(breed)
+
+    def lookup(self, breed, age_days):
+        curve = self.get_curve(breed)
+        return curve.at(age_days) if curve else None
+
+    def lookup_for_flock(self, flock, date):
+        return self.lookup(flock.breed, (date - flock.arrival_date).days)
+
+    def invalidate(self):
+        """Descartar las curvas de este proceso y avisar al resto mediante la generación compartida."""
+        with self._lock:
+            self._curves = None
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.set(GENERATION_KEY, 1, None)
+
+    def invalidate_on_commit(self):
+        """Invalidar ya en este proceso y de nuevo al confirmar la transacción en curso.
+
+        La primera invalidación evita que la propia transacción lea curvas viejas; la
+        segunda avisa a los demás procesos cuando los cambios ya son visibles.
+        """
+        self.invalidate()
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(self.invalidate)
+
+    def _load(self):
+        now = time.monotonic()
+        curves = self._curves
+        check_every = getattr(settings, 'BREED_CURVE_CHECK_SECONDS', 30)
+        if curves is not None and now - self._checked_at < check_every:
+            return curves
+
+        generation = cache.get(GENERATION_KEY, 0)
+        with self._lock:
+            if self._curves is None or generation != self._generation:
+                self._curves = self._build()
+                self._generation = generation
+            self._checked_at = now
+            return self._curves
+
+    @staticmethod
+    def _build():
+        from .models import BreedReference
+
+        rows = (
+            BreedReference.objects.filter(is_active=True)
+            .order_by('breed', 'age_days', '-version')
+            .values_list('breed', 'age_days', 'expected_weight', 'expected_consumption', 'tolerance_range')
+        )
+
+        grouped = {}
+        for breed, age, weight, consumption, tolerance in rows:
+            points = grouped.setdefault(breed, {})
+            # Por si quedaran varias versiones activas, gana la más reciente
+            points.setdefault(age, (float(weight), float(consumption or 0), float(tolerance or 0)))
+
+        curves = {}
+        for breed, points in grouped.items():
+            ages = np.array(sorted(points), dtype=np.int64)
+            values = np.array([points[a] for a in ages], dtype=float)
+            curves[breed] = BreedCurve(breed, ages, values[:, 0], values[:, 1], values[:, 2])
+        return curves
+
+
+breed_curve_cache = BreedCurveCache()
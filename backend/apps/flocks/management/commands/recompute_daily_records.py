@@ -0,0 +1,42 @@
+"""
+Management command to rebuild the derived values (saldos, consumo acumulado,
+ganancias de peso, conversión) of DailyRecord series.
+
+Usage:
+    python manage.py recompute_daily_records
+    python manage.py recompute_daily_records --flock 12 --flock 15 --since 2026-01-10
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from apps.flocks.services_daily_record import DailyRecordRecomputeService
+
+
+class Command(BaseCommand):
+    help = 'Recalculate derived DailyRecord values for all flocks (or the given ones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--flock',
+            type=int,
+            action='append',
+            dest='flocks',
+            help='Flock id to recompute (repeatable). Defaults to every flock with daily records',
+        )
+        parser.add_argument(
+            '--since',
+            help='Only recompute records on or after this date (YYYY-MM-DD)',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid date: {options['since']}")
+
+        summary = DailyRecordRecomputeService.recompute_all(options['flocks'], since)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {summary['records']} daily records across {summary['flocks']} flocks"
+        ))
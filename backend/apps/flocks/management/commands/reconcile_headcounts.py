@@ -0,0 +1,31 @@
+"""
+Management command to rebuild Flock headcount counters (current_quantity,
+current_quantity_male, current_quantity_female) from the FlockMovement ledger.
+
+Usage:
+    python manage.py reconcile_headcounts
+    python manage.py reconcile_headcounts --flock 12 --flock 15
+"""
+from django.core.management.base import BaseCommand
+
+from apps.flocks.services_headcount import HeadcountLedger
+
+
+class Command(BaseCommand):
+    help = 'Rebuild flock headcounts from the movement ledger and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--flock',
+            type=int,
+            action='append',
+            dest='flocks',
+            help='Flock id to reconcile (repeatable). Defaults to every flock',
+        )
+
+    def handle(self, *args, **options):
+        summary = HeadcountLedger.reconcile(options['flocks'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {summary['flocks_checked']} flocks, fixed {summary['flocks_fixed']}"
+        ))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flocks', '0010_add_production_and_processing_stage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('movement_type', models.CharField(choices=[('MORTALITY', 'Mortalidad'), ('DISPATCH', 'Despacho'), ('PROCESS_OUTPUT', 'Salida a proceso'), ('ADJUSTMENT', 'Ajuste')], max_length=20)),
+                ('date', models.DateField()),
+                ('delta_total', models.IntegerField()),
+                ('delta_male', models.IntegerField(default=0)),
+                ('delta_female', models.IntegerField(default=0)),
+                ('source_type', models.CharField(blank=True, max_length=30)),
+                ('source_id', models.BigIntegerField(blank=True, null=True)),
+                ('notes', models.CharField(blank=True, max_length=255)),
+                ('flock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='flocks.flock')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['flock', 'date'], name='flocks_floc_flock_i_0106c1_idx'), models.Index(fields=['source_type', 'source_id'], name='flocks_floc_source__556cfc_idx')],
+            },
+        ),
+    ]
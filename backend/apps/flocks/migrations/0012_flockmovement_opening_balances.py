@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def post_opening_balances(apps, schema_editor):
+    """Adopt the counters of existing flocks as an ADJUSTMENT so reconciliation keeps them."""
+    Flock = apps.get_model('flocks', 'Flock')
+    FlockMovement = apps.get_model('flocks', 'FlockMovement')
+
+    today = timezone.now().date()
+    movements = []
+    for flock in Flock.objects.all().iterator():
+        deltas = {
+            'delta_total': flock.current_quantity - flock.initial_quantity,
+            'delta_male': flock.current_quantity_male - flock.initial_quantity_male,
+            'delta_female': flock.current_quantity_female - flock.initial_quantity_female,
+        }
+        if any(deltas.values()):
+            movements.append(FlockMovement(
+                flock_id=flock.pk,
+                movement_type='ADJUSTMENT',
+                date=today,
+                source_type='opening',
+                notes='Saldo previo al libro de movimientos',
+                **deltas,
+            ))
+    FlockMovement.objects.bulk_create(movements, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flocks', '0011_flockmovement'),
+    ]
+
+    operations = [
+        migrations.RunPython(post_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+from collections import defaultdict
+
+from django.db import migrations
+from django.utils import timezone
+
+
+# (modelo, source_type, campo de fecha, salidas (total, machos, hembras) por movement_type)
+SOURCES = [
+    ('MortalityRecord', 'mortality', 'date', lambda r: {'MORTALITY': (r.deaths, 0, 0)}),
+    ('DailyRecord', 'daily_record', 'date', lambda r: {
+        'MORTALITY': (
+            (r.mortality_male or 0) + (r.mortality_female or 0), r.mortality_male or 0, r.mortality_female or 0,
+        ),
+        'PROCESS_OUTPUT': (
+            (r.process_output_male or 0) + (r.process_output_female or 0), r.process_output_male or 0, r.process_output_female or 0,
+        ),
+    }),
+    ('DispatchRecord', 'dispatch', 'dispatch_date', lambda r: {
+        'DISPATCH': (r.total_birds, r.males_count or 0, r.females_count or 0),
+    }),
+]
+
+
+def post_legacy_sources(apps, schema_editor):
+    """Book the outputs of records saved before the ledger existed.
+
+    Without them, the next save of such a record posts its full outputs again. The
+    opening ADJUSTMENT of each flock is reduced to the remainder, so counters and
+    reconciliation are unchanged.
+    """
+    FlockMovement = apps.get_model('flocks', 'FlockMovement')
+
+    booked = set(FlockMovement.objects.exclude(source_id=None).values_list('source_type', 'source_id').distinct())
+    movements = []
+    sourced = defaultdict(lambda: [0, 0, 0])
+    for model_name, source_type, date_field, outputs in SOURCES:
+        for record in apps.get_model('flocks', model_name).objects.all().iterator():
+            if (source_type, record.pk) in booked:
+                continue
+            for movement_type, counts in outputs(record).items():
+                if not any(counts):
+                    continue
+                movements.append(FlockMovement(
+                    flock_id=record.flock_id,
+                    movement_type=movement_type,
+                    date=getattr(record, date_field),
+                    source_type=source_type,
+                    source_id=record.pk,
+                    recorded_by_id=record.recorded_by_id,
+                    delta_total=-counts[0],
+                    delta_male=-counts[1],
+                    delta_female=-counts[2],
+                ))
+                totals = sourced[record.flock_id]
+                for i, count in enumerate(counts):
+                    totals[i] += count
+
+    openings = {}
+    for opening in FlockMovement.objects.filter(source_type='opening', flock_id__in=list(sourced)).order_by('pk'):
+        openings.setdefault(opening.flock_id, opening)
+
+    today = timezone.now().date()
+    new_openings = []
+    for flock_id, (total, male, female) in sourced.items():
+        opening = openings.get(flock_id)
+        if opening is None:
+            opening = FlockMovement(
+                flock_id=flock_id, movement_type='ADJUSTMENT', date=today, source_type='opening',
+                notes='Saldo previo al libro de movimientos', delta_total=0,
+            )
+            new_openings.append(opening)
+        opening.delta_total += total
+        opening.delta_male += male
+        opening.delta_female += female
+
+    FlockMovement.objects.bulk_create(movements + new_openings, batch_size=500)
+    FlockMovement.objects.bulk_update(list(openings.values()), ['delta_total', 'delta_male', 'delta_female'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flocks', '0012_flockmovement_opening_balances'),
+    ]
+
+    operations = [
+        migrations.RunPython(post_legacy_sources, migrations.RunPython.noop),
+    ]
@@ -131,31 +131,48 @@ class Flock(BaseModel):
 				self.current_quantity_male = self.initial_quantity_male
 				self.current_quantity_female = self.initial_quantity_female
 		
-		# Validar capacidad del galpón antes de crear nuevo lote
-		if not self.pk:  # Solo en creación
-			self._validate_shed_capacity()
-		
-		super().save(*args, **kwargs)
+		from django.db import transaction
+		from apps.farms.services import ShedOccupancyService
+
+		is_new = not self.pk
+		with transaction.atomic():
+			previous = None
+			if is_new:  # Solo en creación
+				# Validar capacidad del galpón antes de crear nuevo lote
+				self._validate_shed_capacity()
+			elif self._touches_occupancy(kwargs.get('update_fields')):
+				previous = Flock.objects.select_for_update().filter(pk=self.pk).values_list(
+					'shed_id', 'status', 'current_quantity'
+				).first()
+
+			super().save(*args, **kwargs)
+
+			# Mantener el contador de ocupación del galpón en la misma transacción
+			if is_new or previous is not None:
+				ShedOccupancyService.record_change(previous, (self.shed_id, self.status, self.current_quantity))
+				# Como con los contadores del lote, el galpón en memoria refleja el nuevo saldo
+				if Flock.shed.is_cached(self):
+					self.shed.refresh_from_db(fields=['occupancy'])
+
+	@staticmethod
+	def _touches_occupancy(update_fields):
+		return update_fields is None or bool({'shed', 'shed_id', 'status', 'current_quantity'} & set(update_fields))
 	
 	def _validate_shed_capacity(self):
 		"""Validar que el galpón tenga suficiente capacidad para el nuevo lote"""
-		if not self.shed or not hasattr(self.shed, 'capacity'):
-			return  # Si no hay galpón o capacidad definida, no validar
+		if not self.shed_id:
+			return  # Si no hay galpón, no validar
 		
-		# Calcular capacidad actual ocupada en el galpón
-		current_occupation = Flock.objects.filter(
-			shed=self.shed,
-			status='ACTIVE'
-		).aggregate(
-			total=models.Sum('current_quantity')
-		)['total'] or 0
+		# Lectura bloqueada de la fila del galpón: el contador ya es la ocupación actual
+		shed = Shed.objects.select_for_update().only('name', 'capacity', 'occupancy').get(pk=self.shed_id)
+		current_occupation = shed.occupancy
 		
 		# Verificar si el nuevo lote excede la capacidad
-		if current_occupation + self.initial_quantity > self.shed.capacity:
+		if current_occupation + self.initial_quantity > shed.capacity:
 			from django.core.exceptions import ValidationError
 			raise ValidationError(
-				f'El galpón {self.shed.name} no tiene suficiente capacidad. '
-				f'Capacidad: {self.shed.capacity}, Ocupado: {current_occupation}, '
+				f'El galpón {shed.name} no tiene suficiente capacidad. '
+				f'Capacidad: {shed.capacity}, Ocupado: {current_occupation}, '
 				f'Nuevo lote: {self.initial_quantity}'
 			)
 
@@ -219,73 +236,22 @@ class DailyWeightRecord(SyncableRecordModel):
 		# Guardar primero el registro
 		super().save(*args, **kwargs)
 		
-		# Verificar si se debe generar alarma por desviación
-		self._check_weight_deviation_alarm()
+		# La evaluación de desviación se hace en lote (apps.alarms.weight_deviation)
+		self._enqueue_weight_deviation_check()
 
 	def _calculate_expected_weight(self):
-		"""Calcular peso esperado usando BreedReference más inteligente"""
-		# Usar el método de clase que maneja versionado
-		reference = BreedReference.get_reference_for_flock(self.flock, self.date)
-		return reference.expected_weight if reference else None
+		"""Calcular peso esperado usando la curva de BreedReference de la raza (caché en proceso)"""
+		from .breed_curves import breed_curve_cache
+		point = breed_curve_cache.lookup_for_flock(self.flock, self.date)
+		return point.expected_weight if point else None
 	
-	def _check_weight_deviation_alarm(self):
-		"""Verificar si el peso está fuera del rango aceptable y generar alarma"""
+	def _enqueue_weight_deviation_check(self):
+		"""Encolar (lote, fecha) para que la tarea de alarmas evalúe la desviación contra la tolerancia"""
 		if not self.expected_weight or not self.deviation_percentage:
 			return
 		
-		try:
-			from apps.alarms.models import AlarmConfiguration, Alarm
-		except ImportError:
-			return
-			
-		# Obtener referencia para verificar tolerancia
-		reference = BreedReference.get_reference_for_flock(self.flock, self.date)
-		if not reference:
-			return
-			
-		tolerance = float(reference.tolerance_range)
-		
-		# Si la desviación supera la tolerancia, crear alarma
-		if float(self.deviation_percentage) > tolerance:
-			# Verificar configuración de alarmas de la granja
-			config = AlarmConfiguration.objects.filter(
-				alarm_type='WEIGHT_DEVIATION',
-				farm=self.flock.shed.farm,
-				is_active=True
-			).first()
-			
-			if config:
-				# Verificar si no existe alarma similar reciente
-				recent_alarms = Alarm.objects.filter(
-					alarm_type='WEIGHT_DEVIATION',
-					entity_type='FLOCK',
-					entity_id=self.flock.id,
-					status='PENDING',
-					created_at__date=self.date
-				)
-				
-				if not recent_alarms.exists():
-					priority = 'HIGH' if float(self.deviation_percentage) > (tolerance * 2) else 'MEDIUM'
-					
-					Alarm.objects.create(
-						alarm_type='WEIGHT_DEVIATION',
-						entity_type='FLOCK',
-						entity_id=self.flock.id,
-						priority=priority,
-						title=f'Peso fuera de rango - {self.flock}',
-						message=f'Peso promedio {self.average_weight}g vs esperado {self.expected_weight}g. Desviación: {self.deviation_percentage:.1f}%',
-						farm=self.flock.shed.farm,
-						shed=self.flock.shed,
-						data={
-							'flock_id': self.flock.id,
-							'date': self.date.isoformat(),
-							'actual_weight': float(self.average_weight),
-							'expected_weight': float(self.expected_weight),
-							'deviation_percentage': float(self.deviation_percentage),
-							'tolerance_range': tolerance,
-							'breed': self.flock.breed
-						}
-					)
+		from apps.alarms.weight_deviation import WeightDeviationService
+		WeightDeviationService.enqueue([(self.flock_id, self.date)])
 
 
 class MortalityCause(BaseModel):
@@ -318,29 +284,30 @@ class MortalityRecord(SyncableRecordModel):
 		unique_together = ['flock', 'date']
 
 	def save(self, *args, **kwargs):
-		is_new = not self.pk
+		from django.db import transaction
+		from .services_headcount import HeadcountLedger
 
-		if is_new:
-			# Validar que no exceda cantidad actual
-			if self.deaths > self.flock.current_quantity:
-				from django.core.exceptions import ValidationError
-				raise ValidationError(
-					f"Mortalidad ({self.deaths}) excede cantidad actual del lote ({self.flock.current_quantity})"
-				)
-
-			# Actualizar lote
-			self.flock.current_quantity -= self.deaths
-			self.flock.save(update_fields=['current_quantity'])
+		is_new = not self.pk
 
-		super().save(*args, **kwargs)
+		with transaction.atomic():
+			super().save(*args, **kwargs)
+			# Actualizar lote vía libro de movimientos (rechaza si excede la cantidad actual)
+			HeadcountLedger.sync_source(
+				self.flock, 'mortality', self.pk, self.date,
+				{'MORTALITY': (self.deaths, 0, 0)},
+				user=self.recorded_by, created=is_new, strict=True,
+			)
 
-		# Verificar alarmas después de guardar
+		# Verificar alarmas después del commit, sin retener el bloqueo de la fila del lote
 		if is_new:
-			try:
-				self._check_mortality_alarms()
-			except Exception:
-				# no dejar que una falla en alarmas rompa el guardado
-				pass
+			transaction.on_commit(self._safe_check_mortality_alarms)
+
+	def _safe_check_mortality_alarms(self):
+		try:
+			self._check_mortality_alarms()
+		except Exception:
+			# no dejar que una falla en alarmas rompa el guardado
+			pass
 
 	def _check_mortality_alarms(self):
 		"""Verificar si debe generar alarma por mortalidad alta"""
@@ -456,7 +423,12 @@ class DailyRecord(SyncableRecordModel):
 	def __str__(self):
 		return f"Registro {self.flock} - Día {self.day_number} ({self.date})"
 
-	def save(self, *args, **kwargs):
+	def calculate_derived_fields(self):
+		"""Calcular edad, consumo por pollo y conversión a partir de los campos capturados.
+
+		Compartido por save() y por la sincronización en lote (que usa bulk_create
+		y por lo tanto no pasa por save()).
+		"""
 		# Auto-calcular semana y día desde la fecha de llegada
 		if self.flock and self.date:
 			days_since = (self.date - self.flock.arrival_date).days
@@ -482,16 +454,35 @@ class DailyRecord(SyncableRecordModel):
 			if weight_gain > 0:
 				self.feed_conversion_female = float(self.accumulated_feed_per_bird_gr_female) / weight_gain
 
-		# Actualizar cantidades del lote
-		if not kwargs.pop('_skip_flock_update', False):
-			total_mortality = (self.mortality_male or 0) + (self.mortality_female or 0)
-			total_process = (self.process_output_male or 0) + (self.process_output_female or 0)
-			self.flock.current_quantity_male = self.balance_male
-			self.flock.current_quantity_female = self.balance_female
-			self.flock.current_quantity = self.balance_male + self.balance_female
-			self.flock.save(update_fields=['current_quantity', 'current_quantity_male', 'current_quantity_female'])
+	def save(self, *args, **kwargs):
+		self.calculate_derived_fields()
 
-		super().save(*args, **kwargs)
+		from django.db import transaction
+
+		skip_flock_update = kwargs.pop('_skip_flock_update', False)
+		is_new = not self.pk
+
+		with transaction.atomic():
+			super().save(*args, **kwargs)
+
+			# Actualizar cantidades del lote vía libro de movimientos
+			if not skip_flock_update:
+				from .services_headcount import HeadcountLedger
+				HeadcountLedger.sync_source(
+					self.flock, 'daily_record', self.pk, self.date, self.headcount_outputs(),
+					user=self.recorded_by, created=is_new,
+				)
+
+	def headcount_outputs(self):
+		"""Salidas de aves del día por tipo de movimiento: (total, machos, hembras)"""
+		mortality_male = self.mortality_male or 0
+		mortality_female = self.mortality_female or 0
+		process_male = self.process_output_male or 0
+		process_female = self.process_output_female or 0
+		return {
+			'MORTALITY': (mortality_male + mortality_female, mortality_male, mortality_female),
+			'PROCESS_OUTPUT': (process_male + process_female, process_male, process_female),
+		}
 
 
 class DispatchRecord(SyncableRecordModel):
@@ -560,12 +551,57 @@ class DispatchRecord(SyncableRecordModel):
 		if not self.plant_birds and self.total_birds:
 			self.plant_birds = self.total_birds - (self.drowned or 0) - (self.plant_missing or 0)
 
-		# Actualizar el saldo del lote (restar pollos despachados)
-		if not kwargs.pop('_skip_flock_update', False):
-			if not self.pk:  # Solo en creación
-				self.flock.current_quantity = max(0, self.flock.current_quantity - self.total_birds)
-				self.flock.current_quantity_male = max(0, self.flock.current_quantity_male - (self.males_count or 0))
-				self.flock.current_quantity_female = max(0, self.flock.current_quantity_female - (self.females_count or 0))
-				self.flock.save(update_fields=['current_quantity', 'current_quantity_male', 'current_quantity_female'])
+		from django.db import transaction
 
-		super().save(*args, **kwargs)
+		skip_flock_update = kwargs.pop('_skip_flock_update', False)
+		is_new = not self.pk
+
+		with transaction.atomic():
+			super().save(*args, **kwargs)
+
+			# Actualizar el saldo del lote (restar pollos despachados) vía libro de movimientos
+			if not skip_flock_update:
+				from .services_headcount import HeadcountLedger
+				HeadcountLedger.sync_source(
+					self.flock, 'dispatch', self.pk, self.dispatch_date,
+					{'DISPATCH': (self.total_birds, self.males_count or 0, self.females_count or 0)},
+					user=self.recorded_by, created=is_new,
+				)
+
+
+class FlockMovement(BaseModel):
+	"""Libro de movimientos de aves (solo inserción) que respalda los saldos del lote.
+
+	Los contadores current_quantity* de Flock se actualizan con F() al registrar cada
+	movimiento y pueden reconstruirse sumando el libro sobre las cantidades iniciales.
+	"""
+	MOVEMENT_TYPES = [
+		('MORTALITY', 'Mortalidad'),
+		('DISPATCH', 'Despacho'),
+		('PROCESS_OUTPUT', 'Salida a proceso'),
+		('ADJUSTMENT', 'Ajuste'),
+	]
+
+	flock = models.ForeignKey(Flock, on_delete=models.CASCADE, related_name='movements')
+	movement_type = models.CharField(max_length=20, choices=MOVEMENT_TYPES)
+	date = models.DateField()
+
+	# Variación con signo (negativa para salidas)
+	delta_total = models.IntegerField()
+	delta_male = models.IntegerField(default=0)
+	delta_female = models.IntegerField(default=0)
+
+	# Registro que originó el movimiento (e.g. 'mortality', 'daily_record', 'dispatch')
+	source_type = models.CharField(max_length=30, blank=True)
+	source_id = models.BigIntegerField(null=True, blank=True)
+	recorded_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+	notes = models.CharField(max_length=255, blank=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['flock', 'date']),
+			models.Index(fields=['source_type', 'source_id']),
+		]
+
+	def __str__(self):
+		return f"{self.movement_type} {self.delta_total:+d} - Lote {self.flock_id} ({self.date})"
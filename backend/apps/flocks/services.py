@@ -1,15 +1,46 @@
 from __future__ import annotations
 
+import csv
 import datetime
-from typing import List
+import logging
+from typing import Dict, Iterator, List
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Max, Q
 from django.utils import timezone
 
 from openpyxl import load_workbook
 
 from .models import BreedReference, ReferenceImportLog
+from .breed_curves import breed_curve_cache
+
+
+IMPORT_REQUIRED_COLUMNS = ['breed', 'age_days', 'expected_weight']
+IMPORT_OPTIONAL_DEFAULTS = {'expected_consumption': 0, 'tolerance_range': 10.0}
+IMPORT_BATCH_SIZE = 500
+
+
+def _iter_reference_rows(file_path: str) -> Iterator[tuple]:
+    """Itera las filas (incluida la cabecera) de un .xlsx en modo read-only o de un .csv."""
+    if file_path.lower().endswith('.csv'):
+        with open(file_path, newline='', encoding='utf-8-sig') as fh:
+            sample = fh.read(4096)
+            fh.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            for row in csv.reader(fh, dialect):
+                yield tuple(value.strip() or None for value in row)
+        return
+
+    wb = load_workbook(filename=file_path, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
 
 
 class BreedReferenceService:
@@ -17,7 +48,7 @@ class BreedReferenceService:
 
     @staticmethod
     def import_from_excel(file_path: str, imported_by) -> ReferenceImportLog:
-        """Importa una hoja de Excel con columnas esperadas y crea/actualiza referencias.
+        """Importa una hoja de Excel (o un CSV) con columnas esperadas y crea/actualiza referencias.
 
         Columnas requeridas: breed, age_days, expected_weight
         Opcionales: expected_consumption, tolerance_range
@@ -25,21 +56,17 @@ class BreedReferenceService:
         Reglas:
         - Para cada fila válida se crea una nueva versión (version = max_version + 1) y se marca is_active=True.
         - Las versiones previas para la misma (breed, age_days) se desactivan.
+        - Si el archivo repite una (breed, age_days), cada fila crea su versión y queda activa la última.
         - Registra el resultado en ReferenceImportLog con conteo de éxitos y errores.
-        """
-
-        wb = load_workbook(filename=file_path, data_only=True)
-        ws = wb.active
-
-        header = [str(cell.value).strip().lower() if cell.value is not None else '' for cell in next(ws.iter_rows(min_row=1, max_row=1))]
 
-        required = ['breed', 'age_days', 'expected_weight']
-        col_map = {}
-        for idx, name in enumerate(header):
-            if name:
-                col_map[name] = idx + 1
+        Las filas se leen en streaming y se validan a un buffer columnar; la escritura se hace
+        en una sola transacción: una consulta de versiones, un UPDATE y un bulk_create.
+        """
+        rows = _iter_reference_rows(file_path)
+        header = [str(value).strip().lower() if value is not None else '' for value in next(rows, ())]
+        col_map = {name: idx for idx, name in enumerate(header) if name}
 
-        missing = [c for c in required if c not in col_map]
+        missing = [c for c in IMPORT_REQUIRED_COLUMNS if c not in col_map]
         log = ReferenceImportLog.objects.create(
             file_name=file_path.split('/')[-1] if '/' in file_path else file_path.split('\\')[-1],
             imported_by=imported_by,
@@ -51,64 +78,95 @@ class BreedReferenceService:
         )
 
         if missing:
+            rows.close()
             log.errors = 0
             log.error_details = [f"missing columns: {missing}"]
             log.save()
             return log
 
+        fields = {name: BreedReference._meta.get_field(name) for name in IMPORT_REQUIRED_COLUMNS + list(IMPORT_OPTIONAL_DEFAULTS)}
+        columns: Dict[str, list] = {name: [] for name in fields}
         total = 0
-        successes = 0
-        updates = 0
-        errors = 0
         error_details: List[str] = []
 
-        for row in ws.iter_rows(min_row=2):
+        for row_number, row in enumerate(rows, start=2):
+            if not any(value not in (None, '') for value in row):
+                continue
             total += 1
             try:
-                breed = row[col_map['breed'] - 1].value
-                age_days = row[col_map['age_days'] - 1].value
-                expected_weight = row[col_map['expected_weight'] - 1].value
-
-                if breed is None or age_days is None or expected_weight is None:
-                    raise ValueError('required field missing')
-
-                expected_consumption = None
-                if 'expected_consumption' in col_map:
-                    expected_consumption = row[col_map['expected_consumption'] - 1].value or 0
-
-                tolerance_range = None
-                if 'tolerance_range' in col_map:
-                    tolerance_range = row[col_map['tolerance_range'] - 1].value or 10.0
-
-                with transaction.atomic():
-                    # determine new version
-                    latest = BreedReference.objects.filter(breed=breed, age_days=int(age_days)).order_by('-version').first()
-                    new_version = 1
-                    if latest:
-                        new_version = latest.version + 1
-                        # deactivate previous versions
-                        BreedReference.objects.filter(breed=breed, age_days=int(age_days), is_active=True).update(is_active=False)
-
-                    br = BreedReference.objects.create(
-                        breed=str(breed),
-                        age_days=int(age_days),
-                        expected_weight=float(expected_weight),
-                        expected_consumption=float(expected_consumption or 0),
-                        tolerance_range=float(tolerance_range or 10.0),
-                        version=new_version,
-                        is_active=True,
-                        created_by=imported_by,
-                    )
+                values = {}
+                for name, field in fields.items():
+                    idx = col_map.get(name)
+                    raw = row[idx] if idx is not None and idx < len(row) else None
+                    if raw in (None, ''):
+                        if name not in IMPORT_OPTIONAL_DEFAULTS:
+                            raise ValueError('required field missing')
+                        raw = IMPORT_OPTIONAL_DEFAULTS[name]
+                    if name == 'breed':
+                        raw = str(raw).strip()
+                    elif name == 'age_days' and isinstance(raw, float) and raw.is_integer():
+                        raw = int(raw)
+                    values[name] = field.clean(raw, None)
+            except ValidationError as exc:
+                error_details.append(f'row {row_number}: {name}: {"; ".join(exc.messages)}')
+                continue
+            except Exception as exc:
+                error_details.append(f'row {row_number}: {str(exc)}')
+                continue
+
+            for name, value in values.items():
+                columns[name].append(value)
+
+        keys = list(zip(columns['breed'], columns['age_days']))
+        updates = 0
 
-                successes += 1
-            except Exception as exc:  # pragma: no cover - exception paths logged
-                errors += 1
-                error_details.append(f'row {total+1}: {str(exc)}')
+        if keys:
+            with transaction.atomic():
+                latest: Dict[tuple, int] = {}
+                active_ids = []
+                key_set = set(keys)
+                # Una fila por (breed, age_days): última versión e id de la activa, sin traer el historial
+                existing = BreedReference.objects.filter(
+                    breed__in={k[0] for k in key_set},
+                    age_days__in={k[1] for k in key_set},
+                ).values('breed', 'age_days').order_by().annotate(
+                    max_version=Max('version'),
+                    active_id=Max('id', filter=Q(is_active=True)),
+                ).values_list('breed', 'age_days', 'max_version', 'active_id')
+                for breed, age_days, max_version, active_id in existing:
+                    key = (breed, age_days)
+                    if key not in key_set:
+                        continue
+                    latest[key] = max_version
+                    if active_id is not None:
+                        active_ids.append(active_id)
+
+                if active_ids:
+                    BreedReference.objects.filter(pk__in=active_ids).update(is_active=False)
+
+                last_index = {key: i for i, key in enumerate(keys)}
+                objs = []
+                for i, key in enumerate(keys):
+                    if key in latest:
+                        updates += 1
+                    latest[key] = latest.get(key, 0) + 1
+                    objs.append(BreedReference(
+                        breed=key[0],
+                        age_days=key[1],
+                        expected_weight=columns['expected_weight'][i],
+                        expected_consumption=columns['expected_consumption'][i],
+                        tolerance_range=columns['tolerance_range'][i],
+                        version=latest[key],
+                        is_active=last_index[key] == i,
+                        created_by=imported_by,
+                    ))
+                BreedReference.objects.bulk_create(objs, batch_size=IMPORT_BATCH_SIZE)
+                breed_curve_cache.invalidate_on_commit()
 
         log.total_rows = total
-        log.successful_imports = successes
+        log.successful_imports = len(keys)
         log.updates = updates
-        log.errors = errors
+        log.errors = len(error_details)
         log.error_details = error_details
         log.save()
 
@@ -119,84 +177,227 @@ from django.utils.dateparse import parse_date
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
-from .models import MortalityRecord, MortalityCause, Flock
+from .models import MortalityRecord, MortalityCause, Flock, FlockMovement
+
+logger = logging.getLogger(__name__)
 
 
 class MortalityService:
     @staticmethod
     def register_mortality_batch(mortality_records, user):
-        """Registra múltiples mortalidades en batch (para sync offline)"""
-        results = []
+        """Registra múltiples mortalidades en batch (para sync offline).
+
+        Agrupa las entradas por lote, bloquea los lotes una sola vez en orden de id,
+        suma en memoria las entradas del mismo día y aplica un único delta de aves por
+        lote a través del libro de movimientos. Las alarmas se evalúan una vez por lote
+        al confirmar la transacción. Devuelve un resultado por entrada, en orden.
+        """
+        results = [None] * len(mortality_records)
+        parsed = []
+
+        for pos, record_data in enumerate(mortality_records):
+            try:
+                date = parse_date(record_data['date'])
+                if date is None:
+                    raise ValueError(f"Invalid date: {record_data['date']}")
+                parsed.append((pos, record_data, int(record_data['flock_id']), date, int(record_data['deaths'])))
+            except Exception as e:
+                results[pos] = MortalityService._error(record_data, e)
 
         with transaction.atomic():
-            for record_data in mortality_records:
+            flocks = {
+                f.id: f for f in Flock.objects.select_for_update()
+                .filter(id__in={p[2] for p in parsed})
+                .select_related('shed')
+                .order_by('id')
+            }
+            existing = {
+                (r.flock_id, r.date): r for r in MortalityRecord.objects.filter(
+                    flock_id__in=flocks.keys(),
+                    date__in={p[3] for p in parsed},
+                )
+            }
+            causes = MortalityService._resolve_causes({p[1].get('cause_name') for p in parsed} - {None, ''})
+
+            role_name = getattr(getattr(user, 'role', None), 'name', None)
+            available = {fid: f.current_quantity for fid, f in flocks.items()}
+            added = {}      # (flock_id, date) -> muertes sumadas en este batch
+            created = {}    # (flock_id, date) -> registro nuevo
+
+            for pos, record_data, flock_id, date, deaths in parsed:
                 try:
-                    result = MortalityService._process_single_mortality(record_data, user)
-                    results.append(result)
-                except Exception as e:
-                    results.append({
+                    flock = flocks.get(flock_id)
+                    if flock is None:
+                        raise Flock.DoesNotExist('Flock matching query does not exist.')
+
+                    # Validar permisos (Galponero solo en sus galpones)
+                    if role_name == 'Galponero' and flock.shed.assigned_worker_id != user.id:
+                        raise PermissionError("No tienes permisos para registrar mortalidad en este galpón")
+
+                    key = (flock_id, date)
+                    record = existing.get(key) or created.get(key)
+
+                    if record is not None:
+                        # Sumar mortalidad al registro del mismo día
+                        if deaths > available[flock_id]:
+                            raise ValidationError("La mortalidad total excede la cantidad del lote")
+                        record.deaths += deaths
+                        action = 'updated'
+                    else:
+                        if deaths > available[flock_id]:
+                            raise ValidationError(
+                                f"Mortalidad ({deaths}) excede cantidad actual del lote ({available[flock_id]})"
+                            )
+                        record = created[key] = MortalityRecord(
+                            flock=flock,
+                            date=date,
+                            deaths=deaths,
+                            cause_id=causes.get(record_data.get('cause_name')),
+                            temperature=record_data.get('temperature'),
+                            notes=record_data.get('notes', ''),
+                            recorded_by=user,
+                            client_id=record_data.get('client_id'),
+                            created_by_device=record_data.get('device_id'),
+                        )
+                        action = 'created'
+
+                    available[flock_id] -= deaths
+                    added[key] = added.get(key, 0) + deaths
+                    results[pos] = {
                         'client_id': record_data.get('client_id'),
-                        'status': 'error',
-                        'error': str(e)
-                    })
+                        'status': 'success',
+                        'action': action,
+                        'server_id': record,
+                    }
+                except Exception as e:
+                    results[pos] = MortalityService._error(record_data, e)
+
+            MortalityService._write(list(created.values()), [existing[k] for k in added if k in existing], added, user)
+
+        for res in results:
+            if isinstance(res.get('server_id'), MortalityRecord):
+                res['server_id'] = res['server_id'].pk
+
+        touched = {}
+        for key in added:
+            touched.setdefault(key[0], []).append(existing.get(key) or created[key])
+        if touched:
+            transaction.on_commit(lambda: MortalityService._evaluate_alarms(flocks, touched))
 
         return results
 
     @staticmethod
-    def _process_single_mortality(record_data, user):
-        flock = Flock.objects.get(id=record_data['flock_id'])
-        date = parse_date(record_data['date'])
-        deaths = int(record_data['deaths'])
-
-        # Validar permisos (Galponero solo en sus galpones)
-        role_name = getattr(getattr(user, 'role', None), 'name', None)
-        if role_name == 'Galponero' and flock.shed.assigned_worker != user:
-            raise PermissionError("No tienes permisos para registrar mortalidad en este galpón")
-
-        # Verificar duplicado del mismo día (sumar si existe)
-        existing = MortalityRecord.objects.filter(flock=flock, date=date).first()
-
-        if existing:
-            # Sumar mortalidad al registro existente
-            total_deaths = existing.deaths + deaths
-            if total_deaths > (flock.current_quantity + existing.deaths):
-                raise ValidationError("La mortalidad total excede la cantidad del lote")
-
-            existing.deaths = total_deaths
-            existing.save()  # Trigger actualización automática
-
-            return {
-                'client_id': record_data.get('client_id'),
-                'status': 'success',
-                'action': 'updated',
-                'server_id': existing.id
+    def _resolve_causes(names):
+        """Mapa nombre -> id de causa; las que no existen se crean en bloque (categoría OTHER)."""
+        if not names:
+            return {}
+        ids = dict(MortalityCause.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = names - ids.keys()
+        if missing:
+            MortalityCause.objects.bulk_create(
+                [MortalityCause(name=name, category='OTHER') for name in missing], ignore_conflicts=True,
+            )
+            ids.update(MortalityCause.objects.filter(name__in=missing).values_list('name', 'id'))
+        return ids
+
+    @staticmethod
+    def _write(created, updated, added, user):
+        from .services_headcount import HeadcountLedger
+
+        if not created and not updated:
+            return
+
+        MortalityRecord.objects.bulk_create(created)
+        now = timezone.now()
+        for record in updated:
+            record.updated_at = now
+        MortalityRecord.objects.bulk_update(updated, ['deaths', 'updated_at'])
+
+        # Backends sin RETURNING (MySQL) no asignan pk en bulk_create
+        if any(r.pk is None for r in created):
+            ids = {
+                (fid, d): pk for pk, fid, d in MortalityRecord.objects.filter(
+                    flock_id__in={r.flock_id for r in created},
+                    date__in={r.date for r in created},
+                ).values_list('id', 'flock_id', 'date')
             }
+            for r in created:
+                r.pk = ids.get((r.flock_id, r.date))
+
+        # Un movimiento por registro; el libro aplica un solo UPDATE por lote
+        HeadcountLedger.apply((
+            FlockMovement(
+                flock_id=r.flock_id,
+                movement_type='MORTALITY',
+                date=r.date,
+                delta_total=-added[(r.flock_id, r.date)],
+                source_type='mortality',
+                source_id=r.pk,
+                recorded_by=user,
+            )
+            for r in created + updated
+        ), strict=True)
 
-        # Crear nuevo registro
-        cause = None
-        if record_data.get('cause_name'):
-            cause, _ = MortalityCause.objects.get_or_create(
-                name=record_data['cause_name'],
-                defaults={'category': 'OTHER'}
+    @staticmethod
+    def _evaluate_alarms(flocks, touched):
+        """Evaluar alarmas de mortalidad una vez por lote con los días tocados en el batch."""
+        from apps.alarms.models import AlarmConfiguration, Alarm
+
+        try:
+            configs = {
+                c.farm_id: c for c in AlarmConfiguration.objects.filter(
+                    alarm_type='MORTALITY', farm_id__in={flocks[fid].shed.farm_id for fid in touched}, is_active=True,
+                )
+            }
+            if not configs:
+                return
+
+            current = dict(Flock.objects.filter(id__in=touched.keys()).values_list('id', 'current_quantity'))
+            alarmed = set(
+                Alarm.objects.filter(
+                    alarm_type='MORTALITY',
+                    source_type='mortality',
+                    source_id__in=[r.pk for records in touched.values() for r in records],
+                ).exclude(status='RESOLVED').values_list('source_id', flat=True)
             )
 
-        mortality_record = MortalityRecord.objects.create(
-            flock=flock,
-            date=date,
-            deaths=deaths,
-            cause=cause,
-            temperature=record_data.get('temperature'),
-            notes=record_data.get('notes', ''),
-            recorded_by=user,
-            client_id=record_data.get('client_id'),
-            created_by_device=record_data.get('device_id')
-        )
+            alarms = []
+            for flock_id, records in touched.items():
+                flock = flocks[flock_id]
+                config = configs.get(flock.shed.farm_id)
+                if config is None:
+                    continue
+                for record in records:
+                    original_quantity = current.get(flock_id, 0) + record.deaths
+                    if original_quantity == 0 or record.pk in alarmed:
+                        continue
+                    daily_mortality_rate = (record.deaths / original_quantity) * 100
+                    if daily_mortality_rate < float(config.threshold_value):
+                        continue
+                    critical = float(config.critical_threshold or config.threshold_value * 2)
+                    alarms.append(Alarm(
+                        alarm_type='MORTALITY',
+                        description=f'Mortalidad alta en {flock.shed.name} - {record.date}: {daily_mortality_rate:.1f}% (umbral: {config.threshold_value}%)',
+                        priority='HIGH' if daily_mortality_rate >= critical else 'MEDIUM',
+                        farm_id=config.farm_id,
+                        flock_id=flock_id,
+                        shed_id=flock.shed_id,
+                        configuration=config,
+                        source_type='mortality',
+                        source_date=record.date,
+                        source_id=record.pk,
+                    ))
+            Alarm.objects.bulk_create(alarms)
+        except Exception:
+            # no dejar que una falla en alarmas rompa la sincronización
+            logger.exception('Error evaluating mortality alarms for flocks %s', list(touched))
 
+    @staticmethod
+    def _error(record_data, error):
         return {
-            'client_id': record_data.get('client_id'),
-            'status': 'success',
-            'action': 'created',
-            'server_id': mortality_record.id
+            'client_id': record_data.get('client_id') if isinstance(record_data, dict) else None,
+            'status': 'error',
+            'error': str(error),
         }
 
     @staticmethod
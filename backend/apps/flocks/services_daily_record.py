@@ -0,0 +1,532 @@
+import bisect
+import hashlib
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, FloatField, Max, Min, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .models import DailyRecord, Flock, FlockMovement
+from .services_dashboard import ShedDashboardService
+from .services_headcount import HeadcountLedger
+
+logger = logging.getLogger(__name__)
+
+
+# Campos que la sincronización arrastra de un registro al siguiente
+CARRY_FIELDS = (
+    'id', 'flock_id', 'date',
+    'balance_male', 'balance_female',
+    'accumulated_feed_per_bird_gr_male', 'accumulated_feed_per_bird_gr_female',
+    'weight_male', 'weight_female',
+)
+
+DECIMAL_FIELDS = [
+    f for f in DailyRecord._meta.concrete_fields
+    if f.get_internal_type() == 'DecimalField'
+]
+
+
+def as_stored_decimal(field, value):
+    """Devuelve el valor tal como quedará persistido en la columna decimal."""
+    if value is None:
+        return None
+    return field.to_python(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+
+
+class DailyRecordSyncService:
+    """Sincronización en lote de registros diarios (hoja CONSUMO DIARIO).
+
+    En lugar de consultar el lote, el registro existente, el anterior y el de hace
+    una semana por cada fila, carga todos los lotes y su historial en dos consultas,
+    procesa las filas ordenadas por (lote, fecha) arrastrando saldos, consumo
+    acumulado y pesos en memoria, y escribe todo con bulk_create.
+    """
+
+    @staticmethod
+    def sync_batch(records, user):
+        """Procesa los registros validados y devuelve un resultado por fila en el orden recibido."""
+        results = [None] * len(records)
+
+        flock_ids = {r['flock_id'] for r in records}
+        flocks = Flock.objects.in_bulk(flock_ids)
+
+        # Historial por lote: fecha -> snapshot de los campos arrastrados
+        history = defaultdict(dict)
+        for row in DailyRecord.objects.filter(flock_id__in=flocks.keys()).values(*CARRY_FIELDS):
+            history[row['flock_id']][row['date']] = row
+        dates = {fid: sorted(rows) for fid, rows in history.items()}
+        last_existing = {fid: flock_dates[-1] for fid, flock_dates in dates.items()}
+        cascade_from = {}
+
+        ordered = sorted(enumerate(records), key=lambda p: (p[1]['flock_id'], p[1]['date'], p[0]))
+
+        pending = []  # (posición, instancia)
+        touched_flocks = {}
+
+        for pos, record_data in ordered:
+            client_id = record_data.get('client_id', '')
+            flock = flocks.get(record_data['flock_id'])
+            if flock is None:
+                results[pos] = {
+                    'client_id': client_id,
+                    'status': 'error',
+                    'message': f'Flock {record_data["flock_id"]} not found',
+                }
+                continue
+
+            date = record_data['date']
+            flock_history = history[flock.id]
+            flock_dates = dates.setdefault(flock.id, [])
+
+            existing = flock_history.get(date)
+            if existing:
+                results[pos] = {
+                    'client_id': client_id,
+                    'server_id': existing['id'],
+                    'status': 'exists',
+                    'message': 'Already exists for this date',
+                }
+                continue
+
+            idx = bisect.bisect_left(flock_dates, date)
+            prev = flock_history[flock_dates[idx - 1]] if idx > 0 else None
+            week_ago = flock_history.get(date - timedelta(days=7))
+
+            try:
+                instance = DailyRecordSyncService._build_record(flock, record_data, prev, week_ago, user)
+            except ValidationError as e:
+                results[pos] = {
+                    'client_id': client_id,
+                    'status': 'error',
+                    'message': '; '.join(e.messages),
+                }
+                continue
+
+            snapshot = {name: getattr(instance, name) for name in CARRY_FIELDS if name != 'id'}
+            snapshot['id'] = None
+            snapshot['_instance'] = instance
+            flock_history[date] = snapshot
+            bisect.insort(flock_dates, date)
+
+            touched_flocks[flock.id] = flock
+
+            # Inserción retroactiva: los días ya guardados después de éste quedan desactualizados
+            if flock.id in last_existing and date < last_existing[flock.id]:
+                cascade_from[flock.id] = min(cascade_from.get(flock.id, date), date)
+
+            pending.append((pos, instance))
+            results[pos] = {
+                'client_id': client_id,
+                'server_id': None,
+                'status': 'created',
+                'message': 'OK',
+            }
+
+        failed = {}
+        if pending:
+            try:
+                with transaction.atomic():
+                    DailyRecordSyncService._write([inst for _, inst in pending], user)
+                    for flock_id, date in cascade_from.items():
+                        DailyRecordRecomputeService.recompute_from(flocks[flock_id], date)
+            except DatabaseError:
+                # IntegrityError incluido: p. ej. otra sincronización guardó el mismo (lote, fecha)
+                # entre la lectura del historial y la escritura. Se reintenta fila a fila.
+                logger.warning('Bulk daily record sync failed, retrying row by row', exc_info=True)
+                failed = DailyRecordSyncService._write_each(pending, results, user)
+                with transaction.atomic():
+                    # Las filas posteriores a una fallida arrastran su saldo: se recalculan desde ahí
+                    for flock_id, date in failed:
+                        cascade_from[flock_id] = min(cascade_from.get(flock_id, date), date)
+                    for flock_id, date in cascade_from.items():
+                        DailyRecordRecomputeService.recompute_from(flocks[flock_id], date)
+            ShedDashboardService.invalidate_on_commit(flock.shed_id for flock in touched_flocks.values())
+
+            for pos, inst in pending:
+                if results[pos]['status'] == 'created':
+                    results[pos]['server_id'] = inst.pk
+
+        # Filas 'exists' que apuntan a registros creados en este mismo lote
+        for pos, record_data in enumerate(records):
+            res = results[pos]
+            if res['status'] == 'exists' and res['server_id'] is None:
+                key = (record_data['flock_id'], record_data['date'])
+                if key in failed:
+                    results[pos] = {'client_id': res['client_id'], 'status': 'error', 'message': failed[key]}
+                else:
+                    res['server_id'] = history[key[0]][key[1]]['_instance'].pk
+
+        return results
+
+    @staticmethod
+    def _write(instances, user):
+        """Inserta los registros con bulk_create y pasa sus salidas por el libro de movimientos."""
+        created = DailyRecord.objects.bulk_create(instances)
+
+        # Backends sin RETURNING (MySQL) no asignan pk en bulk_create
+        if any(inst.pk is None for inst in created):
+            ids = {
+                (fid, d): pk for pk, fid, d in DailyRecord.objects.filter(
+                    flock_id__in={inst.flock_id for inst in created},
+                    date__in={inst.date for inst in created},
+                ).values_list('id', 'flock_id', 'date')
+            }
+            for inst in created:
+                inst.pk = ids.get((inst.flock_id, inst.date))
+
+        # Igual que DailyRecord.save(): mortalidad y salidas a proceso pasan por el libro
+        HeadcountLedger.apply(
+            FlockMovement(
+                flock_id=inst.flock_id,
+                movement_type=movement_type,
+                date=inst.date,
+                delta_total=-total,
+                delta_male=-male,
+                delta_female=-female,
+                source_type='daily_record',
+                source_id=inst.pk,
+                recorded_by=user,
+            )
+            for inst in created
+            for movement_type, (total, male, female) in inst.headcount_outputs().items()
+        )
+
+    @staticmethod
+    def _write_each(pending, results, user):
+        """Inserta fila a fila, cada una en su savepoint; devuelve {(lote, fecha): mensaje} de las fallidas."""
+        failed = {}
+        for pos, inst in pending:
+            try:
+                with transaction.atomic():
+                    # bulk_create pudo asignar pk antes del rollback del intento en lote
+                    inst.pk = None
+                    DailyRecordSyncService._write([inst], user)
+            except DatabaseError as e:
+                inst.pk = None
+                failed[(inst.flock_id, inst.date)] = str(e)
+                results[pos] = {
+                    'client_id': results[pos]['client_id'],
+                    'status': 'error',
+                    'message': str(e),
+                }
+        return failed
+
+    @staticmethod
+    def _build_record(flock, record_data, prev, week_ago, user):
+        """Construye el DailyRecord con los mismos cálculos que el flujo fila a fila."""
+        if prev:
+            prev_male = prev['balance_male']
+            prev_female = prev['balance_female']
+            prev_accum_male = float(prev['accumulated_feed_per_bird_gr_male'] or 0)
+            prev_accum_female = float(prev['accumulated_feed_per_bird_gr_female'] or 0)
+            prev_weight_male = float(prev['weight_male']) if prev['weight_male'] else None
+            prev_weight_female = float(prev['weight_female']) if prev['weight_female'] else None
+        else:
+            # Mismo saldo de apertura que DailyRecordRecomputeService.recompute_from
+            prev_male = flock.initial_quantity_male
+            prev_female = flock.initial_quantity_female
+            prev_accum_male = 0
+            prev_accum_female = 0
+            prev_weight_male = float(flock.initial_weight_male or flock.initial_weight or 0)
+            prev_weight_female = float(flock.initial_weight_female or flock.initial_weight or 0)
+
+        balance_male = prev_male - record_data.get('mortality_male', 0) - record_data.get('process_output_male', 0)
+        balance_female = prev_female - record_data.get('mortality_female', 0) - record_data.get('process_output_female', 0)
+
+        feed_per_bird_male = 0
+        feed_per_bird_female = 0
+        if balance_male > 0 and record_data.get('feed_consumed_kg_male', 0) > 0:
+            feed_per_bird_male = (float(record_data['feed_consumed_kg_male']) * 1000) / balance_male
+        if balance_female > 0 and record_data.get('feed_consumed_kg_female', 0) > 0:
+            feed_per_bird_female = (float(record_data['feed_consumed_kg_female']) * 1000) / balance_female
+
+        weight_male = record_data.get('weight_male')
+        weight_female = record_data.get('weight_female')
+
+        weekly_gain_male = None
+        weekly_gain_female = None
+        daily_gain_male = None
+        daily_gain_female = None
+
+        if weight_male is not None:
+            if week_ago and week_ago['weight_male']:
+                weekly_gain_male = float(weight_male) - float(week_ago['weight_male'])
+            if prev_weight_male is not None:
+                daily_gain_male = float(weight_male) - prev_weight_male
+
+        if weight_female is not None:
+            if week_ago and week_ago['weight_female']:
+                weekly_gain_female = float(weight_female) - float(week_ago['weight_female'])
+            if prev_weight_female is not None:
+                daily_gain_female = float(weight_female) - prev_weight_female
+
+        instance = DailyRecord(
+            flock=flock,
+            date=record_data['date'],
+            week_number=0,
+            day_number=0,
+            mortality_male=record_data.get('mortality_male', 0),
+            mortality_female=record_data.get('mortality_female', 0),
+            process_output_male=record_data.get('process_output_male', 0),
+            process_output_female=record_data.get('process_output_female', 0),
+            balance_male=max(0, balance_male),
+            balance_female=max(0, balance_female),
+            feed_consumed_kg_male=record_data.get('feed_consumed_kg_male', 0),
+            feed_consumed_kg_female=record_data.get('feed_consumed_kg_female', 0),
+            accumulated_feed_per_bird_gr_male=prev_accum_male + feed_per_bird_male,
+            accumulated_feed_per_bird_gr_female=prev_accum_female + feed_per_bird_female,
+            weight_male=weight_male,
+            weight_female=weight_female,
+            weekly_weight_gain_male=weekly_gain_male,
+            weekly_weight_gain_female=weekly_gain_female,
+            daily_avg_weight_gain_male=daily_gain_male,
+            daily_avg_weight_gain_female=daily_gain_female,
+            temperature=record_data.get('temperature'),
+            notes=record_data.get('notes', ''),
+            recorded_by=user,
+            client_id=record_data.get('client_id'),
+        )
+        instance.calculate_derived_fields()
+
+        for field in DECIMAL_FIELDS:
+            setattr(instance, field.attname, as_stored_decimal(field, getattr(instance, field.attname)))
+
+        # Sin save() no hay restricciones de BD por fila: validar en memoria para
+        # que una fila inválida no tumbe todo el bulk_create
+        instance.clean_fields(exclude=['flock', 'recorded_by'])
+
+        return instance
+
+
+RECOMPUTED_FIELDS = [
+    'week_number', 'day_number',
+    'balance_male', 'balance_female',
+    'feed_per_bird_gr_male', 'feed_per_bird_gr_female',
+    'accumulated_feed_per_bird_gr_male', 'accumulated_feed_per_bird_gr_female',
+    'weekly_weight_gain_male', 'weekly_weight_gain_female',
+    'daily_avg_weight_gain_male', 'daily_avg_weight_gain_female',
+    'feed_conversion_male', 'feed_conversion_female',
+    # bulk_update no aplica auto_now; sin esto el ETag del resumen no cambia
+    'updated_at',
+]
+
+
+def _weights(values):
+    """Pesos como array float con NaN donde no hay dato."""
+    return np.array([float(v) if v is not None else np.nan for v in values], dtype=float)
+
+
+class DailyRecordRecomputeService:
+    """Recalcula en cascada los valores derivados de la serie de un lote.
+
+    Los saldos, el consumo acumulado, las ganancias de peso y la conversión de cada
+    DailyRecord dependen del registro anterior. Cuando se inserta o edita un día en
+    medio del historial, todos los posteriores quedan desactualizados; este servicio
+    recalcula sólo ese sufijo en una pasada vectorizada y lo persiste con bulk_update.
+    """
+
+    @staticmethod
+    def recompute_from(flock, start_date=None):
+        """Recalcula los registros del lote con fecha >= start_date.
+
+        Si no hay registro anterior a start_date la serie parte de las cantidades y
+        pesos iniciales del lote. Devuelve el número de registros actualizados.
+        """
+        week = timedelta(days=7)
+        qs = DailyRecord.objects.filter(flock=flock)
+        if start_date is not None:
+            qs = qs.filter(date__gte=start_date - week)
+        window = list(qs.order_by('date'))
+
+        if start_date is None:
+            head, suffix = [], window
+        else:
+            split = bisect.bisect_left([r.date for r in window], start_date)
+            head, suffix = window[:split], window[split:]
+        if not suffix:
+            return 0
+
+        seed = head[-1] if head else None
+        if seed is None and start_date is not None:
+            seed = DailyRecord.objects.filter(flock=flock, date__lt=start_date).order_by('-date').first()
+
+        n = len(suffix)
+        ordinals = np.array([r.date.toordinal() for r in window], dtype=np.int64)
+        offset = len(head)
+
+        for sex in ('male', 'female'):
+            if seed is not None:
+                opening = getattr(seed, f'balance_{sex}')
+                accum0 = float(getattr(seed, f'accumulated_feed_per_bird_gr_{sex}') or 0)
+                seed_weight = getattr(seed, f'weight_{sex}')
+                prev_weight0 = float(seed_weight) if seed_weight else np.nan
+            else:
+                opening = getattr(flock, f'initial_quantity_{sex}')
+                accum0 = 0.0
+                prev_weight0 = float(getattr(flock, f'initial_weight_{sex}') or flock.initial_weight or 0)
+
+            outputs = np.array(
+                [(getattr(r, f'mortality_{sex}') or 0) + (getattr(r, f'process_output_{sex}') or 0) for r in suffix],
+                dtype=np.int64,
+            )
+            balance = np.maximum(0, opening - np.cumsum(outputs))
+
+            feed_kg = np.array([float(getattr(r, f'feed_consumed_kg_{sex}') or 0) for r in suffix], dtype=float)
+            has_feed = (balance > 0) & (feed_kg > 0)
+            feed_per_bird = np.divide(feed_kg * 1000, balance, out=np.zeros(n), where=has_feed)
+            accum = accum0 + np.cumsum(feed_per_bird)
+
+            all_weights = _weights([getattr(r, f'weight_{sex}') for r in window])
+            weight = all_weights[offset:]
+
+            # Peso del registro anterior (0 cuenta como "sin peso", igual que la sincronización)
+            prev_weight = np.concatenate(([prev_weight0], weight[:-1]))
+            prev_weight[prev_weight == 0] = np.nan
+            daily_gain = weight - prev_weight
+
+            # Peso exactamente 7 días antes, buscado dentro de la ventana cargada
+            target = ordinals[offset:] - 7
+            pos = np.searchsorted(ordinals, target)
+            found = (pos < len(window)) & (ordinals[np.minimum(pos, len(window) - 1)] == target)
+            week_ago = np.where(found, all_weights[np.minimum(pos, len(window) - 1)], np.nan)
+            week_ago[week_ago == 0] = np.nan
+            weekly_gain = weight - week_ago
+
+            initial_w = float(getattr(flock, f'initial_weight_{sex}') or flock.initial_weight or 0)
+            gain_total = weight - initial_w
+            has_fc = (weight > 0) & (accum > 0) & (gain_total > 0)
+            conversion = np.divide(accum, gain_total, out=np.full(n, np.nan), where=has_fc)
+
+            for i, record in enumerate(suffix):
+                setattr(record, f'balance_{sex}', int(balance[i]))
+                setattr(record, f'feed_per_bird_gr_{sex}', float(feed_per_bird[i]))
+                setattr(record, f'accumulated_feed_per_bird_gr_{sex}', float(accum[i]))
+                setattr(record, f'daily_avg_weight_gain_{sex}', None if np.isnan(daily_gain[i]) else float(daily_gain[i]))
+                setattr(record, f'weekly_weight_gain_{sex}', None if np.isnan(weekly_gain[i]) else float(weekly_gain[i]))
+                setattr(record, f'feed_conversion_{sex}', None if np.isnan(conversion[i]) else float(conversion[i]))
+
+        days = ordinals[offset:] - flock.arrival_date.toordinal()
+        decimal_fields = [f for f in DECIMAL_FIELDS if f.name in RECOMPUTED_FIELDS]
+        now = timezone.now()
+        for i, record in enumerate(suffix):
+            record.updated_at = now
+            record.day_number = int(days[i])
+            record.week_number = int(days[i] // 7) + 1
+            for field in decimal_fields:
+                setattr(record, field.attname, as_stored_decimal(field, getattr(record, field.attname)))
+
+        # Los contadores del lote no se tocan: salen del libro de movimientos, no de la serie
+        DailyRecord.objects.bulk_update(suffix, RECOMPUTED_FIELDS, batch_size=500)
+
+        return n
+
+    @staticmethod
+    def recompute_all(flock_ids=None, start_date=None):
+        """Reparación masiva: recalcula la serie completa (o desde start_date) de cada lote."""
+        flocks = Flock.objects.filter(daily_records__isnull=False).distinct()
+        if flock_ids:
+            flocks = flocks.filter(id__in=flock_ids)
+
+        summary = {'flocks': 0, 'records': 0}
+        for flock in flocks.iterator():
+            summary['records'] += DailyRecordRecomputeService.recompute_from(flock, start_date)
+            summary['flocks'] += 1
+        return summary
+
+
+def _pair_avg(field):
+    """Promedio machos/hembras como en la hoja: si falta uno de los dos, se usa el otro."""
+    male, female = F(f'{field}_male'), F(f'{field}_female')
+    return Cast(Case(
+        When(**{f'{field}_male__gt': 0, f'{field}_female__gt': 0}, then=(male + female) / 2),
+        When(**{f'{field}_male__gt': 0}, then=male),
+        default=Coalesce(female, Value(0, output_field=DecimalField())),
+    ), FloatField())
+
+
+def _pair_sum(field):
+    return F(f'{field}_male') + F(f'{field}_female')
+
+
+class DailyRecordSummaryService:
+    """Resúmenes consolidados (machos + hembras) de la serie diaria, calculados en la base de datos."""
+
+    DAILY_COLUMNS = (
+        'date', 'week', 'day', 'mortality_total', 'process_output_total', 'balance_total',
+        'feed_consumed_kg_total', 'weight_avg', 'feed_conversion_avg',
+    )
+
+    WEEKLY_COLUMNS = (
+        'week', 'date_from', 'date_to', 'days', 'mortality_total', 'process_output_total', 'balance_total',
+        'feed_consumed_kg_total', 'accumulated_feed_per_bird_gr', 'weight_avg', 'feed_conversion_avg',
+    )
+
+    @staticmethod
+    def etag(qs):
+        """ETag de la serie: cambia con cualquier alta, edición o baja de registros."""
+        stamp = qs.aggregate(last=Max('updated_at'), count=Count('id'))
+        last = stamp['last'].isoformat() if stamp['last'] else ''
+        return hashlib.md5(f"{last}:{stamp['count']}".encode()).hexdigest()
+
+    @staticmethod
+    def daily(qs):
+        rows = qs.order_by('date').annotate(
+            mortality_total=_pair_sum('mortality'),
+            process_output_total=_pair_sum('process_output'),
+            balance_total=_pair_sum('balance'),
+            feed_consumed_kg_total=Cast(_pair_sum('feed_consumed_kg'), FloatField()),
+            weight_avg=_pair_avg('weight'),
+            feed_conversion_avg=_pair_avg('feed_conversion'),
+        ).values_list(
+            'date', 'week_number', 'day_number', 'mortality_total', 'process_output_total', 'balance_total',
+            'feed_consumed_kg_total', 'weight_avg', 'feed_conversion_avg',
+        )
+        for row in rows.iterator():
+            yield dict(zip(DailyRecordSummaryService.DAILY_COLUMNS, (row[0].isoformat(),) + row[1:]))
+
+    @staticmethod
+    def weekly(qs):
+        """Tabla semanal de la hoja CONSUMO DIARIO: totales de la semana y valores al cierre."""
+        # Último día de la semana con peso / con conversión, para los valores de cierre
+        week_records = DailyRecord.objects.filter(
+            flock_id=OuterRef('flock_id'), week_number=OuterRef('week_number'),
+        ).order_by('-date')
+        closing_weight = week_records.annotate(v=_pair_avg('weight')).filter(
+            Q(weight_male__gt=0) | Q(weight_female__gt=0)
+        ).values('v')[:1]
+        closing_conversion = week_records.annotate(v=_pair_avg('feed_conversion')).filter(
+            Q(feed_conversion_male__gt=0) | Q(feed_conversion_female__gt=0)
+        ).values('v')[:1]
+
+        rows = qs.values('flock_id', 'week_number').order_by('week_number').annotate(
+            date_from=Min('date'),
+            date_to=Max('date'),
+            days=Count('id'),
+            mortality_total=Sum(_pair_sum('mortality')),
+            process_output_total=Sum(_pair_sum('process_output')),
+            # El saldo solo baja y el consumo acumulado solo sube dentro de la serie
+            balance_total=Min(_pair_sum('balance')),
+            feed_consumed_kg_total=Cast(Sum(_pair_sum('feed_consumed_kg')), FloatField()),
+            accumulated_feed_per_bird_gr=Max(_pair_avg('accumulated_feed_per_bird_gr')),
+            weight_avg=Coalesce(Subquery(closing_weight, output_field=FloatField()), Value(0.0)),
+            feed_conversion_avg=Subquery(closing_conversion, output_field=FloatField()),
+        ).values_list(
+            'week_number', 'date_from', 'date_to', 'days', 'mortality_total', 'process_output_total',
+            'balance_total', 'feed_consumed_kg_total', 'accumulated_feed_per_bird_gr', 'weight_avg',
+            'feed_conversion_avg',
+        )
+        for row in rows.iterator():
+            yield dict(zip(
+                DailyRecordSummaryService.WEEKLY_COLUMNS,
+                row[:1] + (row[1].isoformat(), row[2].isoformat()) + row[3:],
+            ))
@@ -0,0 +1,158 @@
+"""
+Dashboard de galpones construido con una sola consulta anotada y cacheado por alcance.
+
+La clave de caché combina los galpones visibles para el usuario con una versión por
+galpón. Las escrituras de lotes, pesajes y registros diarios cambian la versión de su
+galpón al confirmar la transacción, así que un dashboard cacheado solo se descarta
+cuando cambió algo de lo que muestra y dos usuarios con alcances distintos nunca
+comparten respuesta.
+"""
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, DateField, F, OuterRef, Q, Subquery, Sum, Value
+from django.utils import timezone
+
+from apps.farms.models import Shed
+
+from .models import DailyWeightRecord
+
+
+VERSION_KEY = 'flocks:dashboard:shed:{}'
+PAYLOAD_KEY = 'flocks:dashboard:{}'
+
+# Alarmas pendientes: pesajes de la última semana con desviación mayor a este porcentaje
+ALERT_DEVIATION = 10
+
+
+def _cache_seconds():
+    return getattr(settings, 'SHED_DASHBOARD_CACHE_SECONDS', 24 * 3600)
+
+
+class ShedDashboardService:
+    """Construcción y caché del dashboard de galpones."""
+
+    @staticmethod
+    def get(shed_ids):
+        """Dashboard para un conjunto de galpones, desde caché si ninguno cambió."""
+        shed_ids = sorted(set(shed_ids))
+        key = PAYLOAD_KEY.format(ShedDashboardService._scope_key(shed_ids))
+        data = cache.get(key)
+        if data is None:
+            data = ShedDashboardService.build(shed_ids)
+            cache.set(key, data, _cache_seconds())
+        return data
+
+    @staticmethod
+    def build(shed_ids):
+        today = timezone.now().date()
+        active = Q(flocks__status='ACTIVE')
+        last_weight = DailyWeightRecord.objects.filter(flock__shed=OuterRef('pk')).order_by('-date').values('date')[:1]
+        alerts = DailyWeightRecord.objects.filter(
+            flock__shed=OuterRef('pk'),
+            date__gte=today - timedelta(days=7),
+            deviation_percentage__gt=ALERT_DEVIATION,
+        ).values('flock__shed').annotate(n=Count('pk')).values('n')
+
+        rows = Shed.objects.filter(pk__in=shed_ids).annotate(
+            farm_name=F('farm__name'),
+            worker_first=F('assigned_worker__first_name'),
+            worker_last=F('assigned_worker__last_name'),
+            active_count=Count('flocks', filter=active),
+            total_birds=Sum('flocks__current_quantity', filter=active),
+            avg_age=Avg(Value(today, DateField()) - F('flocks__arrival_date'), filter=active),
+            last_weight_date=Subquery(last_weight),
+            pending_alerts=Subquery(alerts),
+        ).order_by('pk').values(
+            'id', 'name', 'capacity', 'occupancy', 'assigned_worker_id', 'farm_name', 'worker_first', 'worker_last',
+            'active_count', 'total_birds', 'avg_age', 'last_weight_date', 'pending_alerts',
+        )
+
+        sheds = []
+        summary = {'total_capacity': 0, 'total_occupancy': 0}
+        alerts_count = 0
+        for row in rows:
+            summary['total_capacity'] += row['capacity']
+            summary['total_occupancy'] += row['occupancy']
+            alerts_count += row['pending_alerts'] or 0
+            sheds.append(ShedDashboardService._shed_payload(row, today))
+
+        return {
+            'summary': summary,
+            'sheds': sheds,
+            'alerts_count': alerts_count,
+            'last_updated': timezone.now().isoformat(),
+        }
+
+    @staticmethod
+    def _shed_payload(row, today):
+        avg_age = row['avg_age']
+        if isinstance(avg_age, timedelta):
+            avg_age = avg_age.total_seconds() / 86400
+        galponero = 'Sin asignar'
+        if row['assigned_worker_id']:
+            galponero = f"{row['worker_first'] or ''} {row['worker_last'] or ''}".strip()
+
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'farm_name': row['farm_name'],
+            'galponero': galponero,
+            'occupancy': {
+                'current': row['occupancy'],
+                'capacity': row['capacity'],
+                'percentage': (row['occupancy'] / row['capacity']) * 100 if row['capacity'] else 0,
+            },
+            'flocks': {
+                'active_count': row['active_count'],
+                'avg_age': avg_age or 0,
+                'total_birds': row['total_birds'] or 0,
+            },
+            'last_activity': {
+                'weight_date': row['last_weight_date'],
+            },
+            'status_indicator': ShedDashboardService._status_indicator(row['last_weight_date'], today),
+        }
+
+    @staticmethod
+    def _status_indicator(last_weight_date, today):
+        if not last_weight_date:
+            return {'color': 'orange', 'message': 'Sin registros'}
+        if last_weight_date == today:
+            return {'color': 'green', 'message': 'Al día'}
+        if last_weight_date == today - timedelta(days=1):
+            return {'color': 'yellow', 'message': 'Pendiente registro'}
+        return {'color': 'red', 'message': 'Registros atrasados'}
+
+    @staticmethod
+    def _scope_key(shed_ids):
+        """Huella del alcance: fecha, galpones y versión actual de cada uno."""
+        keys = [VERSION_KEY.format(shed_id) for shed_id in shed_ids]
+        versions = cache.get_many(keys)
+
+        # Versiones ausentes (nuevas o expulsadas) reciben un valor único, nunca reutilizado
+        missing = {key: time.time_ns() for key in keys if key not in versions}
+        if missing:
+            cache.set_many(missing, None)
+            versions.update(missing)
+
+        scope = ','.join(f'{shed_id}:{versions[key]}' for shed_id, key in zip(shed_ids, keys))
+        # La fecha entra en la huella porque edad e indicadores dependen del día
+        raw = f'{timezone.now().date().isoformat()}|{scope}'
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    @staticmethod
+    def invalidate(shed_ids):
+        shed_ids = {shed_id for shed_id in shed_ids if shed_id}
+        if shed_ids:
+            cache.set_many({VERSION_KEY.format(shed_id): time.time_ns() for shed_id in shed_ids}, None)
+
+    @staticmethod
+    def invalidate_on_commit(shed_ids):
+        """Invalidar tras el commit para no servir datos que la transacción aún puede revertir."""
+        shed_ids = set(shed_ids)
+        transaction.on_commit(lambda: ShedDashboardService.invalidate(shed_ids))
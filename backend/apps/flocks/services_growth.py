@@ -0,0 +1,180 @@
+"""
+Analítica de crecimiento para todos los lotes de una granja o galpón.
+
+Las series de DailyRecord y DailyWeightRecord de todos los lotes se leen con una
+consulta por tabla y se pivotan en matrices lote × edad (días), de modo que la
+ganancia diaria, la conversión acumulada, la desviación contra la curva de la raza
+y las bandas de percentiles se calculan con operaciones vectorizadas sobre toda la
+matriz en lugar de recorrer lote por lote.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .breed_curves import breed_curve_cache
+from .models import DailyRecord, DailyWeightRecord
+from .services_daily_record import _pair_avg, _pair_sum
+
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+SERIES = ('weight', 'expected_weight', 'deviation_pct', 'daily_gain', 'feed_conversion', 'percentile_rank')
+
+BAND_SERIES = ('weight', 'deviation_pct', 'daily_gain', 'feed_conversion')
+
+
+def _as_list(values, digits=2):
+    """Arreglo numpy a lista JSON: NaN se devuelve como None."""
+    return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+
+class GrowthAnalyticsService:
+    """Curvas de crecimiento alineadas por edad para un conjunto de lotes."""
+
+    @staticmethod
+    def analyze(flocks, max_age=None):
+        """Calcular series por lote y bandas por edad.
+
+        flocks: queryset de Flock ya filtrado por alcance (granja/galpón y rol).
+        max_age: edad máxima en días a incluir; por defecto la mayor registrada.
+        """
+        flocks = list(flocks.select_related(None).only('id', 'breed', 'arrival_date', 'initial_weight', 'shed_id').order_by('id'))
+        if not flocks:
+            return {'ages': [], 'flocks': [], 'bands': {}}
+
+        frames = GrowthAnalyticsService._load(flocks, max_age)
+        matrices = GrowthAnalyticsService._compute(flocks, *frames)
+        ages = matrices.pop('ages')
+
+        result_flocks = []
+        for i, flock in enumerate(flocks):
+            series = {name: _as_list(matrices[name][i]) for name in SERIES}
+            observed = np.flatnonzero(~np.isnan(matrices['weight'][i]))
+            latest = None
+            if observed.size:
+                last = observed[-1]
+                latest = {name: series[name][last] for name in SERIES}
+                latest['age'] = int(ages[last])
+            result_flocks.append({
+                'flock_id': flock.id,
+                'shed_id': flock.shed_id,
+                'breed': flock.breed,
+                'arrival_date': flock.arrival_date,
+                'series': series,
+                'latest': latest,
+            })
+
+        return {
+            'ages': ages.tolist(),
+            'flocks': result_flocks,
+            'bands': GrowthAnalyticsService._bands(matrices),
+        }
+
+    @staticmethod
+    def _load(flocks, max_age):
+        """Leer ambas tablas y devolver DataFrames pivotados (lote × edad)."""
+        flock_ids = [f.id for f in flocks]
+
+        daily = pd.DataFrame.from_records(
+            DailyRecord.objects.filter(flock_id__in=flock_ids).annotate(
+                weight_avg=_pair_avg('weight'),
+                feed_kg=_pair_sum('feed_consumed_kg'),
+                balance=_pair_sum('balance'),
+            ).values_list('flock_id', 'day_number', 'weight_avg', 'feed_kg', 'balance').iterator(),
+            columns=['flock_id', 'age', 'weight', 'feed_kg', 'balance'],
+        )
+
+        arrivals = pd.Series({f.id: pd.Timestamp(f.arrival_date) for f in flocks})
+        weighings = pd.DataFrame.from_records(
+            DailyWeightRecord.objects.filter(flock_id__in=flock_ids).values_list('flock_id', 'date', 'average_weight').iterator(),
+            columns=['flock_id', 'date', 'weight'],
+        )
+        if not weighings.empty:
+            weighings['age'] = (pd.to_datetime(weighings['date']) - weighings['flock_id'].map(arrivals)).dt.days
+
+        observed_max = max(
+            int(daily['age'].max()) if not daily.empty else 0,
+            int(weighings['age'].max()) if not weighings.empty else 0,
+        )
+        # Nunca más allá de lo registrado ni del tope configurado, aunque haya fechas erróneas
+        last_age = min(observed_max, getattr(settings, 'FLOCK_GROWTH_MAX_AGE_DAYS', 120))
+        if max_age is not None:
+            last_age = min(last_age, max_age)
+        ages = np.arange(0, last_age + 1)
+
+        def pivot(frame, column):
+            if frame.empty:
+                return pd.DataFrame(np.nan, index=flock_ids, columns=ages)
+            values = frame.assign(**{column: frame[column].astype(float)})
+            table = values.pivot_table(index='flock_id', columns='age', values=column, aggfunc='last')
+            return table.reindex(index=flock_ids, columns=ages)
+
+        # El peso de la hoja diaria tiene prioridad; el pesaje de muestreo completa los huecos
+        weight = pivot(daily, 'weight').where(lambda w: w > 0)
+        weight = weight.combine_first(pivot(weighings, 'weight'))
+        return ages, weight, pivot(daily, 'feed_kg'), pivot(daily, 'balance')
+
+    @staticmethod
+    def _compute(flocks, ages, weight, feed_kg, balance):
+        initial = np.array([float(f.initial_weight or 0) for f in flocks])
+
+        # Edad 0: peso de llegada si no hay registro
+        w = weight.to_numpy(copy=True)
+        if len(ages):
+            w[:, 0] = np.where(np.isnan(w[:, 0]) & (initial > 0), initial, w[:, 0])
+
+        # Ganancia diaria entre pesajes consecutivos, aunque haya días sin pesar en medio
+        age_grid = np.broadcast_to(ages.astype(float), w.shape)
+        seen_age = pd.DataFrame(np.where(np.isnan(w), np.nan, age_grid))
+        prev_weight = pd.DataFrame(w).ffill(axis=1).shift(1, axis=1).to_numpy()
+        prev_age = seen_age.ffill(axis=1).shift(1, axis=1).to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            daily_gain = (w - prev_weight) / (age_grid - prev_age)
+
+        # Conversión acumulada: alimento total / kg de peso ganado por las aves vivas
+        cum_feed_kg = np.nancumsum(feed_kg.to_numpy(), axis=1)
+        birds = balance.where(balance > 0).ffill(axis=1).to_numpy()
+        gained_kg = birds * (w - initial[:, None]) / 1000
+        with np.errstate(invalid='ignore', divide='ignore'):
+            feed_conversion = np.where(gained_kg > 0, cum_feed_kg / gained_kg, np.nan)
+
+        # Curva esperada: una búsqueda por raza, compartida por todos sus lotes
+        curves = {}
+        for breed in {f.breed for f in flocks}:
+            curve = breed_curve_cache.get_curve(breed)
+            curves[breed] = curve.weights_for(ages) if curve else np.full(len(ages), np.nan)
+        expected = np.vstack([curves[f.breed] for f in flocks])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            deviation = np.where(expected > 0, (w - expected) / expected * 100, np.nan)
+
+        # Posición de cada lote frente a los demás de la misma edad; la desviación
+        # normaliza razas distintas, sin curvas cargadas se compara el peso directo
+        rank_basis = w if np.isnan(expected).all() else deviation
+        percentile_rank = pd.DataFrame(rank_basis).rank(axis=0, pct=True).to_numpy() * 100
+
+        return {
+            'ages': ages,
+            'weight': w,
+            'expected_weight': expected,
+            'deviation_pct': deviation,
+            'daily_gain': daily_gain,
+            'feed_conversion': feed_conversion,
+            'percentile_rank': percentile_rank,
+        }
+
+    @staticmethod
+    def _bands(matrices):
+        """Percentiles por edad entre lotes para cada serie."""
+        bands = {}
+        with warnings.catch_warnings():
+            # Edades sin datos en ningún lote devuelven NaN sin advertencia
+            warnings.simplefilter('ignore', RuntimeWarning)
+            for name in BAND_SERIES:
+                matrix = matrices[name]
+                values = np.nanpercentile(matrix, PERCENTILES, axis=0)
+                band = {f'p{p}': _as_list(row) for p, row in zip(PERCENTILES, values)}
+                band['count'] = (~np.isnan(matrix)).sum(axis=0).tolist()
+                bands[name] = band
+        return bands
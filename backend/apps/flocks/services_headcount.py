@@ -0,0 +1,164 @@
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Greatest
+
+from apps.farms.services import ShedOccupancyService
+
+from .models import Flock, FlockMovement
+from .services_dashboard import ShedDashboardService
+
+
+# Campo del movimiento -> contador del lote que ajusta
+COUNTERS = {
+    'delta_total': 'current_quantity',
+    'delta_male': 'current_quantity_male',
+    'delta_female': 'current_quantity_female',
+}
+
+INITIALS = {
+    'delta_total': 'initial_quantity',
+    'delta_male': 'initial_quantity_male',
+    'delta_female': 'initial_quantity_female',
+}
+
+
+def _ledger_sums(queryset, group_by):
+    return queryset.values(group_by).annotate(**{name: Sum(name) for name in COUNTERS})
+
+
+class HeadcountLedger:
+    """Saldos de aves por lote respaldados por el libro FlockMovement.
+
+    Cada escritura bloquea las filas de los lotes afectados, inserta movimientos y ajusta
+    los contadores del lote (y la ocupación de su galpón) con UPDATE basados en F(), de
+    modo que dos dispositivos sincronizando el mismo lote no se pisan: el bloqueo
+    serializa las escrituras sobre la fila solo hasta el commit, y lotes distintos no se
+    bloquean entre sí.
+    """
+
+    @staticmethod
+    def apply(movements, strict=False):
+        """Registrar movimientos y aplicar un delta agregado por lote, en orden de id.
+
+        Con strict=True una salida que deje el total del lote en negativo se rechaza con
+        ValidationError; si no, los contadores se recortan en cero como hacía el despacho.
+        """
+        movements = [m for m in movements if m.delta_total or m.delta_male or m.delta_female]
+        if not movements:
+            return
+
+        per_flock = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+        for m in movements:
+            for name in COUNTERS:
+                per_flock[m.flock_id][name] += getattr(m, name)
+
+        with transaction.atomic():
+            # Bloquear los lotes en orden de id (evita deadlocks entre lotes del mismo batch);
+            # la lectura da también galpón y estado para mantener la ocupación
+            state = {
+                row[0]: row[1:]
+                for row in Flock.objects.select_for_update().filter(pk__in=per_flock).order_by('pk').values_list(
+                    'pk', 'shed_id', 'status', 'current_quantity'
+                )
+            }
+
+            occupancy = defaultdict(int)
+            for flock_id in sorted(state):
+                shed_id, status, available = state[flock_id]
+                deltas = per_flock[flock_id]
+                if strict and available + deltas['delta_total'] < 0:
+                    label = next(m for m in movements if m.flock_id == flock_id).get_movement_type_display()
+                    raise ValidationError(
+                        f"{label} ({-deltas['delta_total']}) excede cantidad actual del lote ({available})"
+                    )
+
+                updates = {
+                    COUNTERS[name]: Greatest(F(COUNTERS[name]) + delta, Value(0))
+                    for name, delta in deltas.items() if delta
+                }
+                Flock.objects.filter(pk=flock_id).update(**updates)
+                occupancy[shed_id] += (
+                    ShedOccupancyService.contribution(status, max(0, available + deltas['delta_total']))
+                    - ShedOccupancyService.contribution(status, available)
+                )
+
+            ShedOccupancyService.adjust(occupancy)
+            FlockMovement.objects.bulk_create(movements)
+            ShedDashboardService.invalidate_on_commit(occupancy)
+
+    @staticmethod
+    def sync_source(flock, source_type, source_id, date, outputs, user=None, created=False, strict=False):
+        """Dejar el libro de un registro origen en las salidas indicadas.
+
+        outputs: {movement_type: (total, machos, hembras)} en aves que salen del lote.
+        Para registros ya existentes se publica solo la diferencia con lo ya registrado,
+        así que editar la mortalidad de un día corrige el saldo en lugar de duplicarlo.
+        """
+        posted = {}
+        if not created:
+            rows = _ledger_sums(FlockMovement.objects.filter(source_type=source_type, source_id=source_id), 'movement_type')
+            posted = {row['movement_type']: row for row in rows}
+
+        movements = []
+        for movement_type, counts in outputs.items():
+            previous = posted.get(movement_type, {})
+            deltas = {name: -count - (previous.get(name) or 0) for name, count in zip(COUNTERS, counts)}
+            movements.append(FlockMovement(
+                flock_id=flock.pk,
+                movement_type=movement_type,
+                date=date,
+                source_type=source_type,
+                source_id=source_id,
+                recorded_by=user,
+                **deltas,
+            ))
+
+        HeadcountLedger.apply(movements, strict=strict)
+        flock.refresh_from_db(fields=list(COUNTERS.values()))
+
+    @staticmethod
+    def reconcile(flock_ids=None):
+        """Reconstruir los contadores de los lotes desde el libro y corregir los que difieran.
+
+        Returns a dict with counts.
+        """
+        flocks = Flock.objects.all()
+        if flock_ids:
+            flocks = flocks.filter(pk__in=flock_ids)
+
+        drifted = [
+            flock.pk for flock, expected in HeadcountLedger._expected_counters(flocks)
+            if any(getattr(flock, field) != value for field, value in expected.items())
+        ]
+        checked = flocks.count()
+
+        if drifted:
+            with transaction.atomic():
+                # Releer bajo bloqueo: movimientos posteriores a la primera pasada no se pierden
+                locked = Flock.objects.select_for_update().filter(pk__in=drifted).order_by('pk')
+                fixed = []
+                for flock, expected in HeadcountLedger._expected_counters(locked):
+                    for field, value in expected.items():
+                        setattr(flock, field, value)
+                    fixed.append(flock)
+                Flock.objects.bulk_update(fixed, list(COUNTERS.values()))
+                ShedOccupancyService.rebuild({flock.shed_id for flock in fixed})
+
+        return {'flocks_checked': checked, 'flocks_fixed': len(drifted)}
+
+    @staticmethod
+    def _expected_counters(flocks):
+        flocks = list(flocks.only('id', 'shed_id', *INITIALS.values(), *COUNTERS.values()))
+        sums = {
+            row['flock_id']: row
+            for row in _ledger_sums(FlockMovement.objects.filter(flock_id__in=[f.pk for f in flocks]), 'flock_id')
+        }
+        for flock in flocks:
+            row = sums.get(flock.pk, {})
+            yield flock, {
+                COUNTERS[name]: max(0, getattr(flock, INITIALS[name]) + (row.get(name) or 0))
+                for name in COUNTERS
+            }
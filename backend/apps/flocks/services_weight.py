@@ -0,0 +1,199 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .breed_curves import breed_curve_cache
+from .models import DailyWeightRecord, Flock, FlockSyncConflict
+from .services_daily_record import as_stored_decimal
+from .services_dashboard import ShedDashboardService
+
+
+# Diferencia máxima (g) para promediar con el registro existente en lugar de reportar conflicto
+AVERAGE_TOLERANCE_GRAMS = Decimal('50')
+
+AVERAGE_WEIGHT_FIELD = DailyWeightRecord._meta.get_field('average_weight')
+DEVIATION_FIELD = DailyWeightRecord._meta.get_field('deviation_percentage')
+
+
+class DailyWeightSyncService:
+    """Sincronización en lote de pesos promedio diarios.
+
+    Carga en una consulta los registros existentes para todos los (lote, fecha) del lote
+    recibido, clasifica cada fila en memoria como creación, promedio o conflicto (en el
+    orden recibido, igual que el flujo fila a fila) y escribe con bulk_create/bulk_update.
+    El peso esperado sale de la curva de la raza en caché.
+    """
+
+    @staticmethod
+    def sync_batch(records, user, device_id):
+        """Procesa los registros y devuelve un resultado por fila en el orden recibido."""
+        results = [None] * len(records)
+        parsed = []
+
+        for pos, record_data in enumerate(records):
+            try:
+                flock_id = int(record_data['flock_id'])
+                date = parse_date(record_data['date'])
+                if date is None:
+                    raise ValueError(f'Invalid date: {record_data["date"]}')
+                weight = Decimal(str(record_data['average_weight']))
+            except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+                results[pos] = DailyWeightSyncService._error(record_data, e)
+                continue
+            parsed.append((pos, record_data, flock_id, date, weight))
+
+        flocks = Flock.objects.in_bulk({p[2] for p in parsed})
+        current = {
+            (r.flock_id, r.date): r for r in DailyWeightRecord.objects.filter(
+                flock_id__in=flocks.keys(),
+                date__in={p[3] for p in parsed},
+            )
+        }
+
+        to_create = {}   # (flock_id, date) -> instancia nueva
+        to_update = {}   # (flock_id, date) -> instancia existente promediada
+        conflicts = []   # (posición, FlockSyncConflict)
+
+        for pos, record_data, flock_id, date, weight in parsed:
+            client_id = record_data.get('client_id')
+            flock = flocks.get(flock_id)
+            if flock is None:
+                results[pos] = DailyWeightSyncService._error(record_data, f'Flock {flock_id} not found')
+                continue
+
+            key = (flock_id, date)
+            existing = current.get(key)
+
+            if existing is not None:
+                if abs(existing.average_weight - weight) < AVERAGE_TOLERANCE_GRAMS:
+                    previous = existing.average_weight
+                    existing.average_weight = as_stored_decimal(AVERAGE_WEIGHT_FIELD, (previous + weight) / 2)
+                    existing.sync_status = 'SYNCED'
+                    try:
+                        DailyWeightSyncService._fill_expected(existing, flock)
+                    except ValidationError as e:
+                        existing.average_weight = previous
+                        results[pos] = DailyWeightSyncService._error(record_data, '; '.join(e.messages))
+                        continue
+                    if key not in to_create:
+                        to_update[key] = existing
+                    results[pos] = {
+                        'client_id': client_id,
+                        'status': 'successful',
+                        'resolution': 'averaged',
+                        'server_id': existing,
+                    }
+                else:
+                    # Persist conflict for manual resolution
+                    conflicts.append((pos, FlockSyncConflict(
+                        source='daily_weight',
+                        client_id=client_id,
+                        payload={
+                            'flock_id': flock_id,
+                            'date': date.isoformat(),
+                            'existing_server_weight': str(existing.average_weight),
+                            'incoming_weight': str(weight),
+                        },
+                        flock_id=flock_id,
+                    )))
+                    results[pos] = {
+                        'client_id': client_id,
+                        'status': 'conflicts',
+                        'error': 'manual_conflict_required',
+                    }
+                continue
+
+            instance = DailyWeightRecord(
+                flock=flock,
+                date=date,
+                average_weight=weight,
+                sample_size=record_data.get('sample_size', 10),
+                recorded_by=user,
+                client_id=client_id,
+                created_by_device=device_id,
+            )
+            try:
+                instance.average_weight = as_stored_decimal(AVERAGE_WEIGHT_FIELD, weight)
+                DailyWeightSyncService._fill_expected(instance, flock)
+            except ValidationError as e:
+                results[pos] = DailyWeightSyncService._error(record_data, '; '.join(e.messages))
+                continue
+
+            current[key] = to_create[key] = instance
+            results[pos] = {
+                'client_id': client_id,
+                'status': 'successful',
+                'server_id': instance,
+            }
+
+        if to_create or to_update or conflicts:
+            DailyWeightSyncService._write(list(to_create.values()), list(to_update.values()), conflicts, results)
+
+        # Las instancias se resuelven a su id una vez escritas
+        for res in results:
+            if isinstance(res.get('server_id'), DailyWeightRecord):
+                res['server_id'] = res['server_id'].pk
+
+        return results
+
+    @staticmethod
+    def _fill_expected(instance, flock):
+        """Peso esperado desde la curva en caché y desviación, como DailyWeightRecord.save()."""
+        if not instance.expected_weight:
+            point = breed_curve_cache.lookup_for_flock(flock, instance.date)
+            instance.expected_weight = point.expected_weight if point else None
+
+        if instance.expected_weight and instance.expected_weight > 0:
+            deviation = abs(instance.average_weight - instance.expected_weight) / instance.expected_weight * 100
+            instance.deviation_percentage = as_stored_decimal(DEVIATION_FIELD, deviation)
+
+        instance.clean_fields(exclude=['flock', 'recorded_by'])
+
+    @staticmethod
+    def _write(created, updated, conflicts, results):
+        from apps.alarms.weight_deviation import WeightDeviationService
+
+        now = timezone.now()
+        for record in updated:
+            record.updated_at = now
+
+        with transaction.atomic():
+            DailyWeightRecord.objects.bulk_create(created)
+            DailyWeightRecord.objects.bulk_update(
+                updated, ['average_weight', 'expected_weight', 'deviation_percentage', 'sync_status', 'updated_at'],
+            )
+
+            if connection.features.can_return_rows_from_bulk_insert:
+                FlockSyncConflict.objects.bulk_create([c for _, c in conflicts])
+            else:
+                # Sin RETURNING no hay forma fiable de recuperar sus ids; son pocos
+                for _, conflict in conflicts:
+                    conflict.save()
+
+            WeightDeviationService.enqueue(
+                (r.flock_id, r.date) for r in created + updated
+                if r.expected_weight and r.deviation_percentage
+            )
+            ShedDashboardService.invalidate_on_commit(r.flock.shed_id for r in created + updated)
+
+        # Backends sin RETURNING (MySQL) no asignan pk en bulk_create
+        if any(r.pk is None for r in created):
+            ids = {
+                (fid, d): pk for pk, fid, d in DailyWeightRecord.objects.filter(
+                    flock_id__in={r.flock_id for r in created},
+                    date__in={r.date for r in created},
+                ).values_list('id', 'flock_id', 'date')
+            }
+            for r in created:
+                r.pk = ids.get((r.flock_id, r.date))
+
+        for pos, conflict in conflicts:
+            results[pos]['server_conflict_id'] = conflict.pk
+
+    @staticmethod
+    def _error(record_data, error):
+        client_id = record_data.get('client_id') if isinstance(record_data, dict) else None
+        return {'client_id': client_id, 'status': 'error', 'error': str(error)}
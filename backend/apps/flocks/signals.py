@@ -0,0 +1,40 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.farms.models import Shed
+from apps.farms.services import ShedOccupancyService
+
+from .breed_curves import breed_curve_cache
+from .models import BreedReference, Flock, DailyWeightRecord, DailyRecord
+from .services_dashboard import ShedDashboardService
+
+
+@receiver(post_save, sender=BreedReference)
+@receiver(post_delete, sender=BreedReference)
+def invalidate_breed_curves(sender, instance, **kwargs):
+    # Cubre ediciones desde el admin o el shell; los flujos masivos invalidan explícitamente
+    breed_curve_cache.invalidate_on_commit()
+
+
+@receiver(post_delete, sender=Flock)
+def release_shed_occupancy(sender, instance, **kwargs):
+    # Los valores en memoria pueden estar desfasados; rebuild_shed_occupancy corrige el desvío
+    ShedOccupancyService.record_change((instance.shed_id, instance.status, instance.current_quantity), None)
+
+
+@receiver(post_save, sender=Shed)
+@receiver(post_save, sender=Flock)
+@receiver(post_delete, sender=Flock)
+@receiver(post_save, sender=DailyWeightRecord)
+@receiver(post_delete, sender=DailyWeightRecord)
+@receiver(post_save, sender=DailyRecord)
+@receiver(post_delete, sender=DailyRecord)
+def invalidate_shed_dashboard(sender, instance, **kwargs):
+    # Los flujos en lote (sincronización, libro de aves) invalidan explícitamente
+    if sender is Shed:
+        shed_id = instance.pk
+    elif sender is Flock:
+        shed_id = instance.shed_id
+    else:
+        shed_id = instance.flock.shed_id
+    ShedDashboardService.invalidate_on_commit([shed_id])
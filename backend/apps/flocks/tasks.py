@@ -0,0 +1,9 @@
+from celery import shared_task
+
+
+@shared_task
+def reconcile_flock_headcounts_task():
+    """Reconstruir los saldos de aves de los lotes desde el libro de movimientos"""
+    from .services_headcount import HeadcountLedger
+
+    return HeadcountLedger.reconcile()
@@ -0,0 +1,63 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.users.models import User
+from apps.farms.models import Farm, Shed
+from apps.flocks.models import Flock, BreedReference, DailyWeightRecord
+from apps.flocks.breed_curves import breed_curve_cache
+
+
+class BreedCurveCacheTests(TestCase):
+    def setUp(self):
+        breed_curve_cache.invalidate()
+        for age, weight in [(7, 180), (14, 460), (21, 900)]:
+            BreedReference.objects.create(breed='Cobb', age_days=age, expected_weight=weight, tolerance_range=10)
+        # Versión vieja desactivada: no debe afectar la curva
+        BreedReference.objects.create(breed='Cobb', age_days=14, expected_weight=999, version=0, is_active=False)
+
+        self.manager = manager = User.objects.create_user(username='mgr', password='pass', identification='BC1')
+        farm = Farm.objects.create(name='Finca BC', location='', farm_manager=manager)
+        shed = Shed.objects.create(name='Galpon BC', farm=farm, capacity=1000)
+        self.arrival = date(2026, 3, 1)
+        self.flock = Flock.objects.create(
+            arrival_date=self.arrival, initial_quantity=100, current_quantity=100,
+            initial_weight=40, breed='Cobb', gender='X', supplier='P', shed=shed,
+        )
+
+    def test_lookup_exact_interpolated_and_out_of_range(self):
+        exact = breed_curve_cache.lookup('Cobb', 14)
+        self.assertEqual(exact.expected_weight, Decimal('460.00'))
+        self.assertFalse(exact.interpolated)
+
+        between = breed_curve_cache.lookup('Cobb', 10)
+        self.assertEqual(between.expected_weight, Decimal('300.00'))
+        self.assertTrue(between.interpolated)
+
+        self.assertIsNone(breed_curve_cache.lookup('Cobb', 30))
+        self.assertIsNone(breed_curve_cache.lookup('Hubbard', 14))
+
+    def test_curve_loaded_once_and_invalidated_on_write(self):
+        breed_curve_cache.lookup('Cobb', 7)
+        with CaptureQueriesContext(connection) as ctx:
+            for age in range(7, 22):
+                breed_curve_cache.lookup('Cobb', age)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        BreedReference.objects.filter(breed='Cobb', age_days=14).update(is_active=False)
+        BreedReference.objects.create(breed='Cobb', age_days=14, expected_weight=500, version=2)
+
+        self.assertEqual(breed_curve_cache.lookup('Cobb', 14).expected_weight, Decimal('500.00'))
+
+    def test_weight_record_uses_cached_curve(self):
+        breed_curve_cache.lookup('Cobb', 7)
+        record = DailyWeightRecord(flock=self.flock, date=self.arrival + timedelta(days=10), average_weight=330, recorded_by=self.manager)
+        with CaptureQueriesContext(connection) as ctx:
+            record.save()
+
+        self.assertEqual(record.expected_weight, Decimal('300.00'))
+        self.assertAlmostEqual(float(record.deviation_percentage), 10.0, places=2)
+        self.assertFalse(any('breedreference' in q['sql'].lower() for q in ctx.captured_queries))
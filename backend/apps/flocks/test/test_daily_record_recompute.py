@@ -0,0 +1,88 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.core.management import call_command
+from rest_framework.test import APITestCase, APIClient
+
+from apps.users.models import User
+from apps.farms.models import Farm, Shed
+from apps.flocks.models import Flock, DailyRecord
+from apps.flocks.services_daily_record import DailyRecordRecomputeService
+
+
+class DailyRecordRecomputeTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='staff', password='pass', identification='RC1', is_staff=True)
+        self.client.force_authenticate(self.user)
+
+        manager = User.objects.create_user(username='mgr', password='pass', identification='RC2')
+        farm = Farm.objects.create(name='Finca RC', location='', farm_manager=manager)
+        shed = Shed.objects.create(name='Galpon RC', farm=farm, capacity=1000)
+        self.arrival = date(2026, 2, 1)
+        self.flock = Flock.objects.create(
+            arrival_date=self.arrival, initial_quantity=100, current_quantity=100,
+            initial_weight=40, breed='Ross', gender='M', supplier='P', shed=shed,
+        )
+
+    def _sync(self, *days, mortality=1):
+        rows = [{
+            'flock_id': self.flock.id,
+            'date': (self.arrival + timedelta(days=d)).isoformat(),
+            'mortality_male': mortality,
+            'feed_consumed_kg_male': '2.00',
+            'weight_male': str(50 + d * 10),
+        } for d in days]
+        return self.client.post('/api/daily-records/bulk-sync/', {'daily_records': rows}, format='json').json()
+
+    def _balances(self):
+        return list(DailyRecord.objects.filter(flock=self.flock).order_by('date').values_list('balance_male', flat=True))
+
+    def test_backdated_sync_cascades_to_later_days(self):
+        self._sync(2, 3, 4)
+        self.assertEqual(self._balances(), [99, 98, 97])
+
+        self._sync(1, mortality=5)
+
+        self.assertEqual(self._balances(), [95, 94, 93, 92])
+        day2 = DailyRecord.objects.get(flock=self.flock, date=self.arrival + timedelta(days=2))
+        self.assertAlmostEqual(float(day2.daily_avg_weight_gain_male), 10.0, places=2)
+        self.flock.refresh_from_db()
+        self.assertEqual(self.flock.current_quantity_male, 92)
+
+    def test_recompute_from_fixes_stale_suffix(self):
+        self._sync(*range(1, 10))
+        stale = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        DailyRecord.objects.filter(flock=self.flock).update(updated_at=stale)
+        DailyRecord.objects.filter(flock=self.flock, date=self.arrival + timedelta(days=3)).update(mortality_male=11)
+
+        updated = DailyRecordRecomputeService.recompute_from(self.flock, self.arrival + timedelta(days=3))
+
+        self.assertEqual(updated, 7)
+        # updated_at avanza en el sufijo para que el ETag del resumen cambie
+        self.assertEqual(DailyRecord.objects.filter(flock=self.flock, updated_at=stale).count(), 2)
+        self.assertEqual(self._balances(), [99, 98, 87, 86, 85, 84, 83, 82, 81])
+        last = DailyRecord.objects.get(flock=self.flock, date=self.arrival + timedelta(days=9))
+        # Ganancia semanal contra el día 2, fuera del sufijo recalculado
+        self.assertAlmostEqual(float(last.weekly_weight_gain_male), 70.0, places=2)
+        expected_accum = sum(2000 / b for b in [99, 98, 87, 86, 85, 84, 83, 82, 81])
+        self.assertAlmostEqual(float(last.accumulated_feed_per_bird_gr_male), expected_accum, delta=0.05)
+
+    def test_first_day_opening_balance_matches_recompute(self):
+        # Salidas anteriores a la primera hoja diaria (p. ej. un despacho) no cambian el saldo de apertura
+        Flock.objects.filter(pk=self.flock.pk).update(current_quantity=90, current_quantity_male=90)
+        self.flock.refresh_from_db()
+        self._sync(1)
+        self.assertEqual(self._balances(), [99])
+
+        DailyRecordRecomputeService.recompute_from(self.flock, self.arrival + timedelta(days=1))
+
+        self.assertEqual(self._balances(), [99])
+
+    def test_management_command_rebuilds_all_flocks(self):
+        self._sync(1, 2, 3)
+        DailyRecord.objects.filter(flock=self.flock).update(balance_male=0, accumulated_feed_per_bird_gr_male=0)
+
+        call_command('recompute_daily_records')
+
+        self.assertEqual(self._balances(), [99, 98, 97])
+        self.assertGreater(float(DailyRecord.objects.order_by('date').last().accumulated_feed_per_bird_gr_male), 0)
@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+
+from rest_framework.test import APITestCase, APIClient
+
+from apps.users.models import User
+from apps.farms.models import Farm, Shed
+from apps.flocks.models import Flock, DailyRecord
+
+
+class DailyRecordSummaryTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='staff', password='pass', identification='SM1', is_staff=True)
+        self.client.force_authenticate(self.user)
+
+        manager = User.objects.create_user(username='mgr', password='pass', identification='SM2')
+        farm = Farm.objects.create(name='Finca SM', location='', farm_manager=manager)
+        shed = Shed.objects.create(name='Galpon SM', farm=farm, capacity=1000)
+        self.arrival = date(2026, 8, 1)
+        self.flock = Flock.objects.create(
+            arrival_date=self.arrival, initial_quantity=200, current_quantity=200,
+            initial_weight=40, breed='Ross', gender='X', supplier='P', shed=shed,
+        )
+        rows = [{
+            'flock_id': self.flock.id,
+            'date': (self.arrival + timedelta(days=d)).isoformat(),
+            'mortality_male': 1,
+            'mortality_female': d % 2,
+            'feed_consumed_kg_male': '2.00',
+            'feed_consumed_kg_female': '1.50',
+            **({'weight_male': str(40 + d * 20), 'weight_female': str(38 + d * 20)} if d % 3 == 0 else {}),
+        } for d in range(1, 11)]
+        self.client.post('/api/daily-records/bulk-sync/', {'daily_records': rows}, format='json')
+        self.url = f'/api/daily-records/summary/?flock={self.flock.id}'
+
+    def test_daily_summary_matches_records(self):
+        resp = self.client.get(self.url)
+
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(len(data), 10)
+        first, third = data[0], data[2]
+        self.assertEqual(first['date'], (self.arrival + timedelta(days=1)).isoformat())
+        self.assertEqual((first['mortality_total'], first['balance_total']), (2, 198))
+        self.assertAlmostEqual(first['feed_consumed_kg_total'], 3.5)
+        self.assertEqual(first['weight_avg'], 0)
+        self.assertAlmostEqual(third['weight_avg'], 99.0)
+
+    def test_weekly_closing_values_skip_days_without_weight(self):
+        daily = self.client.get(self.url).json()
+        weeks = self.client.get(self.url + '&granularity=week').json()
+
+        # El día 10 cierra la semana 2 sin peso: los valores de cierre son los del día 9
+        second, day9 = weeks[1], daily[8]
+        self.assertEqual(second['date_to'], daily[9]['date'])
+        self.assertGreater(day9['feed_conversion_avg'], 0)
+        self.assertAlmostEqual(second['feed_conversion_avg'], day9['feed_conversion_avg'])
+        self.assertAlmostEqual(second['weight_avg'], day9['weight_avg'])
+
+    def test_weekly_rollup_and_etag(self):
+        resp = self.client.get(self.url + '&granularity=week')
+
+        weeks = resp.json()
+        self.assertEqual([w['week'] for w in weeks], [1, 2])
+        first = weeks[0]
+        # Días 1 a 6 en la semana 1
+        self.assertEqual((first['days'], first['date_to']), (6, (self.arrival + timedelta(days=6)).isoformat()))
+        self.assertEqual(first['mortality_total'], 6 + 3)
+        self.assertEqual(first['balance_total'], 200 - 9)
+        self.assertAlmostEqual(first['feed_consumed_kg_total'], 21.0)
+        self.assertAlmostEqual(first['weight_avg'], 159.0)
+
+        etag = resp['ETag']
+        self.assertEqual(self.client.get(self.url + '&granularity=week', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+
+        record = DailyRecord.objects.filter(flock=self.flock).last()
+        record.notes = 'editado'
+        record.save()
+        self.assertEqual(self.client.get(self.url + '&granularity=week', HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,112 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APIClient
+
+from apps.users.models import User
+from apps.farms.models import Farm, Shed
+from apps.flocks.models import Flock, DailyRecord
+from apps.flocks.services_daily_record import DailyRecordSyncService
+
+
+class DailyRecordBulkSyncTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='staff', password='pass', identification='DR1', is_staff=True)
+        self.client.force_authenticate(self.user)
+
+        manager = User.objects.create_user(username='mgr', password='pass', identification='DR2')
+        farm = Farm.objects.create(name='Finca DR', location='', farm_manager=manager)
+        shed = Shed.objects.create(name='Galpon DR', farm=farm, capacity=1000)
+        self.arrival = date(2026, 1, 1)
+        self.flock = Flock.objects.create(
+            arrival_date=self.arrival, initial_quantity=200, current_quantity=200,
+            initial_weight=40, breed='Ross', gender='X', supplier='P', shed=shed,
+        )
+
+    def _row(self, day, **extra):
+        row = {
+            'flock_id': self.flock.id,
+            'date': (self.arrival + timedelta(days=day)).isoformat(),
+            'mortality_male': 1,
+            'mortality_female': 2,
+            'feed_consumed_kg_male': '3.30',
+            'feed_consumed_kg_female': '2.97',
+            'client_id': f'c{day}',
+        }
+        row.update(extra)
+        return row
+
+    def test_unordered_rows_carry_balances_forward(self):
+        rows = [self._row(3), self._row(1, weight_male='80.00'), self._row(2), self._row(8, weight_male='200.00')]
+        resp = self.client.post('/api/daily-records/bulk-sync/', {'daily_records': rows}, format='json')
+
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual(body['successful'], 4)
+        # Detalle en el orden del payload
+        self.assertEqual([d['client_id'] for d in body['details']], ['c3', 'c1', 'c2', 'c8'])
+        self.assertTrue(all(d['server_id'] for d in body['details']))
+
+        records = list(DailyRecord.objects.filter(flock=self.flock).order_by('date'))
+        self.assertEqual([r.balance_male for r in records], [99, 98, 97, 96])
+        self.assertEqual([r.balance_female for r in records], [98, 96, 94, 92])
+        self.assertEqual(records[0].day_number, 1)
+        self.assertEqual(records[-1].week_number, 2)
+        self.assertAlmostEqual(float(records[1].accumulated_feed_per_bird_gr_male), 33.33 + 3300 / 98, places=2)
+        self.assertAlmostEqual(float(records[0].daily_avg_weight_gain_male), 40.0, places=2)
+        # Día 8 compara contra el día 1 (hace una semana)
+        self.assertAlmostEqual(float(records[3].weekly_weight_gain_male), 120.0, places=2)
+
+        self.flock.refresh_from_db()
+        self.assertEqual(self.flock.current_quantity, 96 + 92)
+
+    def test_existing_duplicate_and_missing_flock(self):
+        first = self.client.post('/api/daily-records/bulk-sync/', {'daily_records': [self._row(1)]}, format='json').json()
+        server_id = first['details'][0]['server_id']
+
+        rows = [self._row(1), self._row(2), self._row(2, client_id='dup'), self._row(3, flock_id=999999)]
+        body = self.client.post('/api/daily-records/bulk-sync/', {'daily_records': rows}, format='json').json()
+
+        statuses = [d['status'] for d in body['details']]
+        self.assertEqual(statuses, ['exists', 'created', 'exists', 'error'])
+        self.assertEqual(body['details'][0]['server_id'], server_id)
+        self.assertEqual(body['details'][2]['server_id'], body['details'][1]['server_id'])
+        self.assertEqual(body['errors'], 1)
+
+    def test_conflicting_write_falls_back_to_row_by_row(self):
+        build = DailyRecordSyncService._build_record
+        day2 = self.arrival + timedelta(days=2)
+
+        def racing_build(flock, record_data, *args):
+            # Otro dispositivo guarda el día 2 entre la lectura del historial y la escritura
+            if record_data['date'] == day2:
+                DailyRecord.objects.create(
+                    flock=self.flock, date=day2, mortality_male=3, recorded_by=self.user,
+                    feed_consumed_kg_male=0, feed_consumed_kg_female=0,
+                )
+            return build(flock, record_data, *args)
+
+        rows = [self._row(1), self._row(2), self._row(3), self._row(2, client_id='dup')]
+        with mock.patch.object(DailyRecordSyncService, '_build_record', side_effect=racing_build):
+            body = self.client.post('/api/daily-records/bulk-sync/', {'daily_records': rows}, format='json').json()
+
+        self.assertEqual([d['status'] for d in body['details']], ['created', 'error', 'created', 'error'])
+        self.assertEqual([d['client_id'] for d in body['details']], ['c1', 'c2', 'c3', 'dup'])
+        self.assertEqual(body['errors'], 2)
+
+        # El día 3 se recalcula sobre el día 2 que sí quedó guardado
+        records = list(DailyRecord.objects.filter(flock=self.flock).order_by('date'))
+        self.assertEqual([r.balance_male for r in records], [99, 96, 95])
+        self.assertEqual([r.balance_female for r in records], [98, 98, 96])
+        self.flock.refresh_from_db()
+        self.assertEqual(self.flock.current_quantity, 95 + 96)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        rows = [self._row(day) for day in range(1, 31)]
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post('/api/daily-records/bulk-sync/', {'daily_records': rows}, format='json')
+        self.assertEqual(resp.json()['successful'], 30)
+        self.assertLess(len(ctx.captured_queries), 12)
@@ -1,9 +1,14 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 
 from apps.users.models import Role, User
 from apps.farms.models import Farm, Shed
+from apps.flocks.models import Flock, DailyWeightRecord
 from django.core.cache import cache
 
 
@@ -71,5 +76,60 @@ class ShedDashboardAPITests(APITestCase):
         # Call again immediately
         r2 = self.client.get(url)
         data2 = r2.json()
-        # Because of cache_page(120) the last_updated should be identical
+        # The payload is cached per scope, so last_updated should be identical
         self.assertEqual(data1.get('last_updated'), data2.get('last_updated'))
+
+    def _flock(self, shed, quantity, age):
+        return Flock.objects.create(
+            arrival_date=timezone.now().date() - timedelta(days=age), initial_quantity=quantity,
+            current_quantity=quantity, initial_weight=40, breed='R', gender='X', supplier='P', shed=shed,
+        )
+
+    def test_indicators_come_from_one_query(self):
+        self._flock(self.shed1, 30, age=10)
+        self._flock(self.shed1, 20, age=20)
+        closed = self._flock(self.shed2, 50, age=5)
+        closed.status = 'INACTIVE'
+        closed.save()
+        for i in range(3):
+            self._flock(self.shed2, 10, age=i)
+        DailyWeightRecord.objects.create(
+            flock=Flock.objects.filter(shed=self.shed1).first(), date=timezone.now().date(),
+            average_weight=300, deviation_percentage=15, recorded_by=self.admin,
+        )
+        self.client.force_authenticate(self.admin)
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(reverse('shed-dashboard')).json()
+        # Una consulta para el alcance del usuario y otra para todos los indicadores
+        shed_queries = [q for q in ctx.captured_queries if 'farms_shed' in q['sql']]
+        self.assertEqual(len(shed_queries), 2)
+
+        sheds = {s['id']: s for s in data['sheds']}
+        self.assertEqual(sheds[self.shed1.id]['flocks'], {'active_count': 2, 'avg_age': 15, 'total_birds': 50})
+        self.assertEqual(sheds[self.shed1.id]['occupancy']['current'], 50)
+        self.assertEqual(sheds[self.shed1.id]['status_indicator']['color'], 'green')
+        self.assertEqual(sheds[self.shed2.id]['flocks']['active_count'], 3)
+        self.assertEqual(sheds[self.shed2.id]['status_indicator']['color'], 'orange')
+        self.assertEqual(data['alerts_count'], 1)
+
+    def test_cache_is_per_scope_and_invalidated_by_writes(self):
+        cache.clear()
+        url = reverse('shed-dashboard')
+        self.client.force_authenticate(self.farm_admin)
+        first = self.client.get(url).json()
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(len(self.client.get(url).json()['sheds']), 2)
+
+        # Escribir en un galpón fuera del alcance no descarta el dashboard del administrador de granja
+        with self.captureOnCommitCallbacks(execute=True):
+            self._flock(self.shed2, 10, age=1)
+        self.client.force_authenticate(self.farm_admin)
+        self.assertEqual(self.client.get(url).json()['last_updated'], first['last_updated'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._flock(self.shed1, 10, age=1)
+        refreshed = self.client.get(url).json()
+        self.assertNotEqual(refreshed['last_updated'], first['last_updated'])
+        self.assertEqual(refreshed['sheds'][0]['flocks']['total_birds'], 10)
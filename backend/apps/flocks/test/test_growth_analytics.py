@@ -0,0 +1,99 @@
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APIClient
+
+from apps.users.models import User
+from apps.farms.models import Farm, Shed
+from apps.flocks.breed_curves import breed_curve_cache
+from apps.flocks.models import Flock, BreedReference, DailyRecord, DailyWeightRecord
+
+
+class GrowthAnalyticsTests(APITestCase):
+    def setUp(self):
+        breed_curve_cache.invalidate()
+        BreedReference.objects.create(breed='Ross', age_days=0, expected_weight=40)
+        BreedReference.objects.create(breed='Ross', age_days=10, expected_weight=240)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='staff', password='pass', identification='GA1', is_staff=True)
+        self.client.force_authenticate(self.user)
+
+        manager = User.objects.create_user(username='mgr', password='pass', identification='GA2')
+        self.farm = Farm.objects.create(name='Finca GA', location='', farm_manager=manager)
+        self.shed = Shed.objects.create(name='Galpon GA', farm=self.farm, capacity=5000)
+        self.arrival = date(2026, 9, 1)
+
+    def _flock(self, quantity=100):
+        return Flock.objects.create(
+            arrival_date=self.arrival, initial_quantity=quantity, current_quantity=quantity,
+            initial_weight=40, breed='Ross', gender='X', supplier='P', shed=self.shed,
+        )
+
+    def _day(self, flock, day, weight=None, feed_kg=0, balance=50):
+        DailyRecord.objects.bulk_create([DailyRecord(
+            flock=flock, date=self.arrival + timedelta(days=day), day_number=day, week_number=day // 7 + 1,
+            recorded_by=self.user, weight_male=weight, weight_female=weight,
+            feed_consumed_kg_male=feed_kg, feed_consumed_kg_female=feed_kg,
+            balance_male=balance, balance_female=balance,
+        )])
+
+    def _get(self, **params):
+        return self.client.get('/api/flocks/growth-analytics/', params)
+
+    def test_series_and_bands_for_farm(self):
+        fast, slow = self._flock(), self._flock()
+        for day in range(1, 6):
+            self._day(fast, day, weight=40 + day * 30 if day in (2, 5) else None, feed_kg=1)
+            self._day(slow, day, weight=40 + day * 10 if day == 5 else None, feed_kg=1)
+        DailyWeightRecord.objects.create(flock=slow, date=self.arrival + timedelta(days=3), average_weight=70, recorded_by=self.user)
+
+        resp = self._get(farm=self.farm.id)
+
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual(body['ages'], [0, 1, 2, 3, 4, 5])
+        # below the cap, the axis still stops at the oldest recorded age
+        self.assertEqual(self._get(farm=self.farm.id, max_age=100).json()['ages'], body['ages'])
+        by_id = {f['flock_id']: f for f in body['flocks']}
+        fast_series = by_id[fast.id]['series']
+
+        self.assertEqual(fast_series['weight'], [40.0, None, 100.0, None, None, 190.0])
+        self.assertEqual(fast_series['expected_weight'], [40.0, 60.0, 80.0, 100.0, 120.0, 140.0])
+        # Ganancia repartida entre los días sin pesaje: (190 - 100) / 3
+        self.assertEqual(fast_series['daily_gain'][5], 30.0)
+        self.assertEqual(fast_series['deviation_pct'][2], 25.0)
+        # 10 kg acumulados / (100 aves * 0.15 kg ganados)
+        self.assertEqual(fast_series['feed_conversion'][5], 0.67)
+
+        slow_series = by_id[slow.id]['series']
+        self.assertEqual(slow_series['weight'][3], 70.0)
+        self.assertEqual(by_id[fast.id]['latest']['percentile_rank'], 100.0)
+        self.assertEqual(by_id[slow.id]['latest']['percentile_rank'], 50.0)
+
+        bands = body['bands']['weight']
+        self.assertEqual(bands['count'][5], 2)
+        self.assertEqual(bands['p50'][5], 140.0)
+        self.assertIsNone(bands['p50'][1])
+
+    def test_requires_scope_and_stays_flat_in_queries(self):
+        self.assertEqual(self._get().status_code, 400)
+        self.assertEqual(self._get(shed=self.shed.id, max_age='x').status_code, 400)
+        self.assertEqual(self._get(shed=self.shed.id, max_age=10 ** 9).status_code, 400)
+
+        flocks = [self._flock(quantity=20) for _ in range(12)]
+        DailyRecord.objects.bulk_create([
+            DailyRecord(
+                flock=flock, date=self.arrival + timedelta(days=day), day_number=day, week_number=day // 7 + 1,
+                recorded_by=self.user, weight_male=40 + day * 20, feed_consumed_kg_male=1, balance_male=20,
+            )
+            for flock in flocks for day in range(1, 31)
+        ])
+
+        with CaptureQueriesContext(connection) as ctx:
+            body = self._get(shed=self.shed.id, max_age=20).json()
+
+        self.assertEqual(len(body['flocks']), 12)
+        self.assertEqual(len(body['ages']), 21)
+        self.assertLess(len(ctx.captured_queries), 12)
@@ -0,0 +1,111 @@
+from datetime import date, timedelta
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import TestCase
+
+from apps.users.models import User
+from apps.farms.models import Farm, Shed
+from apps.flocks.models import Flock, FlockMovement, MortalityRecord, DailyRecord, DispatchRecord
+from apps.flocks.services_headcount import HeadcountLedger
+
+
+class HeadcountLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='hc', password='pass', identification='HC1')
+        farm = Farm.objects.create(name='Finca HC', location='', farm_manager=self.user)
+        shed = Shed.objects.create(name='Galpon HC', farm=farm, capacity=1000)
+        self.arrival = date(2026, 6, 1)
+        self.flock = Flock.objects.create(
+            arrival_date=self.arrival, initial_quantity=100, current_quantity=100,
+            initial_weight=40, breed='Ross', gender='X', supplier='P', shed=shed,
+        )
+
+    def _counters(self):
+        self.flock.refresh_from_db()
+        return (self.flock.current_quantity, self.flock.current_quantity_male, self.flock.current_quantity_female)
+
+    def test_mortality_edit_posts_difference_and_rejects_excess(self):
+        record = MortalityRecord.objects.create(flock=self.flock, date=self.arrival, deaths=5, recorded_by=self.user)
+        self.assertEqual(record.flock.current_quantity, 95)
+
+        record.deaths = 8
+        record.save()
+        self.assertEqual(self._counters()[0], 92)
+        self.assertEqual(
+            FlockMovement.objects.filter(source_type='mortality', source_id=record.pk).aggregate(s=Sum('delta_total'))['s'],
+            -8,
+        )
+
+        with self.assertRaisesMessage(ValidationError, 'Mortalidad (500) excede cantidad actual del lote (92)'):
+            MortalityRecord.objects.create(flock=self.flock, date=self.arrival + timedelta(days=1), deaths=500, recorded_by=self.user)
+        self.assertFalse(MortalityRecord.objects.filter(deaths=500).exists())
+        self.assertEqual(self._counters()[0], 92)
+
+    def test_daily_record_and_dispatch_movements(self):
+        DailyRecord.objects.create(
+            flock=self.flock, date=self.arrival + timedelta(days=1), recorded_by=self.user,
+            mortality_male=2, mortality_female=1, process_output_female=4,
+        )
+        self.assertEqual(self._counters(), (93, 48, 45))
+
+        dispatch = DispatchRecord.objects.create(
+            flock=self.flock, dispatch_date=self.arrival + timedelta(days=40), manifest_number='P1',
+            males_count=30, females_count=40, farm_avg_weight=2, farm_total_kg=140, recorded_by=self.user,
+        )
+        self.assertEqual(self._counters(), (23, 18, 5))
+
+        # Corregir el despacho publica solo la diferencia
+        dispatch.females_count = 30
+        dispatch.total_birds = 60
+        dispatch.save()
+        self.assertEqual(self._counters(), (33, 18, 15))
+        self.assertEqual(set(FlockMovement.objects.values_list('movement_type', flat=True)), {'MORTALITY', 'PROCESS_OUTPUT', 'DISPATCH'})
+
+    def test_reconcile_rebuilds_drifted_counters(self):
+        MortalityRecord.objects.create(flock=self.flock, date=self.arrival, deaths=10, recorded_by=self.user)
+        Flock.objects.filter(pk=self.flock.pk).update(current_quantity=70, current_quantity_male=1)
+
+        self.assertEqual(HeadcountLedger.reconcile(), {'flocks_checked': 1, 'flocks_fixed': 1})
+        self.assertEqual(self._counters(), (90, 50, 50))
+
+        call_command('reconcile_headcounts', '--flock', str(self.flock.pk))
+        self.assertEqual(HeadcountLedger.reconcile([self.flock.pk]), {'flocks_checked': 1, 'flocks_fixed': 0})
+
+    def test_legacy_records_edit_posts_only_the_difference(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        opening = import_module('apps.flocks.migrations.0012_flockmovement_opening_balances')
+        legacy = import_module('apps.flocks.migrations.0013_flockmovement_legacy_sources')
+
+        mortality = MortalityRecord.objects.create(flock=self.flock, date=self.arrival, deaths=5, recorded_by=self.user)
+        DailyRecord.objects.create(
+            flock=self.flock, date=self.arrival + timedelta(days=1), recorded_by=self.user, mortality_male=2,
+        )
+        dispatch = DispatchRecord.objects.create(
+            flock=self.flock, dispatch_date=self.arrival + timedelta(days=40), manifest_number='L1',
+            males_count=10, females_count=10, farm_avg_weight=2, farm_total_kg=40, recorded_by=self.user,
+        )
+        # Estado previo al libro: contadores ya descontados y ningún movimiento
+        FlockMovement.objects.all().delete()
+        opening.post_opening_balances(apps, None)
+        legacy.post_legacy_sources(apps, None)
+        self.assertEqual(self._counters(), (73, 38, 40))
+        self.assertEqual(HeadcountLedger.reconcile(), {'flocks_checked': 1, 'flocks_fixed': 0})
+
+        # Guardar sin cambios no descuenta de nuevo; editar publica solo la diferencia
+        mortality.refresh_from_db()
+        mortality.save()
+        self.assertEqual(self._counters(), (73, 38, 40))
+
+        dispatch.refresh_from_db()
+        dispatch.females_count = 5
+        dispatch.total_birds = 15
+        dispatch.save()
+        self.assertEqual(self._counters(), (78, 38, 45))
+
+        # Volver a correr la migración no duplica movimientos
+        legacy.post_legacy_sources(apps, None)
+        self.assertEqual(HeadcountLedger.reconcile(), {'flocks_checked': 1, 'flocks_fixed': 0})
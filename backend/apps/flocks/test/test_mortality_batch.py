@@ -0,0 +1,72 @@
+import pytest
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.alarms.models import Alarm, AlarmConfiguration
+from apps.farms.models import Farm, Shed
+from apps.flocks.models import Flock, FlockMovement, MortalityCause, MortalityRecord
+from apps.flocks.services import MortalityService
+from apps.users.models import Role
+
+
+@pytest.fixture
+def flocks(django_user_model):
+    role_mgr, _ = Role.objects.get_or_create(name='Administrador de Granja')
+    manager = django_user_model.objects.create(username='fmb', identification='id-fmb', role=role_mgr)
+    farm = Farm.objects.create(name='FB', location='', farm_manager=manager)
+    shed = Shed.objects.create(name='SB', farm=farm, capacity=1000)
+    make = lambda qty: Flock.objects.create(arrival_date=date(2026, 7, 1), initial_quantity=qty, current_quantity=qty, initial_weight=40, breed='R', gender='M', supplier='S', shed=shed)
+    return manager, farm, make(100), make(10)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_merges_same_day_and_keeps_per_client_results(flocks):
+    user, farm, big, small = flocks
+    AlarmConfiguration.objects.create(alarm_type='MORTALITY', farm=farm, threshold_value=10, is_active=True)
+    day = date(2026, 7, 2)
+    MortalityRecord.objects.create(flock=big, date=day, deaths=2, recorded_by=user)
+
+    payload = [
+        {'flock_id': big.id, 'date': day.isoformat(), 'deaths': 3, 'client_id': 'a'},
+        {'flock_id': small.id, 'date': day.isoformat(), 'deaths': 4, 'cause_name': 'Calor', 'client_id': 'b'},
+        {'flock_id': small.id, 'date': day.isoformat(), 'deaths': 2, 'client_id': 'c'},
+        {'flock_id': small.id, 'date': (day + timedelta(days=1)).isoformat(), 'deaths': 9, 'client_id': 'd'},
+        {'flock_id': 999999, 'date': day.isoformat(), 'deaths': 1, 'client_id': 'e'},
+        {'flock_id': big.id, 'date': 'ayer', 'deaths': 1, 'client_id': 'f'},
+    ]
+    results = MortalityService.register_mortality_batch(payload, user)
+
+    assert [r['client_id'] for r in results] == ['a', 'b', 'c', 'd', 'e', 'f']
+    assert [r['status'] for r in results] == ['success', 'success', 'success', 'error', 'error', 'error']
+    assert [r.get('action') for r in results[:3]] == ['updated', 'created', 'updated']
+    assert results[1]['server_id'] == results[2]['server_id']
+    assert 'excede cantidad actual del lote (4)' in results[3]['error']
+
+    big.refresh_from_db()
+    small.refresh_from_db()
+    assert (big.current_quantity, small.current_quantity) == (95, 4)
+    merged = MortalityRecord.objects.get(pk=results[1]['server_id'])
+    assert merged.deaths == 6 and merged.cause == MortalityCause.objects.get(name='Calor')
+    assert FlockMovement.objects.filter(flock=big).count() == 2
+
+    # 6 / (4 + 6) = 60% en el lote chico supera el umbral; 5 / 100 en el grande no
+    alarm = Alarm.objects.get(alarm_type='MORTALITY', source_type='mortality')
+    assert alarm.flock_id == small.id and alarm.source_id == merged.pk
+
+
+@pytest.mark.django_db
+def test_batch_query_count_is_flat(flocks):
+    user, farm, big, small = flocks
+    payload = [
+        {'flock_id': big.id, 'date': (date(2026, 7, 1) + timedelta(days=i)).isoformat(), 'deaths': 1, 'cause_name': f'Causa {i % 3}', 'client_id': f'c{i}'}
+        for i in range(30)
+    ]
+    with CaptureQueriesContext(connection) as ctx:
+        results = MortalityService.register_mortality_batch(payload, user)
+
+    assert all(r['status'] == 'success' for r in results)
+    assert len(ctx.captured_queries) < 15
+    big.refresh_from_db()
+    assert big.current_quantity == 70
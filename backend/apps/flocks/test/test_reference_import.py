@@ -0,0 +1,71 @@
+import os
+import tempfile
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from openpyxl import Workbook
+
+from apps.users.models import User
+from apps.flocks.models import BreedReference
+from apps.flocks.services import BreedReferenceService
+
+
+class BreedReferenceBulkImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='pass', identification='IMP1')
+
+    def _write(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        if suffix == '.csv':
+            with open(path, 'w', encoding='utf-8') as fh:
+                fh.write(content)
+        else:
+            wb = Workbook()
+            for row in content:
+                wb.active.append(row)
+            wb.save(path)
+        return path
+
+    def test_csv_import_versions_and_row_errors(self):
+        BreedReference.objects.create(breed='Ross', age_days=7, expected_weight=130, version=2, is_active=False)
+        BreedReference.objects.create(breed='Ross', age_days=7, expected_weight=140, version=3)
+        path = self._write('.csv', '\n'.join([
+            'breed;age_days;expected_weight;expected_consumption;tolerance_range',
+            'Ross;7;150;20;10',
+            'Ross;8;abc;21;10',
+            ';9;170;22;10',
+            'Ross;10;190;;',
+            ';;;;',
+            'Ross;10;195;25;8',
+        ]))
+
+        log = BreedReferenceService.import_from_excel(path, self.user)
+
+        self.assertEqual((log.total_rows, log.successful_imports, log.updates, log.errors), (5, 3, 2, 2))
+        self.assertTrue(log.error_details[0].startswith('row 3: expected_weight'))
+        self.assertEqual(log.error_details[1], 'row 4: required field missing')
+
+        active = {r.age_days: r for r in BreedReference.objects.filter(is_active=True)}
+        self.assertEqual(sorted(active), [7, 10])
+        self.assertEqual(active[7].version, 4)
+        self.assertFalse(BreedReference.objects.get(breed='Ross', age_days=7, version=3).is_active)
+        self.assertEqual((active[10].version, float(active[10].expected_weight)), (2, 195.0))
+        # Fila repetida: la primera versión queda en el historial, inactiva y con valores por defecto
+        first = BreedReference.objects.get(breed='Ross', age_days=10, version=1)
+        self.assertFalse(first.is_active)
+        self.assertEqual(float(first.tolerance_range), 10.0)
+
+    def test_xlsx_import_uses_constant_queries(self):
+        rows = [['breed', 'age_days', 'expected_weight']]
+        rows += [[breed, age, 40 + age * 50] for breed in ('Ross', 'Cobb', 'Hubbard') for age in range(0, 60)]
+        path = self._write('.xlsx', rows)
+
+        with CaptureQueriesContext(connection) as ctx:
+            log = BreedReferenceService.import_from_excel(path, self.user)
+
+        self.assertEqual(log.successful_imports, 180)
+        self.assertEqual(BreedReference.objects.filter(is_active=True).count(), 180)
+        self.assertLess(len(ctx.captured_queries), 10)
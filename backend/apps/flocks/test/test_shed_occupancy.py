@@ -0,0 +1,62 @@
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase
+
+from apps.users.models import User
+from apps.farms.models import Farm, Shed
+from apps.farms.services import ShedOccupancyService
+from apps.flocks.models import Flock, MortalityRecord
+
+
+class ShedOccupancyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='oc', password='pass', identification='OC1')
+        farm = Farm.objects.create(name='Finca OC', location='', farm_manager=self.user)
+        self.shed = Shed.objects.create(name='Galpon OC', farm=farm, capacity=500)
+        self.other = Shed.objects.create(name='Galpon OC2', farm=farm, capacity=500)
+
+    def _flock(self, quantity, shed=None):
+        return Flock.objects.create(
+            arrival_date=date(2026, 7, 1), initial_quantity=quantity, current_quantity=quantity,
+            initial_weight=40, breed='Ross', gender='X', supplier='P', shed=shed or self.shed,
+        )
+
+    def _occupancy(self, shed=None):
+        return Shed.objects.values_list('occupancy', flat=True).get(pk=(shed or self.shed).pk)
+
+    def test_counter_follows_creation_headcount_status_and_delete(self):
+        flock = self._flock(300)
+        self._flock(100)
+        self.assertEqual(self._occupancy(), 400)
+
+        MortalityRecord.objects.create(flock=flock, date=date(2026, 7, 2), deaths=20, recorded_by=self.user)
+        self.assertEqual(self._occupancy(), 380)
+
+        with self.assertRaisesMessage(ValidationError, 'Ocupado: 380'):
+            self._flock(200)
+
+        flock.refresh_from_db()
+        flock.shed = self.other
+        flock.save()
+        self.assertEqual((self._occupancy(), self._occupancy(self.other)), (100, 280))
+
+        flock.status = 'INACTIVE'
+        flock.save(update_fields=['status'])
+        self.assertEqual(self._occupancy(self.other), 0)
+
+        self._flock(50, shed=self.other).delete()
+        self.assertEqual(self._occupancy(self.other), 0)
+
+    def test_rebuild_reports_and_fixes_drift(self):
+        self._flock(120)
+        Shed.objects.filter(pk=self.shed.pk).update(occupancy=7)
+
+        summary = ShedOccupancyService.rebuild(fix=False)
+        self.assertEqual((summary['sheds_checked'], summary['drifted']), (2, [self.shed.pk]))
+        self.assertEqual(self._occupancy(), 7)
+
+        call_command('rebuild_shed_occupancy', '--shed', str(self.shed.pk))
+        self.assertEqual(self._occupancy(), 120)
+        self.assertEqual(ShedOccupancyService.rebuild()['sheds_fixed'], 0)
@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APIClient
+
+from apps.users.models import User
+from apps.farms.models import Farm, Shed
+from apps.alarms.models import WeightDeviationCheck
+from apps.flocks.breed_curves import breed_curve_cache
+from apps.flocks.models import Flock, BreedReference, DailyWeightRecord, FlockSyncConflict
+
+
+class DailyWeightBatchSyncTests(APITestCase):
+    def setUp(self):
+        breed_curve_cache.invalidate()
+        BreedReference.objects.create(breed='Ross', age_days=0, expected_weight=40)
+        BreedReference.objects.create(breed='Ross', age_days=10, expected_weight=240)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='staff', password='pass', identification='WS1', is_staff=True)
+        self.client.force_authenticate(self.user)
+
+        manager = User.objects.create_user(username='mgr', password='pass', identification='WS2')
+        farm = Farm.objects.create(name='Finca WS', location='', farm_manager=manager)
+        shed = Shed.objects.create(name='Galpon WS', farm=farm, capacity=1000)
+        self.arrival = date(2026, 5, 1)
+        self.flock = Flock.objects.create(
+            arrival_date=self.arrival, initial_quantity=100, current_quantity=100,
+            initial_weight=40, breed='Ross', gender='X', supplier='P', shed=shed,
+        )
+
+    def _row(self, day, weight, client_id, **extra):
+        row = {
+            'flock_id': self.flock.id,
+            'date': (self.arrival + timedelta(days=day)).isoformat(),
+            'average_weight': weight,
+            'client_id': client_id,
+        }
+        row.update(extra)
+        return row
+
+    def _sync(self, rows):
+        return self.client.post('/api/daily-weights/bulk-sync/', {'weight_records': rows}, format='json').json()
+
+    def test_create_average_conflict_and_errors_in_one_batch(self):
+        existing = DailyWeightRecord.objects.create(flock=self.flock, date=self.arrival + timedelta(days=2), average_weight=80, recorded_by=self.user)
+        WeightDeviationCheck.objects.all().delete()
+
+        body = self._sync([
+            self._row(5, '150.00', 'new'),
+            self._row(2, '90.00', 'avg'),
+            self._row(2, '300.00', 'conf'),
+            self._row(5, '160.00', 'avg-new'),
+            self._row(3, 'abc', 'bad'),
+            self._row(4, '100', 'missing', flock_id=999999),
+        ])
+
+        self.assertEqual((body['total'], body['successful'], body['conflicts'], body['errors']), (6, 3, 1, 2))
+        statuses = [d['status'] for d in body['details']]
+        self.assertEqual(statuses, ['successful', 'successful', 'conflicts', 'successful', 'error', 'error'])
+        self.assertEqual(body['details'][1]['server_id'], existing.id)
+        self.assertEqual(body['details'][3]['server_id'], body['details'][0]['server_id'])
+
+        existing.refresh_from_db()
+        self.assertEqual(float(existing.average_weight), 85.0)
+        self.assertEqual(float(existing.expected_weight), 80.0)
+
+        created = DailyWeightRecord.objects.get(pk=body['details'][0]['server_id'])
+        # Día 5 interpolado en la curva: 40 + 5 * 20 = 140 g
+        self.assertEqual(float(created.expected_weight), 140.0)
+        self.assertEqual(float(created.average_weight), 155.0)
+        self.assertAlmostEqual(float(created.deviation_percentage), 10.71, places=2)
+
+        conflict = FlockSyncConflict.objects.get(pk=body['details'][2]['server_conflict_id'])
+        self.assertEqual(conflict.payload['existing_server_weight'], '85.00')
+        self.assertEqual(WeightDeviationCheck.objects.count(), 2)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        rows = [self._row(day, '100.00', f'c{day}') for day in range(1, 41)]
+        with CaptureQueriesContext(connection) as ctx:
+            body = self._sync(rows)
+        self.assertEqual(body['successful'], 40)
+        self.assertLess(len(ctx.captured_queries), 12)
@@ -4,6 +4,8 @@ from .models import Flock
 from .serializers import FlockSerializer
 from .permissions import IsAssignedShedWorkerOrFarmAdmin
 from .mixins import RoleFilteredMixin
+from .services_growth import GrowthAnalyticsService
+from django.conf import settings
 from django.utils import timezone
 from apps.alarms.models import Alarm
 from apps.alarms.services import AlarmNotificationService
@@ -41,6 +43,32 @@ class FlockViewSet(RoleFilteredMixin, viewsets.ModelViewSet):
 
         return self.apply_role_filter(qs)
 
+    @action(detail=False, methods=['get'], url_path='growth-analytics')
+    def growth_analytics(self, request):
+        """Curvas de crecimiento de todos los lotes de una granja o galpón alineadas por edad.
+
+        Requiere `farm` o `shed`; acepta `status` y `max_age` (días, hasta
+        FLOCK_GROWTH_MAX_AGE_DAYS). Devuelve por lote
+        peso, ganancia diaria, conversión acumulada, desviación contra la curva de la raza
+        y percentil frente a los demás lotes, más bandas de percentiles por edad.
+        """
+        if not (request.query_params.get('farm') or request.query_params.get('shed')):
+            return Response({'detail': 'farm or shed param required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_age = request.query_params.get('max_age')
+        if max_age is not None:
+            try:
+                max_age = int(max_age)
+            except (TypeError, ValueError):
+                max_age = -1
+            if max_age < 0:
+                return Response({'detail': 'max_age must be a non-negative integer'}, status=status.HTTP_400_BAD_REQUEST)
+            max_age_cap = getattr(settings, 'FLOCK_GROWTH_MAX_AGE_DAYS', 120)
+            if max_age > max_age_cap:
+                return Response({'detail': f'max_age must not exceed {max_age_cap}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(GrowthAnalyticsService.analyze(self.get_queryset(), max_age=max_age))
+
     @action(detail=True, methods=['post'], url_path='mark-inactive')
     def mark_inactive(self, request, pk=None):
         """Marcar un lote como inactivo y notificar a las partes interesadas.
@@ -120,6 +148,7 @@ from .models import BreedReference
 from .serializers import BreedReferenceSerializer, ReferenceImportLogSerializer
 from .permissions import IsAssignedShedWorkerOrFarmAdmin
 from .services import BreedReferenceService
+from .breed_curves import breed_curve_cache
 
 
 class BreedReferenceViewSet(viewsets.ModelViewSet):
@@ -139,10 +168,11 @@ class BreedReferenceViewSet(viewsets.ModelViewSet):
             new_version = 1 if not last else last.version + 1
 
             serializer.save(created_by=user, version=new_version, is_active=True)
+            breed_curve_cache.invalidate_on_commit()
 
     @action(detail=False, methods=['post'], url_path='import-excel')
     def import_excel(self, request):
-        """Upload an Excel file and import breed references. Returns import log summary."""
+        """Upload an Excel (.xlsx) or CSV file and import breed references. Returns import log summary."""
         uploaded = request.FILES.get('file')
         if not uploaded:
             return Response({'detail': 'file required'}, status=status.HTTP_400_BAD_REQUEST)
@@ -61,6 +61,6 @@ class DispatchRecordViewSet(RoleFilteredMixin, RecordedByMixin, viewsets.ModelVi
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
 
-        # En update, no actualizar el lote de nuevo (ya se restaron los pollos)
-        serializer.save(_skip_flock_update=True)
+        # En update el libro de movimientos publica solo la diferencia con el despacho original
+        serializer.save()
         return Response(serializer.data)
@@ -0,0 +1,36 @@
+"""
+Management command to populate FoodBatchAllocation from the fifo_details JSON
+of consumption records created before the allocation table existed.
+
+Records that already have allocations are skipped, so it is safe to re-run.
+
+Usage:
+    python manage.py backfill_fifo_allocations
+    python manage.py backfill_fifo_allocations --batch-size 5000
+"""
+from django.core.management.base import BaseCommand
+
+from apps.inventory.services import FoodTraceabilityService
+
+
+class Command(BaseCommand):
+    help = 'Create FIFO batch allocations from the fifo_details JSON of existing consumption records'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Consumption records processed per bulk insert',
+        )
+
+    def handle(self, *args, **options):
+        summary = FoodTraceabilityService.backfill(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {summary['records_scanned']} records, created {summary['allocations_created']} allocations"
+        ))
+        if summary['missing_batches']:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {summary['missing_batches']} allocations pointing to deleted batches"
+            ))
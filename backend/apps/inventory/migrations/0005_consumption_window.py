@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_foodbatch_foodconsumptionrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='consumption_window_end',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='consumption_window_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_consumption_window'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodBatchAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='inventory.foodbatch')),
+                ('consumption_record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='inventory.foodconsumptionrecord')),
+            ],
+            options={
+                'unique_together': {('consumption_record', 'batch')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_foodbatchallocation'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='foodbatch',
+            name='inventory_f_invento_2f3abe_idx',
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='batch_strategy',
+            field=models.CharField(choices=[('FIFO', 'Primero en entrar, primero en salir'), ('FEFO', 'Primero en vencer, primero en salir')], default='FIFO', max_length=4),
+        ),
+        migrations.AddIndex(
+            model_name='foodbatch',
+            index=models.Index(fields=['inventory_item', 'entry_date', 'current_quantity'], name='foodbatch_fifo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='foodbatch',
+            index=models.Index(fields=['inventory_item', 'expiry_date', 'entry_date', 'current_quantity'], name='foodbatch_fefo_idx'),
+        ),
+    ]
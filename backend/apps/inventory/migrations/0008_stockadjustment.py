@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_batch_strategy_fefo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockAdjustment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('previous_stock', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('new_stock', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('source', models.CharField(choices=[('COUNT', 'Conteo de inventario'), ('ADJUST', 'Ajuste manual')], default='COUNT', max_length=10)),
+                ('reason', models.TextField(blank=True)),
+                ('client_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('adjusted_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('inventory_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_adjustments', to='inventory.inventoryitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['inventory_item', 'created_at'], name='inventory_s_invento_6f9984_idx')],
+            },
+        ),
+    ]
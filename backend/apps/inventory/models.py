@@ -1,12 +1,45 @@
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
 from django.utils import timezone
 from datetime import timedelta
+from decimal import Decimal
 from django.conf import settings
 from django.core.exceptions import ValidationError
 
 from apps.farms.models import Farm, Shed
 
 
+# Estados de stock que generan alerta/alarma
+STOCK_ALERT_STATUSES = ['OUT_OF_STOCK', 'CRITICAL', 'LOW']
+
+# Bajo este porcentaje del stock mínimo el item pasa de LOW a CRITICAL
+CRITICAL_STOCK_RATIO = Decimal('0.3')
+
+
+class InventoryItemQuerySet(models.QuerySet):
+	def with_stock_status(self):
+		"""Anotar stock_status_code en SQL con las mismas reglas que InventoryItem.stock_status"""
+		avg = F('daily_avg_consumption')
+		return self.annotate(stock_status_code=Case(
+			When(current_stock__lte=0, then=Value('OUT_OF_STOCK')),
+			When(current_stock__lt=F('minimum_stock') * CRITICAL_STOCK_RATIO, then=Value('CRITICAL')),
+			When(current_stock__lt=F('minimum_stock'), then=Value('LOW')),
+			When(
+				Q(daily_avg_consumption__gt=0) & (
+					Q(current_stock__lte=avg * F('alert_threshold_days'))
+					| Q(current_stock__lte=avg * F('critical_threshold_days'))
+				),
+				then=Value('WARNING'),
+			),
+			default=Value('NORMAL'),
+			output_field=models.CharField(max_length=20),
+		))
+
+	def stock_alerts(self):
+		"""Solo los items en OUT_OF_STOCK, CRITICAL o LOW, filtrados en la base de datos"""
+		return self.with_stock_status().filter(stock_status_code__in=STOCK_ALERT_STATUSES)
+
+
 class InventoryItem(models.Model):
 	"""Inventario inteligente por granja/galpón con métricas automáticas"""
 	UNIT_CHOICES = [
@@ -15,6 +48,10 @@ class InventoryItem(models.Model):
 		('BAG', 'Sacos'),
 		('LB', 'Libras')
 	]
+	BATCH_STRATEGY_CHOICES = [
+		('FIFO', 'Primero en entrar, primero en salir'),
+		('FEFO', 'Primero en vencer, primero en salir'),
+	]
 
 	name = models.CharField(max_length=100)
 	description = models.TextField(blank=True)
@@ -29,9 +66,19 @@ class InventoryItem(models.Model):
 	last_restock_date = models.DateField(null=True, blank=True)
 	last_consumption_date = models.DateField(null=True, blank=True)
 
+	# Ventana móvil de consumo (ver ConsumptionStatsService): suma de los registros
+	# diarios entre consumption_window_end - 30 días y consumption_window_end
+	consumption_window_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	consumption_window_end = models.DateField(null=True, blank=True)
+
 	alert_threshold_days = models.PositiveIntegerField(default=5)
 	critical_threshold_days = models.PositiveIntegerField(default=2)
 
+	# Orden de consumo de lotes: FEFO (por vencimiento) para productos perecederos
+	batch_strategy = models.CharField(max_length=4, choices=BATCH_STRATEGY_CHOICES, default='FIFO')
+
+	objects = InventoryItemQuerySet.as_manager()
+
 	class Meta:
 		unique_together = ['name', 'farm', 'shed']
 
@@ -44,6 +91,13 @@ class InventoryItem(models.Model):
 			return f"{self.shed.name} ({self.farm.name})"
 		return f"General - {self.farm.name}"
 
+	@property
+	def batch_ordering(self):
+		"""Orden de consumo de los lotes según batch_strategy (sin vencimiento van al final en FEFO)"""
+		if self.batch_strategy == 'FEFO':
+			return [F('expiry_date').asc(nulls_last=True), 'entry_date', 'id']
+		return ['entry_date', 'id']
+
 	@property
 	def projected_stockout_date(self):
 		if self.daily_avg_consumption and self.daily_avg_consumption > 0:
@@ -53,41 +107,60 @@ class InventoryItem(models.Model):
 
 	@property
 	def stock_status(self):
-		if float(self.current_stock) <= 0:
-			return {'status': 'OUT_OF_STOCK', 'color': 'red', 'message': 'Sin stock'}
+		return self.describe_stock_status(self.compute_stock_status_code())
+
+	def compute_stock_status_code(self):
+		"""Estado de stock calculado en Python; InventoryItemQuerySet.with_stock_status es su equivalente SQL"""
+		current, minimum, avg = (
+			Decimal(str(value)) for value in (self.current_stock, self.minimum_stock, self.daily_avg_consumption)
+		)
+
+		if current <= 0:
+			return 'OUT_OF_STOCK'
 
-		# Verificar primero contra el stock mínimo definido
+		# Verificar primero contra el stock mínimo definido (menos del 30% del mínimo = crítico)
+		if current < minimum:
+			return 'CRITICAL' if current < minimum * CRITICAL_STOCK_RATIO else 'LOW'
+
+		# Si hay consumo promedio, usar cálculo basado en días
+		if avg > 0 and current <= avg * max(self.alert_threshold_days, self.critical_threshold_days):
+			return 'WARNING'
+
+		return 'NORMAL'
+
+	def describe_stock_status(self, code):
+		"""Color y mensaje para un código de estado (calculado o anotado por with_stock_status)"""
 		current = float(self.current_stock)
 		minimum = float(self.minimum_stock)
-		
-		# Si el stock actual está por debajo del mínimo
-		if current < minimum:
-			# Calcular qué tan crítico es (% del mínimo)
-			percentage = (current / minimum * 100) if minimum > 0 else 0
-			if percentage < 30:  # Menos del 30% del mínimo = crítico
-				return {'status': 'CRITICAL', 'color': 'red', 'message': f'{current:.1f} {self.unit} (mín: {minimum:.1f})'}
-			else:  # Entre 30% y 100% del mínimo = bajo stock
-				return {'status': 'LOW', 'color': 'orange', 'message': f'{current:.1f} {self.unit} (mín: {minimum:.1f})'}
-		
-		# Si hay consumo promedio, usar cálculo basado en días (solo si estamos sobre el mínimo)
-		if float(self.daily_avg_consumption) > 0 and current >= minimum:
-			days_remaining = current / float(self.daily_avg_consumption)
-			
-			if days_remaining <= self.critical_threshold_days:
-				return {'status': 'WARNING', 'color': 'amber', 'message': f'{days_remaining:.1f} días restantes'}
-			elif days_remaining <= self.alert_threshold_days:
-				return {'status': 'WARNING', 'color': 'amber', 'message': f'{days_remaining:.1f} días restantes'}
-			else:
-				return {'status': 'NORMAL', 'color': 'green', 'message': f'{days_remaining:.1f} días'}
-		
+		avg = float(self.daily_avg_consumption)
+
+		if code == 'OUT_OF_STOCK':
+			return {'status': code, 'color': 'red', 'message': 'Sin stock'}
+		if code in ('CRITICAL', 'LOW'):
+			color = 'red' if code == 'CRITICAL' else 'orange'
+			return {'status': code, 'color': color, 'message': f'{current:.1f} {self.unit} (mín: {minimum:.1f})'}
+		if code == 'WARNING':
+			return {'status': code, 'color': 'amber', 'message': f'{current / avg:.1f} días restantes'}
+		if avg > 0:
+			return {'status': 'NORMAL', 'color': 'green', 'message': f'{current / avg:.1f} días'}
+
 		# Stock normal sin histórico de consumo
 		return {'status': 'NORMAL', 'color': 'green', 'message': f'{current:.1f} {self.unit}'}
 
 	def update_consumption_stats(self, start_date=None, end_date=None):
-		"""Recalcular estadísticas de consumo promedio."""
+		"""Recalcular estadísticas de consumo promedio.
+
+		Sin rango, recalcula la ventana móvil de 30 días (misma ruta que la tarea nocturna);
+		con rango explícito, promedia ese período.
+		"""
 		if start_date is None:
-			end_date = timezone.now().date()
-			start_date = end_date - timedelta(days=30)
+			from .services import ConsumptionStatsService
+			ConsumptionStatsService.refresh([self.pk])
+			self.refresh_from_db(fields=[
+				'daily_avg_consumption', 'last_consumption_date', 'consumption_window_total', 'consumption_window_end',
+			])
+			return
+
 		total = self.consumption_records.filter(date__range=[start_date, end_date]).aggregate(
 			total=models.Sum('quantity_consumed')
 		)['total'] or 0
@@ -122,44 +195,18 @@ class InventoryItem(models.Model):
 		return batch
 
 	def consume_fifo(self, quantity_to_consume, flock=None, user=None):
-		"""Consumir usando FIFO estricto y retornar detalles de trazabilidad"""
+		"""Consumir en orden FIFO (o FEFO según batch_strategy) y retornar detalles de trazabilidad"""
 		if quantity_to_consume <= 0:
 			raise ValidationError("La cantidad a consumir debe ser mayor a 0")
 			
 		if float(self.current_stock) < float(quantity_to_consume):
 			raise ValidationError(f"Stock insuficiente. Disponible: {self.current_stock}, Solicitado: {quantity_to_consume}")
 		
-		# Obtener lotes ordenados por fecha (FIFO) with row-level locking
-		batches = list(
-			self.food_batches.filter(current_quantity__gt=0)
-			.order_by('entry_date')
-			.select_for_update()
-		)
-		
-		remaining_to_consume = float(quantity_to_consume)
-		fifo_details = []
-		updated_batches = []
-		
-		for batch in batches:
-			if remaining_to_consume <= 0:
-				break
-				
-			batch_available = float(batch.current_quantity)
-			consume_from_batch = min(remaining_to_consume, batch_available)
-			
-			# Update batch in memory
-			batch.current_quantity -= consume_from_batch
-			updated_batches.append(batch)
-			
-			# Registrar detalle FIFO
-			fifo_details.append({
-				'batch_id': batch.id,
-				'entry_date': batch.entry_date.isoformat(),
-				'quantity_consumed': consume_from_batch,
-				'batch_remaining': float(batch.current_quantity)
-			})
-			
-			remaining_to_consume -= consume_from_batch
+		from .services import allocate_fifo, lock_batches
+
+		# Bloquear solo los lotes necesarios para cubrir la cantidad, en el orden de la estrategia
+		batches = lock_batches(self, quantity_to_consume)
+		fifo_details, updated_batches = allocate_fifo(batches, quantity_to_consume)
 		
 		# Bulk update all batches at once instead of individual saves
 		if updated_batches:
@@ -183,12 +230,40 @@ class InventoryItem(models.Model):
 				fifo_details=fifo_details,
 				recorded_by=user or flock.created_by
 			)
+			FoodBatchAllocation.objects.bulk_create(FoodBatchAllocation.from_details(consumption_record, fifo_details))
 			
 			return consumption_record, fifo_details
 		
 		return None, fifo_details
 
 
+class StockAdjustment(models.Model):
+	"""Historial de cambios directos de existencia (conteos físicos y ajustes manuales)"""
+	SOURCE_CHOICES = [
+		('COUNT', 'Conteo de inventario'),
+		('ADJUST', 'Ajuste manual'),
+	]
+
+	inventory_item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='stock_adjustments')
+	previous_stock = models.DecimalField(max_digits=12, decimal_places=2)
+	new_stock = models.DecimalField(max_digits=12, decimal_places=2)
+	source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='COUNT')
+	reason = models.TextField(blank=True)
+	client_id = models.CharField(max_length=50, null=True, blank=True)
+	adjusted_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		indexes = [models.Index(fields=['inventory_item', 'created_at'])]
+
+	def __str__(self):
+		return f"Ajuste {self.inventory_item_id}: {self.previous_stock} -> {self.new_stock}"
+
+	@property
+	def quantity_change(self):
+		return self.new_stock - self.previous_stock
+
+
 class FoodBatch(models.Model):
 	"""Lote de alimento para implementar FIFO estricto"""
 	inventory_item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='food_batches')
@@ -202,7 +277,10 @@ class FoodBatch(models.Model):
 	class Meta:
 		ordering = ['entry_date']
 		indexes = [
-			models.Index(fields=['inventory_item', 'entry_date']),
+			# current_quantity al final: el filtro de lotes con existencia se resuelve en el
+			# índice sin leer las filas de lotes agotados (MySQL no admite índices parciales)
+			models.Index(fields=['inventory_item', 'entry_date', 'current_quantity'], name='foodbatch_fifo_idx'),
+			models.Index(fields=['inventory_item', 'expiry_date', 'entry_date', 'current_quantity'], name='foodbatch_fefo_idx'),
 			models.Index(fields=['current_quantity'])
 		]
 	
@@ -244,14 +322,32 @@ class FoodConsumptionRecord(models.Model):
 	
 	def __str__(self):
 		return f"Consumo {self.inventory_item.name} - {self.flock} - {self.date}"
-	
-	def save(self, *args, **kwargs):
-		super().save(*args, **kwargs)
-		# Actualizar métricas del item de inventario
-		try:
-			self.inventory_item.update_consumption_stats()
-		except Exception:
-			pass
+
+
+class FoodBatchAllocation(models.Model):
+	"""Cantidad que un registro de consumo tomó de cada lote FIFO (versión indexada de fifo_details)"""
+	consumption_record = models.ForeignKey(FoodConsumptionRecord, on_delete=models.CASCADE, related_name='allocations')
+	batch = models.ForeignKey(FoodBatch, on_delete=models.CASCADE, related_name='allocations')
+	quantity = models.DecimalField(max_digits=12, decimal_places=2)
+
+	class Meta:
+		unique_together = ['consumption_record', 'batch']
+
+	def __str__(self):
+		return f"{self.quantity} de lote {self.batch_id} en consumo {self.consumption_record_id}"
+
+	@classmethod
+	def from_details(cls, record, details):
+		"""Filas de asignación a partir de los detalles FIFO (batch_id, quantity_consumed) de un registro"""
+		quantities = {}
+		for detail in details or []:
+			batch_id = detail.get('batch_id')
+			if batch_id is not None:
+				quantities[batch_id] = quantities.get(batch_id, Decimal('0')) + Decimal(str(detail.get('quantity_consumed') or 0))
+		return [
+			cls(consumption_record_id=record.pk, batch_id=batch_id, quantity=quantity)
+			for batch_id, quantity in quantities.items()
+		]
 
 
 class InventoryConsumptionRecord(models.Model):
@@ -264,13 +360,28 @@ class InventoryConsumptionRecord(models.Model):
 		unique_together = ['inventory_item', 'date']
 
 	def save(self, *args, **kwargs):
-		super().save(*args, **kwargs)
-		# Después de guardar, actualizar métricas en el item
-		try:
-			self.inventory_item.update_consumption_stats()
-		except Exception:
-			pass
+		from django.db import transaction
+		from .services import ConsumptionStatsService
+
+		with transaction.atomic():
+			previous = None
+			if self.pk:
+				previous = InventoryConsumptionRecord.objects.filter(pk=self.pk).values_list(
+					'inventory_item_id', 'date', 'quantity_consumed'
+				).first()
+			super().save(*args, **kwargs)
 
+			# Ajustar la ventana móvil del item con la diferencia, sin re-sumar 30 días
+			changes = [(self.inventory_item_id, self.date, self.quantity_consumed)]
+			if previous:
+				changes.append((previous[0], previous[1], -previous[2]))
+			ConsumptionStatsService.record_changes(changes)
 
+	def delete(self, *args, **kwargs):
+		from django.db import transaction
+		from .services import ConsumptionStatsService
 
-# Create your models here.
+		with transaction.atomic():
+			result = super().delete(*args, **kwargs)
+			ConsumptionStatsService.record_changes([(self.inventory_item_id, self.date, -self.quantity_consumed)])
+		return result
@@ -1,3 +1,4 @@
+from django.db.models import Q
 from rest_framework.permissions import BasePermission
 
 
@@ -22,3 +23,19 @@ class CanManageInventory(BasePermission):
             return user.assigned_sheds.filter(farm=obj.farm).exists()
 
         return False
+
+    @staticmethod
+    def item_scope(user):
+        """Filtro Q de los items que el usuario puede gestionar, con las mismas reglas que has_object_permission."""
+        role_name = getattr(getattr(user, 'role', None), 'name', None)
+
+        if role_name == 'Administrador Sistema':
+            return Q()
+        if role_name == 'Administrador de Granja':
+            return Q(farm__farm_manager=user)
+        if role_name == 'Galponero':
+            return Q(shed__assigned_worker=user) | Q(
+                shed__isnull=True, farm_id__in=user.assigned_sheds.values('farm_id'),
+            )
+
+        return Q(pk__in=[])
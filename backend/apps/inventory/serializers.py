@@ -19,7 +19,7 @@ class InventoryItemSerializer(serializers.ModelSerializer):
 		fields = [
 			'id', 'name', 'description', 'current_stock', 'unit', 'minimum_stock',
 			'farm', 'shed', 'daily_avg_consumption', 'last_restock_date', 'last_consumption_date',
-			'alert_threshold_days', 'critical_threshold_days', 'projected_stockout_date', 'stock_status'
+			'alert_threshold_days', 'critical_threshold_days', 'batch_strategy', 'projected_stockout_date', 'stock_status'
 		]
 		read_only_fields = ['daily_avg_consumption', 'last_consumption_date', 'projected_stockout_date', 'stock_status']
 
@@ -0,0 +1,592 @@
+import logging
+from collections import defaultdict, deque
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+
+from apps.flocks.models import Flock
+
+from .models import (
+    InventoryItem, FoodBatch, FoodBatchAllocation, FoodConsumptionRecord, InventoryConsumptionRecord, StockAdjustment,
+)
+
+logger = logging.getLogger(__name__)
+
+
+DUPLICATE_MESSAGE = 'Ya existe un registro de consumo para este lote e item en la fecha especificada'
+
+# Días de la ventana móvil de consumo promedio
+WINDOW_DAYS = 30
+
+STATS_FIELDS = ['daily_avg_consumption', 'last_consumption_date', 'consumption_window_total', 'consumption_window_end']
+
+# Lotes bloqueados por consulta al buscar existencias para un consumo
+BATCH_LOCK_CHUNK = 5
+
+
+def lock_batches(item, quantity, chunk_size=BATCH_LOCK_CHUNK):
+    """Bloquear, en el orden de consumo del item (FIFO/FEFO), solo los lotes necesarios para cubrir quantity.
+
+    Los lotes se piden de a chunk_size filas con SELECT ... FOR UPDATE y se deja de
+    pedir en cuanto la existencia acumulada alcanza; en items con historial largo ya no
+    se bloquean todos los lotes con existencia. Devuelve un deque listo para allocate_fifo.
+    """
+    pending = (
+        FoodBatch.objects.select_for_update()
+        .filter(inventory_item_id=item.pk, current_quantity__gt=0)
+        .order_by(*item.batch_ordering)
+    )
+    needed = Decimal(str(quantity))
+    queue = deque()
+    covered = Decimal('0')
+    offset = 0
+    while covered < needed:
+        chunk = list(pending[offset:offset + chunk_size])
+        queue.extend(chunk)
+        covered += sum((batch.current_quantity for batch in chunk), Decimal('0'))
+        if len(chunk) < chunk_size:
+            break
+        offset += chunk_size
+    return queue
+
+
+def allocate_fifo(queue, quantity):
+    """Descontar una cantidad de una cola de lotes (deque de FoodBatch) en orden FIFO.
+
+    Modifica current_quantity de los lotes en memoria, saca de la cola los que se
+    agotan y devuelve (detalles FIFO, lotes tocados).
+    """
+    remaining = Decimal(str(quantity))
+    details = []
+    touched = []
+
+    while remaining > 0 and queue:
+        batch = queue[0]
+        consumed = min(remaining, batch.current_quantity)
+        batch.current_quantity -= consumed
+        remaining -= consumed
+        touched.append(batch)
+        details.append({
+            'batch_id': batch.id,
+            'entry_date': batch.entry_date.isoformat(),
+            'quantity_consumed': float(consumed),
+            'batch_remaining': float(batch.current_quantity),
+        })
+        if batch.current_quantity <= 0:
+            queue.popleft()
+
+    return details, touched
+
+
+class FIFOConsumptionService:
+    """Consumo FIFO en lote: una pasada por item en lugar de una por registro."""
+
+    @staticmethod
+    def consume_batch(entries, user, can_manage=None):
+        """Registrar consumos FIFO de varios lotes e items en una sola transacción.
+
+        entries: dicts validados por FoodConsumptionRequestSerializer.
+        can_manage: callable(item) -> bool para el permiso por objeto; se evalúa una vez por item.
+        Devuelve un resultado por entrada, en el mismo orden.
+        """
+        today = timezone.now().date()
+        results = [None] * len(entries)
+
+        flocks = Flock.objects.in_bulk({e['flock_id'] for e in entries})
+        items = InventoryItem.objects.select_related(
+            'farm__farm_manager', 'shed__assigned_worker',
+        ).in_bulk({e['inventory_item_id'] for e in entries})
+
+        allowed = {}
+        by_item = defaultdict(list)
+        for pos, entry in enumerate(entries):
+            item = items.get(entry['inventory_item_id'])
+            if entry['flock_id'] not in flocks:
+                results[pos] = FIFOConsumptionService._error(entry, 'Lote no encontrado')
+            elif item is None:
+                results[pos] = FIFOConsumptionService._error(entry, 'Item de inventario no encontrado')
+            else:
+                if item.pk not in allowed:
+                    allowed[item.pk] = can_manage is None or can_manage(item)
+                if not allowed[item.pk]:
+                    results[pos] = FIFOConsumptionService._error(entry, 'Sin permisos para este inventario')
+                else:
+                    by_item[item.pk].append(pos)
+
+        if not by_item:
+            return results
+
+        with transaction.atomic():
+            # Bloquear items en orden de id y, por item, solo los lotes que cubren lo solicitado
+            locked = {
+                item.pk: item for item in
+                InventoryItem.objects.select_for_update().filter(pk__in=by_item).order_by('pk')
+            }
+            queues = {}
+            for item_id in sorted(by_item):
+                requested = sum(
+                    (Decimal(str(q)) for q in (entries[pos]['quantity_consumed'] for pos in by_item[item_id]) if q > 0),
+                    Decimal('0'),
+                )
+                queues[item_id] = lock_batches(locked[item_id], min(requested, locked[item_id].current_stock))
+
+            taken = set(FoodConsumptionRecord.objects.filter(
+                flock_id__in={entries[pos]['flock_id'] for positions in by_item.values() for pos in positions},
+                inventory_item_id__in=by_item,
+                date__in={entries[pos].get('date') or today for positions in by_item.values() for pos in positions},
+            ).values_list('flock_id', 'inventory_item_id', 'date'))
+
+            records = []
+            touched_batches = {}
+            for item_id in sorted(by_item):
+                item = locked[item_id]
+                for pos in by_item[item_id]:
+                    entry = entries[pos]
+                    quantity = entry['quantity_consumed']
+                    key = (entry['flock_id'], item_id, entry.get('date') or today)
+
+                    if quantity <= 0:
+                        results[pos] = FIFOConsumptionService._error(entry, 'La cantidad a consumir debe ser mayor a 0')
+                        continue
+                    if item.current_stock < quantity:
+                        results[pos] = FIFOConsumptionService._error(
+                            entry, f'Stock insuficiente. Disponible: {item.current_stock}, Solicitado: {quantity}'
+                        )
+                        continue
+                    if key in taken:
+                        results[pos] = FIFOConsumptionService._error(entry, DUPLICATE_MESSAGE)
+                        continue
+
+                    details, touched = allocate_fifo(queues[item_id], quantity)
+                    touched_batches.update((batch.pk, batch) for batch in touched)
+                    item.current_stock -= quantity
+                    taken.add(key)
+
+                    records.append((pos, FoodConsumptionRecord(
+                        flock_id=key[0],
+                        inventory_item_id=item_id,
+                        date=key[2],
+                        quantity_consumed=quantity,
+                        fifo_details=details,
+                        recorded_by=user or flocks[key[0]].created_by,
+                        client_id=entry.get('client_id'),
+                    )))
+                    results[pos] = {
+                        'client_id': entry.get('client_id'),
+                        'server_id': None,
+                        'status': 'success',
+                        'fifo_details': details,
+                    }
+
+            FoodBatch.objects.bulk_update(touched_batches.values(), ['current_quantity'])
+            consumed_items = {record.inventory_item_id for _, record in records}
+            InventoryItem.objects.bulk_update([locked[pk] for pk in consumed_items], ['current_stock'])
+            FIFOConsumptionService._create_records([record for _, record in records])
+
+        for pos, record in records:
+            results[pos]['server_id'] = record.pk
+
+        if consumed_items:
+            from .services_forecast import StockForecastService
+            StockForecastService.invalidate_on_commit()
+
+        # Métricas de consumo: una consulta agrupada para todos los items, no una por registro
+        if consumed_items:
+            try:
+                ConsumptionStatsService.refresh(consumed_items)
+            except Exception:
+                logger.exception('Error actualizando métricas de consumo de los items %s', sorted(consumed_items))
+
+        return results
+
+    @staticmethod
+    def _create_records(records):
+        FoodConsumptionRecord.objects.bulk_create(records)
+
+        # Backends sin RETURNING (MySQL) no asignan pk en bulk_create
+        if records and not connection.features.can_return_rows_from_bulk_insert:
+            ids = {
+                (fid, iid, d): pk for pk, fid, iid, d in FoodConsumptionRecord.objects.filter(
+                    flock_id__in={r.flock_id for r in records},
+                    inventory_item_id__in={r.inventory_item_id for r in records},
+                    date__in={r.date for r in records},
+                ).values_list('id', 'flock_id', 'inventory_item_id', 'date')
+            }
+            for record in records:
+                record.pk = ids.get((record.flock_id, record.inventory_item_id, record.date))
+
+        FoodBatchAllocation.objects.bulk_create(
+            [allocation for record in records for allocation in FoodBatchAllocation.from_details(record, record.fifo_details)],
+            batch_size=1000,
+        )
+
+    @staticmethod
+    def _error(entry, message):
+        return {
+            'client_id': entry.get('client_id'),
+            'server_id': None,
+            'status': 'error',
+            'error': message,
+        }
+
+
+class StockAdjustmentService:
+    """Conteos de existencia en lote: validación, permisos y escrituras en una pasada."""
+
+    @staticmethod
+    def bulk_set_stock(updates, user):
+        """Fijar current_stock de varios items y registrar el historial de ajustes.
+
+        updates: lista cruda de {inventory_id, new_stock, client_id}; se valida entrada por
+        entrada con un solo serializer. Items y alcance del usuario se leen con una consulta
+        cada uno. Devuelve un resultado por entrada, en el mismo orden.
+        """
+        from rest_framework import serializers
+
+        from .permissions import CanManageInventory
+        from .serializers import BulkStockUpdateSerializer
+
+        validator = BulkStockUpdateSerializer()
+        results = [None] * len(updates)
+        valid = []
+        for pos, data in enumerate(updates):
+            try:
+                valid.append((pos, validator.run_validation(data)))
+            except serializers.ValidationError as exc:
+                results[pos] = StockAdjustmentService._error(data, str(exc.detail))
+            except Exception as exc:
+                results[pos] = StockAdjustmentService._error(data, str(exc))
+
+        if not valid:
+            return results
+
+        target_ids = {entry['inventory_id'] for _, entry in valid}
+        with transaction.atomic():
+            items = InventoryItem.objects.select_for_update().only('id', 'current_stock').in_bulk(target_ids)
+            allowed = set(
+                InventoryItem.objects.filter(CanManageInventory.item_scope(user), pk__in=items)
+                .values_list('pk', flat=True)
+            )
+
+            history = []
+            for pos, entry in valid:
+                item = items.get(entry['inventory_id'])
+                if item is None:
+                    results[pos] = StockAdjustmentService._error(entry, 'InventoryItem matching query does not exist.')
+                    continue
+                if item.pk not in allowed:
+                    results[pos] = StockAdjustmentService._error(entry, 'Sin permisos para actualizar este inventario')
+                    continue
+
+                history.append(StockAdjustment(
+                    inventory_item_id=item.pk,
+                    previous_stock=item.current_stock,
+                    new_stock=entry['new_stock'],
+                    source='COUNT',
+                    client_id=entry.get('client_id'),
+                    adjusted_by=user,
+                ))
+                item.current_stock = entry['new_stock']
+                results[pos] = {'client_id': entry.get('client_id'), 'status': 'success', 'new_stock': float(item.current_stock)}
+
+            changed = [items[pk] for pk in {adjustment.inventory_item_id for adjustment in history}]
+            InventoryItem.objects.bulk_update(changed, ['current_stock'], batch_size=500)
+            StockAdjustment.objects.bulk_create(history, batch_size=500)
+
+        if history:
+            from .services_forecast import StockForecastService
+            StockForecastService.invalidate_on_commit()
+
+        return results
+
+    @staticmethod
+    def _error(entry, message):
+        client_id = entry.get('client_id') if isinstance(entry, dict) else None
+        return {'client_id': client_id, 'status': 'error', 'error': message}
+
+
+class ConsumptionStatsService:
+    """Consumo promedio de 30 días mantenido como ventana móvil por item.
+
+    Los InventoryConsumptionRecord (uno por item y día) son los cubos diarios; el item
+    guarda la suma de la ventana y la fecha en que termina. Insertar, editar o borrar un
+    registro ajusta la suma con la diferencia. Si la ventana no termina hoy (cambió el
+    día desde el último ajuste) o se borró el último día con consumo, el item se
+    recalcula con refresh(), que es también la corrección nocturna de desvíos.
+    """
+
+    @staticmethod
+    def record_changes(changes):
+        """Aplicar cambios (item_id, fecha, delta de cantidad) a la ventana de cada item."""
+        today = timezone.now().date()
+        start = today - timedelta(days=WINDOW_DAYS)
+
+        per_item = defaultdict(list)
+        for item_id, day, delta in changes:
+            per_item[item_id].append((day, Decimal(str(delta))))
+
+        stale = []
+        with transaction.atomic():
+            items = InventoryItem.objects.select_for_update().filter(pk__in=per_item).order_by('pk').only('id', *STATS_FIELDS)
+            updated = []
+            for item in items:
+                item_changes = per_item[item.pk]
+                added = {day for day, delta in item_changes if delta > 0}
+                removed = {day for day, delta in item_changes if delta < 0}
+                if item.consumption_window_end != today or (
+                    item.last_consumption_date in removed and item.last_consumption_date not in added
+                ):
+                    stale.append(item.pk)
+                    continue
+
+                total = item.consumption_window_total + sum(
+                    (delta for day, delta in item_changes if start <= day <= today), Decimal('0')
+                )
+                ConsumptionStatsService._set(item, total, today, max(filter(None, [item.last_consumption_date, *added]), default=None))
+                updated.append(item)
+
+            InventoryItem.objects.bulk_update(updated, STATS_FIELDS)
+            if stale:
+                ConsumptionStatsService.refresh(stale)
+
+    @staticmethod
+    def refresh(item_ids=None):
+        """Recalcular la ventana desde los registros con una consulta agrupada y bulk_update.
+
+        Returns a dict with counts.
+        """
+        today = timezone.now().date()
+        start = today - timedelta(days=WINDOW_DAYS)
+
+        records = InventoryConsumptionRecord.objects.all()
+        items = InventoryItem.objects.only('id', *STATS_FIELDS).order_by('pk')
+        if item_ids is not None:
+            records = records.filter(inventory_item_id__in=item_ids)
+            items = items.filter(pk__in=item_ids)
+
+        stats = {
+            row['inventory_item']: row for row in records.values('inventory_item').annotate(
+                total=Sum('quantity_consumed', filter=Q(date__range=(start, today))),
+                last=Max('date'),
+            )
+        }
+
+        total_items = 0
+        changed = []
+        for item in items.iterator():
+            total_items += 1
+            row = stats.get(item.pk, {})
+            before = [getattr(item, field) for field in STATS_FIELDS]
+            ConsumptionStatsService._set(item, row.get('total') or Decimal('0'), today, row.get('last') or item.last_consumption_date)
+            if [getattr(item, field) for field in STATS_FIELDS] != before:
+                changed.append(item)
+
+        InventoryItem.objects.bulk_update(changed, STATS_FIELDS, batch_size=500)
+        return {'total_items': total_items, 'updated_items': len(changed)}
+
+    @staticmethod
+    def _set(item, total, window_end, last_date):
+        item.consumption_window_total = total
+        item.consumption_window_end = window_end
+        item.daily_avg_consumption = (total / WINDOW_DAYS).quantize(Decimal('0.01'))
+        item.last_consumption_date = last_date
+
+
+class StockAlarmService:
+    """Alarmas de stock evaluadas por conjunto para una o varias granjas.
+
+    Los items en alerta salen de una consulta con el estado anotado en SQL; la
+    configuración STOCK y las alarmas abiertas se cargan una vez para todas las granjas.
+    Las alarmas se resuelven, actualizan y crean en bloque. Es la ruta común de la
+    vista stock-alerts, check_stock_alerts_task y AlarmEvaluationEngine.
+    """
+
+    PRIORITIES = {'OUT_OF_STOCK': 'URGENT', 'CRITICAL': 'HIGH', 'LOW': 'MEDIUM'}
+    OPEN_STATUSES = ['PENDING', 'ESCALATED']
+
+    @staticmethod
+    def evaluate(farm_ids=None, config=None, notify=True):
+        """Sincronizar las alarmas STOCK con el estado actual del inventario.
+
+        Sin config, usa la configuración STOCK activa de cada granja (de farm_ids o de
+        todas); con config, evalúa solo la granja de esa configuración.
+
+        Returns a dict with counts.
+        """
+        from apps.alarms.models import Alarm, AlarmConfiguration
+        from apps.alarms.services import AlarmNotificationService
+
+        if config is not None:
+            configs = {config.farm_id: config}
+        else:
+            qs = AlarmConfiguration.objects.filter(alarm_type='STOCK', is_active=True).select_related('farm')
+            if farm_ids is not None:
+                qs = qs.filter(farm_id__in=farm_ids)
+            configs = {c.farm_id: c for c in qs}
+
+        result = {'items_alerting': 0, 'alarms_created': 0, 'alarms_updated': 0, 'alarms_resolved': 0}
+        if not configs:
+            return result
+
+        today = timezone.now().date()
+        alerting = {
+            item.pk: item for item in
+            InventoryItem.objects.stock_alerts().filter(farm_id__in=configs).select_related('farm', 'shed')
+        }
+        result['items_alerting'] = len(alerting)
+
+        open_alarms = {}
+        for alarm in Alarm.objects.filter(
+            alarm_type='STOCK', farm_id__in=configs, status__in=StockAlarmService.OPEN_STATUSES,
+            inventory_item__isnull=False,
+        ).order_by('id'):
+            open_alarms.setdefault(alarm.inventory_item_id, alarm)
+
+        # Items que volvieron a un estado normal: resolver sus alarmas abiertas
+        resolved = [alarm.pk for item_id, alarm in open_alarms.items() if item_id not in alerting]
+        if resolved:
+            result['alarms_resolved'] = Alarm.objects.filter(pk__in=resolved).update(
+                status='RESOLVED', resolved_at=timezone.now(),
+            )
+
+        changed = []
+        new_alarms = []
+        for item_id, item in alerting.items():
+            priority, description = StockAlarmService.describe(item)
+            existing = open_alarms.get(item_id)
+            if existing is None:
+                new_alarms.append(Alarm(
+                    alarm_type='STOCK',
+                    description=description,
+                    priority=priority,
+                    farm_id=item.farm_id,
+                    inventory_item=item,
+                    configuration=configs[item.farm_id],
+                    source_type='inventory',
+                    source_date=today,
+                    source_id=item.id,
+                ))
+            elif existing.description != description or existing.priority != priority:
+                existing.description = description
+                existing.priority = priority
+                existing.source_date = today
+                changed.append(existing)
+
+        Alarm.objects.bulk_update(changed, ['description', 'priority', 'source_date'], batch_size=500)
+        result['alarms_updated'] = len(changed)
+
+        if new_alarms:
+            Alarm.objects.bulk_create(new_alarms, batch_size=500)
+            # Backends sin RETURNING (MySQL) no asignan pk en bulk_create
+            if not connection.features.can_return_rows_from_bulk_insert:
+                ids = dict(Alarm.objects.filter(
+                    alarm_type='STOCK', status='PENDING', source_type='inventory',
+                    inventory_item_id__in=[alarm.inventory_item_id for alarm in new_alarms],
+                ).values_list('inventory_item_id', 'id'))
+                for alarm in new_alarms:
+                    alarm.pk = ids.get(alarm.inventory_item_id)
+            result['alarms_created'] = len(new_alarms)
+
+        if notify:
+            AlarmNotificationService.dispatch(new_alarms)
+
+        return result
+
+    @staticmethod
+    def describe(item):
+        """Prioridad y descripción de la alarma para un item anotado con with_stock_status."""
+        code = item.stock_status_code
+        priority = StockAlarmService.PRIORITIES[code]
+        location = item.location_display
+        if code == 'OUT_OF_STOCK':
+            return priority, f'Stock agotado: {item.name} en {location}'
+
+        message = item.describe_stock_status(code)['message']
+        if code == 'CRITICAL':
+            return priority, f'Stock crítico: {item.name} en {location} - {message}'
+        return priority, f'Stock bajo: {item.name} en {location} - {message}'
+
+
+class FoodTraceabilityService:
+    """Consultas de trazabilidad lote de alimento <-> lote de aves sobre FoodBatchAllocation."""
+
+    @staticmethod
+    def recall(batch_id):
+        """Lotes de aves que consumieron de un lote de alimento, con cantidad y fechas."""
+        rows = (
+            FoodBatchAllocation.objects.filter(batch_id=batch_id)
+            .values(
+                flock_id=F('consumption_record__flock_id'),
+                breed=F('consumption_record__flock__breed'),
+                shed_name=F('consumption_record__flock__shed__name'),
+                farm_name=F('consumption_record__flock__shed__farm__name'),
+            )
+            .annotate(
+                quantity=Sum('quantity'),
+                first_date=Min('consumption_record__date'),
+                last_date=Max('consumption_record__date'),
+                records=Count('consumption_record'),
+            )
+            .order_by('flock_id')
+        )
+        return [dict(row, quantity=float(row['quantity'])) for row in rows]
+
+    @staticmethod
+    def lineage(flock_id, batches=None):
+        """Lotes de alimento que alimentaron a un lote de aves, en orden de entrada.
+
+        batches: queryset de FoodBatch visible para el usuario; restringe el resultado.
+        """
+        allocations = FoodBatchAllocation.objects.filter(consumption_record__flock_id=flock_id)
+        if batches is not None:
+            allocations = allocations.filter(batch__in=batches.values('pk'))
+        rows = (
+            allocations.values(
+                'batch_id',
+                item_name=F('batch__inventory_item__name'),
+                entry_date=F('batch__entry_date'),
+                expiry_date=F('batch__expiry_date'),
+                supplier=F('batch__supplier'),
+                lot_number=F('batch__lot_number'),
+            )
+            .annotate(
+                quantity=Sum('quantity'),
+                first_date=Min('consumption_record__date'),
+                last_date=Max('consumption_record__date'),
+            )
+            .order_by('entry_date', 'batch_id')
+        )
+        return [dict(row, quantity=float(row['quantity'])) for row in rows]
+
+    @staticmethod
+    def backfill(batch_size=1000):
+        """Crear las asignaciones faltantes a partir del JSON fifo_details de los registros existentes.
+
+        Omite los lotes que ya no existen. Returns a dict with counts.
+        """
+        summary = {'records_scanned': 0, 'allocations_created': 0, 'missing_batches': 0}
+        pending = FoodConsumptionRecord.objects.filter(allocations__isnull=True).order_by('pk').only('id', 'fifo_details')
+
+        chunk = []
+        for record in pending.iterator(chunk_size=batch_size):
+            chunk.append(record)
+            if len(chunk) >= batch_size:
+                FoodTraceabilityService._backfill_chunk(chunk, summary)
+                chunk = []
+        if chunk:
+            FoodTraceabilityService._backfill_chunk(chunk, summary)
+        return summary
+
+    @staticmethod
+    def _backfill_chunk(records, summary):
+        allocations = [a for record in records for a in FoodBatchAllocation.from_details(record, record.fifo_details)]
+        existing = set(FoodBatch.objects.filter(pk__in={a.batch_id for a in allocations}).values_list('pk', flat=True))
+        valid = [a for a in allocations if a.batch_id in existing]
+
+        FoodBatchAllocation.objects.bulk_create(valid, ignore_conflicts=True)
+        summary['records_scanned'] += len(records)
+        summary['allocations_created'] += len(valid)
+        summary['missing_batches'] += len(allocations) - len(valid)
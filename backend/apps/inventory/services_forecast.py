@@ -0,0 +1,213 @@
+"""
+Pronóstico de agotamiento del inventario de alimento según la demanda de los lotes.
+
+El promedio móvil de 30 días subestima el consumo de pollos de engorde, cuya ingesta
+se triplica durante el ciclo. Aquí la demanda diaria futura de cada lote activo es
+aves × consumo esperado de su raza (BreedReference) a cada edad futura, corregida por
+la relación consumo observado / esperado de sus DailyRecord recientes. La matriz
+lote × día se reparte entre los items con una matriz item × lote y se acumula, de
+modo que la fecha de agotamiento de todos los items sale de una sola pasada numpy.
+
+Reparto: los lotes de un galpón alimentan a los items de ese galpón; si el galpón no
+tiene items propios, a los items generales de la granja. Entre varios items del mismo
+alcance la demanda se divide según su consumo promedio (o en partes iguales). Los
+items sin lotes que los alimenten usan su promedio móvil como demanda constante.
+
+El resultado de todos los items se cachea; la clave incluye la fecha, la generación
+de las curvas de raza y una versión que cambia cuando se escriben lotes, registros
+diarios o existencias.
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.flocks.breed_curves import GENERATION_KEY, breed_curve_cache
+from apps.flocks.models import DailyRecord, Flock
+
+from .models import InventoryItem
+
+
+VERSION_KEY = 'inventory:forecast:version'
+PAYLOAD_KEY = 'inventory:forecast:{}:{}:{}'
+
+# Días proyectados hacia adelante
+HORIZON_DAYS = 120
+
+# Ventana de DailyRecord para la relación consumo observado / esperado, y sus límites
+INTAKE_WINDOW_DAYS = 7
+INTAKE_RATIO_BOUNDS = (0.5, 1.5)
+
+# Kilogramos por unidad de inventario (BAG se toma de settings.INVENTORY_BAG_KG)
+UNIT_KG = {'KG': 1.0, 'TON': 1000.0, 'LB': 0.45359237}
+
+
+def _cache_seconds():
+    return getattr(settings, 'INVENTORY_FORECAST_CACHE_SECONDS', 3600)
+
+
+def _unit_kg(unit):
+    if unit == 'BAG':
+        return float(getattr(settings, 'INVENTORY_BAG_KG', 40))
+    return UNIT_KG.get(unit, 1.0)
+
+
+class StockForecastService:
+    """Fecha de agotamiento y fecha límite de reposición por item."""
+
+    @staticmethod
+    def get(item_ids=None):
+        """Pronóstico por item (id -> dict), desde caché si nada cambió."""
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            version = time.time_ns()
+            cache.set(VERSION_KEY, version, None)
+        key = PAYLOAD_KEY.format(timezone.now().date().isoformat(), cache.get(GENERATION_KEY, 0), version)
+
+        data = cache.get(key)
+        if data is None:
+            data = StockForecastService.build()
+            cache.set(key, data, _cache_seconds())
+
+        if item_ids is None:
+            return data
+        return {pk: data[pk] for pk in item_ids if pk in data}
+
+    @staticmethod
+    def build():
+        today = timezone.now().date()
+        items = list(InventoryItem.objects.order_by('pk').values_list(
+            'id', 'farm_id', 'shed_id', 'current_stock', 'unit', 'daily_avg_consumption', 'alert_threshold_days',
+        ))
+        if not items:
+            return {}
+
+        flocks = list(Flock.objects.filter(
+            status='ACTIVE', shed__farm_id__in={row[1] for row in items},
+        ).order_by('pk').values_list('id', 'shed_id', 'shed__farm_id', 'breed', 'arrival_date', 'current_quantity'))
+
+        stock = np.array([float(row[3]) for row in items])
+        avg = np.array([float(row[5]) for row in items])
+        unit_kg = np.array([_unit_kg(row[4]) for row in items])
+
+        # Demanda diaria en unidades del item: reparto de la demanda de los lotes (kg) o promedio móvil
+        demand = StockForecastService._allocation(items, flocks, avg) @ StockForecastService._flock_demand(flocks, today)
+        demand /= unit_kg[:, None]
+        from_flocks = demand.sum(axis=1) > 0
+        demand[~from_flocks] = avg[~from_flocks, None]
+
+        cumulative = np.cumsum(demand, axis=1)
+        over = cumulative > stock[:, None]
+        depleted = over.any(axis=1)
+        days_left = over.argmax(axis=1)
+
+        result = {}
+        for i, (item_id, _, _, _, _, _, alert_days) in enumerate(items):
+            if stock[i] <= 0:
+                depletion = today
+            elif from_flocks[i]:
+                depletion = today + timedelta(days=int(days_left[i])) if depleted[i] else None
+            elif avg[i] > 0:
+                # Demanda constante: misma proyección que InventoryItem.projected_stockout_date, sin límite de horizonte
+                depletion = today + timedelta(days=int(stock[i] / avg[i]))
+            else:
+                depletion = None
+
+            result[item_id] = {
+                'method': 'flocks' if from_flocks[i] else ('average' if avg[i] > 0 else None),
+                'daily_demand': round(float(demand[i, 0]), 2),
+                'horizon_demand': round(float(cumulative[i, -1]), 2),
+                'depletion_date': depletion,
+                'reorder_by': max(today, depletion - timedelta(days=alert_days)) if depletion else None,
+            }
+        return result
+
+    @staticmethod
+    def _flock_demand(flocks, today):
+        """Matriz lote × día con la demanda esperada en kg, corregida por la ingesta observada."""
+        demand = np.zeros((len(flocks), HORIZON_DAYS))
+        if not flocks:
+            return demand
+
+        breeds = np.array([row[3] for row in flocks], dtype=object)
+        birds = np.array([row[5] for row in flocks], dtype=float)
+        ages = np.array([(today - row[4]).days for row in flocks])[:, None] + np.arange(HORIZON_DAYS)
+
+        # Fuera del rango de la curva (lote aún no llegado o ya cumplido el ciclo) no hay demanda
+        for breed in set(breeds):
+            curve = breed_curve_cache.get_curve(breed)
+            if curve is not None:
+                rows = breeds == breed
+                demand[rows] = np.nan_to_num(curve.consumption_for(ages[rows]))
+
+        ratios = StockForecastService._intake_ratios(flocks, breeds, today)
+        return demand * (birds * ratios)[:, None] / 1000
+
+    @staticmethod
+    def _intake_ratios(flocks, breeds, today):
+        """Consumo observado / esperado de cada lote en los últimos días (1.0 sin datos)."""
+        position = {row[0]: i for i, row in enumerate(flocks)}
+        rows = list(DailyRecord.objects.filter(
+            flock_id__in=position, date__gte=today - timedelta(days=INTAKE_WINDOW_DAYS),
+        ).annotate(
+            feed=F('feed_consumed_kg_male') + F('feed_consumed_kg_female'),
+            birds=F('balance_male') + F('balance_female'),
+        ).values_list('flock_id', 'day_number', 'feed', 'birds'))
+
+        ratios = np.ones(len(flocks))
+        if not rows:
+            return ratios
+
+        idx = np.array([position[row[0]] for row in rows])
+        ages = np.array([row[1] for row in rows])
+        observed = np.array([float(row[2] or 0) for row in rows]) * 1000
+        expected = np.zeros(len(rows))
+        for breed in set(breeds[idx]):
+            curve = breed_curve_cache.get_curve(breed)
+            if curve is not None:
+                mask = breeds[idx] == breed
+                expected[mask] = np.nan_to_num(curve.consumption_for(ages[mask])) * np.array(
+                    [row[3] for row in rows], dtype=float
+                )[mask]
+
+        # Solo días con consumo y aves registrados cuentan para la relación
+        counted = (observed > 0) & (expected > 0)
+        observed_total = np.bincount(idx[counted], weights=observed[counted], minlength=len(flocks))
+        expected_total = np.bincount(idx[counted], weights=expected[counted], minlength=len(flocks))
+        has_data = expected_total > 0
+        ratios[has_data] = np.clip(observed_total[has_data] / expected_total[has_data], *INTAKE_RATIO_BOUNDS)
+        return ratios
+
+    @staticmethod
+    def _allocation(items, flocks, avg):
+        """Matriz item × lote con la fracción de la demanda de cada lote que cubre cada item."""
+        weights = np.zeros((len(items), len(flocks)))
+        shed_items = {}
+        farm_items = {}
+        for i, (_, farm_id, shed_id, *_) in enumerate(items):
+            if shed_id:
+                shed_items.setdefault(shed_id, []).append(i)
+            else:
+                farm_items.setdefault(farm_id, []).append(i)
+
+        for j, (_, shed_id, farm_id, *_) in enumerate(flocks):
+            group = shed_items.get(shed_id) or farm_items.get(farm_id)
+            if not group:
+                continue
+            shares = avg[group]
+            weights[group, j] = shares / shares.sum() if shares.sum() > 0 else 1 / len(group)
+        return weights
+
+    @staticmethod
+    def invalidate():
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+    @staticmethod
+    def invalidate_on_commit():
+        """Invalidar tras el commit para no cachear datos que la transacción aún puede revertir."""
+        transaction.on_commit(StockForecastService.invalidate)
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.flocks.models import DailyRecord, DispatchRecord, Flock, MortalityRecord
+
+from .models import InventoryItem
+from .services_forecast import StockForecastService
+
+
+@receiver(post_save, sender=InventoryItem)
+@receiver(post_delete, sender=InventoryItem)
+@receiver(post_save, sender=Flock)
+@receiver(post_delete, sender=Flock)
+@receiver(post_save, sender=MortalityRecord)
+@receiver(post_save, sender=DispatchRecord)
+@receiver(post_save, sender=DailyRecord)
+@receiver(post_delete, sender=DailyRecord)
+def invalidate_stock_forecast(sender, instance, **kwargs):
+    # Los cambios de curvas de raza cambian la generación incluida en la clave; los flujos
+    # en lote sin señales quedan cubiertos por INVENTORY_FORECAST_CACHE_SECONDS
+    StockForecastService.invalidate_on_commit()
@@ -4,75 +4,28 @@ from .models import InventoryItem
 
 @shared_task
 def update_all_inventory_metrics_task():
-    """Actualizar métricas de consumo de todos los items de inventario"""
-    items = InventoryItem.objects.all()
-    updated_count = 0
-    
-    for item in items:
-        try:
-            item.update_consumption_stats()
-            updated_count += 1
-        except Exception as e:
-            # Log el error pero continúa con los demás items
-            print(f"Error actualizando métricas de {item.name}: {str(e)}")
-    
-    return {
-        'total_items': items.count(),
-        'updated_items': updated_count
-    }
+    """Corregir desvíos de las métricas de consumo de todos los items de inventario.
+
+    Las ventanas se mantienen en cada escritura; aquí se recalculan todas con una
+    consulta agrupada y un bulk_update de los items que cambiaron (incluye el avance
+    diario de la ventana).
+    """
+    from .services import ConsumptionStatsService
+    return ConsumptionStatsService.refresh()
 
 
 @shared_task
 def check_stock_alerts_task():
-    """Verificar y generar alarmas por stock crítico"""
-    from apps.alarms.models import AlarmConfiguration, Alarm
-    
-    critical_items = []
-    
-    # Obtener items con stock crítico
-    for item in InventoryItem.objects.all():
-        status = item.stock_status
-        if status['status'] in ['CRITICAL', 'OUT_OF_STOCK']:
-            critical_items.append(item)
-            
-            # Verificar configuración de alarmas de stock
-            config = AlarmConfiguration.objects.filter(
-                alarm_type='STOCK',
-                farm=item.farm,
-                is_active=True
-            ).first()
-            
-            if config:
-                # Verificar si no existe alarma similar reciente
-                recent_alarms = Alarm.objects.filter(
-                    alarm_type='STOCK',
-                    entity_type='INVENTORY',
-                    entity_id=item.id,
-                    status='PENDING'
-                )
-                
-                if not recent_alarms.exists():
-                    priority = 'HIGH' if status['status'] == 'OUT_OF_STOCK' else 'MEDIUM'
-                    
-                    Alarm.objects.create(
-                        alarm_type='STOCK',
-                        entity_type='INVENTORY',
-                        entity_id=item.id,
-                        priority=priority,
-                        title=f'Stock crítico - {item.name}',
-                        message=f'{item.name} en {item.location_display}: {status["message"]}',
-                        farm=item.farm,
-                        shed=item.shed,
-                        data={
-                            'inventory_id': item.id,
-                            'current_stock': float(item.current_stock),
-                            'unit': item.unit,
-                            'status': status['status'],
-                            'projected_stockout': item.projected_stockout_date.isoformat() if item.projected_stockout_date else None
-                        }
-                    )
-    
-    return {
-        'critical_items_count': len(critical_items),
-        'alarms_generated': len([item for item in critical_items if AlarmConfiguration.objects.filter(alarm_type='STOCK', farm=item.farm, is_active=True).exists()])
-    }
\ No newline at end of file
+    """Verificar y generar alarmas por stock crítico.
+
+    Una evaluación por conjunto para todas las granjas con configuración STOCK activa
+    (ver StockAlarmService), en lugar de recorrer los items uno a uno.
+    """
+    from .services import StockAlarmService
+
+    result = StockAlarmService.evaluate()
+    result['critical_items_count'] = InventoryItem.objects.with_stock_status().filter(
+        stock_status_code__in=['CRITICAL', 'OUT_OF_STOCK']
+    ).count()
+    result['alarms_generated'] = result['alarms_created']
+    return result
@@ -0,0 +1,84 @@
+import io
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from apps.farms.models import Farm, Shed
+from apps.flocks.models import Flock
+from apps.inventory.models import InventoryItem, FoodBatchAllocation, FoodConsumptionRecord
+from apps.inventory.services import FIFOConsumptionService
+from apps.users.models import Role
+
+User = get_user_model()
+
+
+class FoodBatchAllocationTests(TestCase):
+    def setUp(self):
+        role = Role.objects.create(name='Administrador Sistema')
+        self.admin = User.objects.create(username='admin', identification='trace-1', is_staff=True, role=role)
+        farm = Farm.objects.create(name='Finca T', location='', farm_manager=self.admin)
+        shed = Shed.objects.create(name='Galpon T', farm=farm, capacity=5000)
+        self.flocks = [
+            Flock.objects.create(
+                arrival_date=date(2026, 8, 1), initial_quantity=100, current_quantity=100,
+                initial_weight=40, breed='Ross', gender='X', supplier='P', shed=shed,
+            )
+            for _ in range(2)
+        ]
+        self.item = InventoryItem.objects.create(name='Inicio', unit='KG', farm=farm, shed=shed)
+        self.first = self.item.add_stock(Decimal('30'), entry_date=date(2026, 8, 1))
+        self.second = self.item.add_stock(Decimal('50'), entry_date=date(2026, 8, 5))
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _consume(self, flock, quantity, day):
+        entry = {'flock_id': flock.id, 'inventory_item_id': self.item.id, 'quantity_consumed': Decimal(quantity), 'date': date(2026, 8, day)}
+        return FIFOConsumptionService.consume_batch([entry], self.admin)[0]
+
+    def test_consumption_writes_allocations_for_recall_and_lineage(self):
+        self._consume(self.flocks[0], '20', 10)
+        self._consume(self.flocks[1], '25', 10)
+        self._consume(self.flocks[0], '10', 11)
+
+        self.assertEqual(
+            sorted(FoodBatchAllocation.objects.values_list('batch_id', 'quantity')),
+            sorted([(self.first.pk, Decimal('20')), (self.first.pk, Decimal('10')),
+                    (self.second.pk, Decimal('15')), (self.second.pk, Decimal('10'))]),
+        )
+
+        recall = self.client.get(f'/api/food-batches/{self.second.pk}/recall/').json()
+        self.assertEqual(recall['total_consumed'], 25.0)
+        self.assertEqual(
+            [(row['flock_id'], row['quantity'], row['records']) for row in recall['flocks']],
+            [(self.flocks[0].id, 10.0, 1), (self.flocks[1].id, 15.0, 1)],
+        )
+
+        lineage = self.client.get('/api/food-batches/lineage/', {'flock': self.flocks[0].id}).json()
+        self.assertEqual(
+            [(row['batch_id'], row['quantity'], row['first_date']) for row in lineage['batches']],
+            [(self.first.pk, 20.0, '2026-08-10'), (self.second.pk, 10.0, '2026-08-11')],
+        )
+        self.assertEqual(self.client.get('/api/food-batches/lineage/').status_code, 400)
+
+    def test_backfill_command_reads_legacy_json(self):
+        record = FoodConsumptionRecord.objects.create(
+            flock=self.flocks[0], inventory_item=self.item, date=date(2026, 8, 9), quantity_consumed=Decimal('35'),
+            recorded_by=self.admin, fifo_details=[
+                {'batch_id': self.first.pk, 'quantity_consumed': 30.0},
+                {'batch_id': self.second.pk, 'quantity_consumed': 5.0},
+                {'batch_id': 999999, 'quantity_consumed': 1.0},
+            ],
+        )
+
+        call_command('backfill_fifo_allocations', stdout=io.StringIO())
+        call_command('backfill_fifo_allocations', stdout=io.StringIO())
+
+        self.assertEqual(
+            sorted(record.allocations.values_list('batch_id', 'quantity')),
+            [(self.first.pk, Decimal('30')), (self.second.pk, Decimal('5'))],
+        )
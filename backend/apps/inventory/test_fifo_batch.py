@@ -0,0 +1,117 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.farms.models import Farm, Shed
+from apps.flocks.models import Flock
+from apps.inventory.models import InventoryItem, FoodBatch, FoodConsumptionRecord
+from apps.inventory.services import lock_batches
+from apps.users.models import Role
+
+User = get_user_model()
+
+
+class BulkConsumeFIFOTests(TestCase):
+    def setUp(self):
+        role = Role.objects.create(name='Administrador Sistema')
+        self.admin = User.objects.create(username='admin', identification='fifo-1', is_staff=True, role=role)
+        self.manager = User.objects.create(username='farmmgr', identification='fifo-2')
+        self.farm = Farm.objects.create(name='Finca F', location='', farm_manager=self.manager)
+        self.shed = Shed.objects.create(name='Galpon F', farm=self.farm, capacity=5000)
+        self.flocks = [
+            Flock.objects.create(
+                arrival_date=date(2026, 8, 1), initial_quantity=100, current_quantity=100,
+                initial_weight=40, breed='Ross', gender='X', supplier='P', shed=self.shed,
+            )
+            for _ in range(3)
+        ]
+        self.item = InventoryItem.objects.create(name='Inicio', unit='KG', farm=self.farm, shed=self.shed)
+        self.item.add_stock(Decimal('30'), entry_date=date(2026, 8, 1))
+        self.item.add_stock(Decimal('50'), entry_date=date(2026, 8, 5))
+        self.other = InventoryItem.objects.create(name='Engorde', unit='KG', farm=self.farm)
+        self.other.add_stock(Decimal('100'), entry_date=date(2026, 8, 2))
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _post(self, records):
+        return self.client.post('/api/inventory/bulk-consume-fifo/', {'consumption_records': records}, format='json').json()
+
+    def _entry(self, flock, item, quantity, client_id, day=10):
+        return {
+            'flock_id': flock.id, 'inventory_item_id': item.id, 'quantity_consumed': quantity,
+            'date': (date(2026, 8, 1) + timedelta(days=day)).isoformat(), 'client_id': client_id,
+        }
+
+    def test_allocates_across_batches_in_entry_order(self):
+        body = self._post([
+            self._entry(self.flocks[0], self.item, '20', 'a'),
+            self._entry(self.flocks[1], self.other, '40', 'b'),
+            self._entry(self.flocks[1], self.item, '25', 'c'),
+            self._entry(self.flocks[2], self.item, '40', 'd'),
+            self._entry(self.flocks[0], self.item, '5', 'dup'),
+            {**self._entry(self.flocks[0], self.item, '1', 'ghost'), 'flock_id': 999999},
+        ])
+
+        self.assertEqual((body['total'], body['successful'], body['errors']), (6, 3, 3))
+        details = body['details']
+        self.assertEqual([d['client_id'] for d in details], ['a', 'b', 'c', 'd', 'dup', 'ghost'])
+        self.assertIn('Stock insuficiente. Disponible: 35.00', details[3]['error'])
+        self.assertIn('Ya existe un registro de consumo', details[4]['error'])
+        self.assertEqual(details[5]['error'], 'Lote no encontrado')
+
+        # El segundo consumo termina el primer lote y sigue en el siguiente
+        self.assertEqual(
+            [(d['quantity_consumed'], d['batch_remaining']) for d in details[2]['fifo_details']],
+            [(10.0, 0.0), (15.0, 35.0)],
+        )
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, Decimal('35'))
+        self.assertEqual(
+            list(self.item.food_batches.order_by('entry_date').values_list('current_quantity', flat=True)),
+            [Decimal('0'), Decimal('35')],
+        )
+        record = FoodConsumptionRecord.objects.get(pk=details[2]['server_id'])
+        self.assertEqual((record.flock_id, record.client_id, record.date), (self.flocks[1].id, 'c', date(2026, 8, 11)))
+
+    def test_query_count_scales_with_items_not_records(self):
+        for i in range(10):
+            FoodBatch.objects.create(
+                inventory_item=self.item, entry_date=date(2026, 8, 6 + i), initial_quantity=10, current_quantity=10,
+            )
+        InventoryItem.objects.filter(pk=self.item.pk).update(current_stock=180)
+        records = [self._entry(flock, self.item, '2', f'{flock.id}-{day}', day=day) for flock in self.flocks for day in range(20)]
+
+        with CaptureQueriesContext(connection) as ctx:
+            body = self._post(records)
+
+        self.assertEqual(body['successful'], 60)
+        self.assertLess(len(ctx.captured_queries), 20)
+        self.assertEqual(FoodConsumptionRecord.objects.count(), 60)
+
+    def test_fefo_item_consumes_nearest_expiry_first(self):
+        item = InventoryItem.objects.create(name='Vitaminas', unit='KG', farm=self.farm, batch_strategy='FEFO')
+        late = item.add_stock(Decimal('10'), entry_date=date(2026, 8, 1))
+        soon = item.add_stock(Decimal('10'), entry_date=date(2026, 8, 3))
+        undated = item.add_stock(Decimal('10'), entry_date=date(2026, 7, 20))
+        FoodBatch.objects.filter(pk=late.pk).update(expiry_date=date(2026, 12, 1))
+        FoodBatch.objects.filter(pk=soon.pk).update(expiry_date=date(2026, 9, 1))
+
+        details = self._post([self._entry(self.flocks[0], item, '25', 'v')])['details'][0]['fifo_details']
+        self.assertEqual([d['batch_id'] for d in details], [soon.pk, late.pk, undated.pk])
+
+    def test_locks_only_the_batches_needed(self):
+        for i in range(12):
+            FoodBatch.objects.create(
+                inventory_item=self.other, entry_date=date(2026, 8, 3 + i), initial_quantity=10, current_quantity=10,
+            )
+
+        with transaction.atomic():
+            self.assertEqual(len(lock_batches(self.other, Decimal('60'))), 5)
+            self.assertEqual(len(lock_batches(self.other, Decimal('150'))), 10)
+            self.assertEqual(len(lock_batches(self.other, Decimal('500'))), 13)
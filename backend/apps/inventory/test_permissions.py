@@ -1,9 +1,14 @@
+from decimal import Decimal
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 
 from apps.farms.models import Farm, Shed
-from apps.inventory.models import InventoryItem
+from apps.inventory.models import InventoryItem, StockAdjustment
+from apps.users.models import Role
 
 User = get_user_model()
 
@@ -47,3 +52,47 @@ class InventoryPermissionTests(TestCase):
         body = resp.json()
         self.assertIn('results', body)
         self.assertTrue(any(r.get('status') == 'error' for r in body['results']))
+
+
+class BulkStockUpdateTests(TestCase):
+    def setUp(self):
+        self.galponero = User.objects.create(username='galponero', identification='bulk-1', role=Role.objects.create(name='Galponero'))
+        manager = User.objects.create(username='farmmgr', identification='bulk-2')
+        farm = Farm.objects.create(name='Finca B', location='', farm_manager=manager)
+        Shed.objects.create(name='Galpon B1', farm=farm, capacity=50, assigned_worker=self.galponero)
+        other_shed = Shed.objects.create(name='Galpon B2', farm=farm, capacity=50)
+
+        # Items generales de la granja: el galponero con un galpón asignado en ella puede contarlos
+        self.items = InventoryItem.objects.bulk_create([
+            InventoryItem(name=f'Item {i}', unit='KG', farm=farm, current_stock=100) for i in range(500)
+        ])
+        self.foreign = InventoryItem.objects.create(name='Ajeno', unit='KG', farm=farm, shed=other_shed, current_stock=5)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.galponero)
+
+    def test_stock_count_in_a_handful_of_queries(self):
+        updates = [{'inventory_id': item.id, 'new_stock': '42.5', 'client_id': f'c{item.id}'} for item in self.items]
+        updates += [
+            {'inventory_id': self.foreign.id, 'new_stock': '1', 'client_id': 'foreign'},
+            {'inventory_id': 999999, 'new_stock': '1', 'client_id': 'ghost'},
+            {'inventory_id': self.items[0].id, 'new_stock': 'abc', 'client_id': 'bad'},
+        ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post('/api/inventory/bulk-update-stock/', {'stock_updates': updates}, format='json')
+
+        self.assertLess(len(ctx.captured_queries), 15)
+        results = resp.json()['results']
+        self.assertEqual(len(results), 503)
+        self.assertEqual(results[0], {'client_id': f'c{self.items[0].id}', 'status': 'success', 'new_stock': 42.5})
+        self.assertEqual(
+            [(r['client_id'], r['status']) for r in results[-3:]],
+            [('foreign', 'error'), ('ghost', 'error'), ('bad', 'error')],
+        )
+        self.assertEqual(results[-3]['error'], 'Sin permisos para actualizar este inventario')
+
+        self.assertEqual(InventoryItem.objects.filter(current_stock=Decimal('42.5')).count(), 500)
+        self.assertEqual(StockAdjustment.objects.count(), 500)
+        adjustment = StockAdjustment.objects.get(client_id=f'c{self.items[0].id}')
+        self.assertEqual((adjustment.quantity_change, adjustment.adjusted_by), (Decimal('-57.5'), self.galponero))
@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from apps.alarms.models import Alarm, AlarmConfiguration
+from apps.alarms.services import AlarmEvaluationEngine
+from apps.farms.models import Farm
+from apps.inventory.models import InventoryItem
+from apps.inventory.services import StockAlarmService
+from apps.inventory.tasks import check_stock_alerts_task
+from apps.users.models import Role
+
+User = get_user_model()
+
+
+class StockStatusEvaluationTests(TestCase):
+    def setUp(self):
+        role = Role.objects.create(name='Administrador Sistema')
+        self.admin = User.objects.create(username='admin', identification='stock-1', is_staff=True, role=role)
+        self.manager = User.objects.create(username='farmmgr', identification='stock-2')
+        self.farm = Farm.objects.create(name='Finca S', location='', farm_manager=self.manager)
+        self.config = AlarmConfiguration.objects.create(
+            alarm_type='STOCK', farm=self.farm, threshold_value=0, notify_farm_manager=False, notify_veterinarian=False,
+        )
+
+        def item(name, current, minimum=100, avg=0):
+            return InventoryItem.objects.create(
+                name=name, unit='KG', farm=self.farm, current_stock=current, minimum_stock=minimum,
+                daily_avg_consumption=avg,
+            )
+
+        self.items = {
+            'OUT_OF_STOCK': item('Agotado', 0),
+            'CRITICAL': item('Critico', 20),
+            'LOW': item('Bajo', 60),
+            'WARNING': item('Aviso', 120, avg=40),
+            'NORMAL': item('Normal', 500, avg=10),
+        }
+
+    def test_sql_annotation_matches_property(self):
+        annotated = dict(InventoryItem.objects.with_stock_status().values_list('name', 'stock_status_code'))
+        for code, item in self.items.items():
+            self.assertEqual(item.stock_status['status'], code)
+            self.assertEqual(annotated[item.name], code)
+
+    def test_stock_alerts_endpoint_filters_and_paginates(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        data = client.get('/api/inventory/stock-alerts/').json()
+        self.assertEqual([a['name'] for a in data['alerts']['critical']], ['Critico'])
+        self.assertEqual([a['name'] for a in data['alerts']['low']], ['Bajo'])
+        self.assertEqual(data['alerts']['out_of_stock'][0]['status']['message'], 'Sin stock')
+        self.assertEqual(data['summary'], {'total_items': 5, 'critical_count': 1, 'low_count': 1, 'out_of_stock_count': 1})
+
+        page = client.get('/api/inventory/stock-alerts/', {'page': 1}).json()
+        self.assertEqual(page['count'], 3)
+        self.assertEqual(page['summary']['total_items'], 5)
+
+    def test_evaluator_creates_updates_and_resolves_in_bulk(self):
+        with self.assertNumQueries(4):
+            result = StockAlarmService.evaluate(notify=False)
+        self.assertEqual((result['items_alerting'], result['alarms_created']), (3, 3))
+        priorities = dict(Alarm.objects.filter(alarm_type='STOCK').values_list('inventory_item__name', 'priority'))
+        self.assertEqual(priorities, {'Agotado': 'URGENT', 'Critico': 'HIGH', 'Bajo': 'MEDIUM'})
+
+        InventoryItem.objects.filter(pk=self.items['LOW'].pk).update(current_stock=10)
+        InventoryItem.objects.filter(pk=self.items['OUT_OF_STOCK'].pk).update(current_stock=300)
+
+        self.assertEqual(AlarmEvaluationEngine._evaluate_stock_alarms(self.farm, self.config), 0)
+        low = Alarm.objects.get(inventory_item=self.items['LOW'])
+        self.assertEqual((low.priority, low.status), ('HIGH', 'PENDING'))
+        self.assertEqual(Alarm.objects.get(inventory_item=self.items['OUT_OF_STOCK']).status, 'RESOLVED')
+
+        result = check_stock_alerts_task()
+        self.assertEqual((result['critical_items_count'], result['alarms_generated']), (2, 0))
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.farms.models import Farm, Shed
+from apps.flocks.models import BreedReference, DailyRecord, Flock
+from apps.inventory.models import InventoryItem
+from apps.inventory.services_forecast import StockForecastService
+from apps.users.models import Role
+
+User = get_user_model()
+
+
+class StockForecastTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.now().date()
+        role = Role.objects.create(name='Administrador Sistema')
+        self.admin = User.objects.create(username='admin', identification='fc-1', is_staff=True, role=role)
+        farm = Farm.objects.create(name='Finca P', location='', farm_manager=self.admin)
+        self.shed = Shed.objects.create(name='Galpon P1', farm=farm, capacity=5000)
+        other_shed = Shed.objects.create(name='Galpon P2', farm=farm, capacity=5000)
+
+        # Consumo esperado lineal: 20 g a los 0 días, 200 g a los 60 (20 + 3 × edad)
+        BreedReference.objects.create(breed='Ross', age_days=0, expected_weight=40, expected_consumption=20)
+        BreedReference.objects.create(breed='Ross', age_days=60, expected_weight=3000, expected_consumption=200)
+
+        self.flock = self._flock(self.shed, 1000)
+        self._flock(other_shed, 500)
+
+        self.shed_item = InventoryItem.objects.create(
+            name='Engorde', unit='KG', farm=farm, shed=self.shed, current_stock=1000, alert_threshold_days=2,
+        )
+        self.farm_item = InventoryItem.objects.create(name='General', unit='TON', farm=farm, current_stock=1)
+        self.idle = InventoryItem.objects.create(
+            name='Otra granja', unit='KG', current_stock=100, daily_avg_consumption=8,
+            farm=Farm.objects.create(name='Finca Q', location='', farm_manager=self.admin),
+        )
+
+    def _flock(self, shed, birds):
+        return Flock.objects.create(
+            arrival_date=self.today - timedelta(days=10), initial_quantity=birds, current_quantity=birds,
+            initial_weight=40, breed='Ross', gender='X', supplier='P', shed=shed,
+        )
+
+    def test_depletion_follows_growing_demand(self):
+        forecast = StockForecastService.get()
+
+        # 50, 53, 56 ... kg/día: los 1000 kg alcanzan 14 días completos
+        shed = forecast[self.shed_item.id]
+        self.assertEqual((shed['method'], shed['daily_demand']), ('flocks', 50.0))
+        self.assertEqual(shed['depletion_date'], self.today + timedelta(days=14))
+        self.assertEqual(shed['reorder_by'], self.today + timedelta(days=12))
+
+        # El item general solo recibe el lote del galpón sin items propios (0.025 t/día al inicio)
+        self.assertEqual(forecast[self.farm_item.id]['daily_demand'], 0.03)
+        self.assertEqual(forecast[self.farm_item.id]['depletion_date'], self.today + timedelta(days=23))
+
+        # Sin lotes: promedio móvil, igual que projected_stockout_date
+        idle = forecast[self.idle.id]
+        self.assertEqual((idle['method'], idle['depletion_date']), ('average', self.idle.projected_stockout_date))
+
+    def test_observed_intake_and_cache_refresh(self):
+        self.assertEqual(StockForecastService.get([self.shed_item.id])[self.shed_item.id]['daily_demand'], 50.0)
+
+        # Ayer (día 9) se esperaban 47 kg para 1000 aves y se registraron 56.4: relación 1.2
+        with self.captureOnCommitCallbacks(execute=True):
+            DailyRecord.objects.create(
+                flock=self.flock, date=self.today - timedelta(days=1), recorded_by=self.admin,
+                balance_male=500, balance_female=500, feed_consumed_kg_male=28.2, feed_consumed_kg_female=28.2,
+            )
+        self.assertEqual(StockForecastService.get([self.shed_item.id])[self.shed_item.id]['daily_demand'], 60.0)
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        data = client.get('/api/inventory/stock-forecast/').json()
+        self.assertEqual([row['name'] for row in data['items']], ['Engorde', 'Otra granja', 'General'])
+        self.assertEqual(data['items'][0]['reorder_by'], (self.today + timedelta(days=10)).isoformat())
@@ -63,3 +63,37 @@ class InventoryMetricsTests(TestCase):
         self.assertAlmostEqual(float(self.item.daily_avg_consumption), 10.0, places=2)
         projected = self.item.projected_stockout_date
         self.assertIsNotNone(projected)
+
+    def test_rolling_window_follows_edits_and_deletes(self):
+        from datetime import timedelta, date
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from apps.inventory.tasks import update_all_inventory_metrics_task
+
+        today = date.today()
+        # Fuera de la ventana de 30 días
+        InventoryConsumptionRecord.objects.create(inventory_item=self.item, date=today - timedelta(days=40), quantity_consumed=500)
+        first = InventoryConsumptionRecord.objects.create(inventory_item=self.item, date=today - timedelta(days=2), quantity_consumed=60)
+
+        with CaptureQueriesContext(connection) as ctx:
+            last = InventoryConsumptionRecord.objects.create(inventory_item=self.item, date=today, quantity_consumed=30)
+        # Insertar solo ajusta la ventana: sin re-sumar los 30 días
+        self.assertFalse(any('SUM(' in q['sql'] for q in ctx.captured_queries))
+
+        self.item.refresh_from_db()
+        self.assertEqual(float(self.item.consumption_window_total), 90.0)
+        self.assertEqual(float(self.item.daily_avg_consumption), 3.0)
+        self.assertEqual(self.item.last_consumption_date, today)
+
+        first.quantity_consumed = 120
+        first.save()
+        last.delete()
+        self.item.refresh_from_db()
+        self.assertEqual(float(self.item.daily_avg_consumption), 4.0)
+        self.assertEqual(self.item.last_consumption_date, first.date)
+
+        # La tarea nocturna corrige desvíos con una consulta agrupada
+        InventoryItem.objects.filter(pk=self.item.pk).update(daily_avg_consumption=99, consumption_window_total=1)
+        self.assertEqual(update_all_inventory_metrics_task(), {'total_items': 1, 'updated_items': 1})
+        self.item.refresh_from_db()
+        self.assertEqual(float(self.item.consumption_window_total), 120.0)
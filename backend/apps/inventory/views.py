@@ -1,23 +1,30 @@
+import logging
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
+from django.db.models import Count
 from django.utils import timezone
 from decimal import Decimal
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 
-from .models import InventoryItem, FoodBatch, FoodConsumptionRecord
+from .models import InventoryItem, FoodBatch, FoodConsumptionRecord, StockAdjustment
 from .serializers import (
-    InventoryItemSerializer, BulkStockUpdateSerializer, FoodBatchSerializer,
+    InventoryItemSerializer, FoodBatchSerializer,
     FoodConsumptionRecordSerializer, FoodConsumptionRequestSerializer,
     BulkFoodConsumptionSerializer, FIFOConsumptionResultSerializer,
     AddStockSerializer, AdjustStockSerializer
 )
 from .permissions import CanManageInventory
+from .services import FIFOConsumptionService, FoodTraceabilityService, StockAdjustmentService, StockAlarmService
+from .services_forecast import HORIZON_DAYS, StockForecastService
 from apps.flocks.models import Flock
 from apps.flocks.mixins import RoleFilteredMixin
 
+logger = logging.getLogger(__name__)
+
 
 class InventoryViewSet(RoleFilteredMixin, viewsets.ModelViewSet):
     queryset = InventoryItem.objects.all()
@@ -26,6 +33,9 @@ class InventoryViewSet(RoleFilteredMixin, viewsets.ModelViewSet):
     role_farm_path = 'farm'
     role_flock_path = None
 
+    # Estado anotado -> grupo de la respuesta de stock-alerts
+    ALERT_GROUPS = {'OUT_OF_STOCK': 'out_of_stock', 'CRITICAL': 'critical', 'LOW': 'low'}
+
     def get_queryset(self):
         qs = InventoryItem.objects.select_related('farm', 'shed', 'shed__farm').all()
 
@@ -41,68 +51,79 @@ class InventoryViewSet(RoleFilteredMixin, viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='stock-alerts')
     def stock_alerts(self, request):
-        user = request.user
+        """Items en OUT_OF_STOCK, CRITICAL o LOW, filtrados en la base de datos.
+
+        Con ?page= la lista de alertas se pagina; el resumen siempre cubre todo el inventario visible.
+        """
         user_inventory = self.get_queryset()
+        alerting = user_inventory.stock_alerts().order_by('stock_status_code', 'id')
+
+        counts = dict(
+            user_inventory.with_stock_status().order_by().values('stock_status_code')
+            .annotate(n=Count('id')).values_list('stock_status_code', 'n')
+        )
+        summary = {
+            'total_items': sum(counts.values()),
+            'critical_count': counts.get('CRITICAL', 0),
+            'low_count': counts.get('LOW', 0),
+            'out_of_stock_count': counts.get('OUT_OF_STOCK', 0),
+        }
 
+        page = self.paginate_queryset(alerting) if request.query_params.get('page') else None
+        items = list(alerting if page is None else page)
+        forecasts = StockForecastService.get([item.id for item in items])
         alerts = {'critical': [], 'low': [], 'out_of_stock': []}
+        for item in items:
+            alerts[self.ALERT_GROUPS[item.stock_status_code]].append(self._serialize_alert(item, forecasts.get(item.id)))
 
-        for item in user_inventory.select_related('farm', 'shed'):
-            st = item.stock_status['status']
-            if st == 'OUT_OF_STOCK':
-                alerts['out_of_stock'].append(self._serialize_alert(item))
-            elif st == 'CRITICAL':
-                alerts['critical'].append(self._serialize_alert(item))
-            elif st == 'LOW':
-                alerts['low'].append(self._serialize_alert(item))
+        if page is not None:
+            response = self.get_paginated_response(alerts)
+            response.data['summary'] = summary
+            return response
 
-        return Response({
-            'alerts': alerts,
-            'summary': {
-                'total_items': user_inventory.count(),
-                'critical_count': len(alerts['critical']),
-                'low_count': len(alerts['low']),
-                'out_of_stock_count': len(alerts['out_of_stock'])
-            }
-        })
+        return Response({'alerts': alerts, 'summary': summary})
 
-    def _serialize_alert(self, item):
+    def _serialize_alert(self, item, forecast=None):
+        stockout = forecast['depletion_date'] if forecast else item.projected_stockout_date
         return {
             'id': item.id,
             'name': item.name,
             'location': item.location_display,
             'current_stock': float(item.current_stock),
             'unit': item.unit,
-            'status': item.stock_status,
-            'projected_stockout': item.projected_stockout_date.isoformat() if item.projected_stockout_date else None
+            'status': item.describe_stock_status(item.stock_status_code),
+            'projected_stockout': stockout.isoformat() if stockout else None,
+            'reorder_by': forecast['reorder_by'].isoformat() if forecast and forecast['reorder_by'] else None,
         }
 
-    @action(detail=False, methods=['post'], url_path='bulk-update-stock', permission_classes=[IsAuthenticated, CanManageInventory])
-    def bulk_update_stock(self, request):
-        updates = request.data.get('stock_updates', [])
-        results = []
-
-        serializer = BulkStockUpdateSerializer(data=request.data, many=False)
-        # We'll validate entries individually below
-
-        with transaction.atomic():
-            for update_data in updates:
-                try:
-                    bs = BulkStockUpdateSerializer(data=update_data)
-                    bs.is_valid(raise_exception=True)
-                    item = InventoryItem.objects.get(id=bs.validated_data['inventory_id'])
-
-                    # Object-level permission check
-                    if not CanManageInventory().has_object_permission(request, self, item):
-                        raise PermissionError('Sin permisos para actualizar este inventario')
-
-                    item.current_stock = bs.validated_data['new_stock']
-                    item.save()
+    @action(detail=False, methods=['get'], url_path='stock-forecast')
+    def stock_forecast(self, request):
+        """Fecha de agotamiento y de reposición por item, proyectadas con la demanda de los lotes activos"""
+        items = list(self.get_queryset())
+        forecasts = StockForecastService.get([item.id for item in items])
 
-                    results.append({'client_id': bs.validated_data.get('client_id'), 'status': 'success', 'new_stock': float(item.current_stock)})
+        results = []
+        for item in items:
+            forecast = forecasts.get(item.id)
+            if forecast is None:
+                continue
+            results.append({
+                'id': item.id,
+                'name': item.name,
+                'location': item.location_display,
+                'current_stock': float(item.current_stock),
+                'unit': item.unit,
+                **forecast,
+            })
+        # Primero lo que se agota antes; sin fecha al final
+        results.sort(key=lambda r: (r['depletion_date'] is None, r['depletion_date'] or timezone.now().date(), r['id']))
 
-                except Exception as e:
-                    results.append({'client_id': update_data.get('client_id'), 'status': 'error', 'error': str(e)})
+        return Response({'horizon_days': HORIZON_DAYS, 'items': results})
 
+    @action(detail=False, methods=['post'], url_path='bulk-update-stock', permission_classes=[IsAuthenticated, CanManageInventory])
+    def bulk_update_stock(self, request):
+        # Validación, permisos y escrituras en lote; un resultado por entrada
+        results = StockAdjustmentService.bulk_set_stock(request.data.get('stock_updates', []), request.user)
         return Response({'results': results})
 
     @extend_schema(
@@ -155,30 +176,19 @@ class InventoryViewSet(RoleFilteredMixin, viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        item.current_stock = new_stock
-        item.save()
+        with transaction.atomic():
+            StockAdjustment.objects.create(
+                inventory_item=item, previous_stock=item.current_stock, new_stock=new_stock,
+                source='ADJUST', reason=reason, adjusted_by=request.user,
+            )
+            item.current_stock = new_stock
+            item.save()
         
         # Evaluar alarmas de stock después del ajuste
-        from apps.alarms.services import AlarmEvaluationEngine
-        from apps.alarms.models import AlarmConfiguration
-        import logging
-        logger = logging.getLogger(__name__)
-        
         try:
-            stock_configs = AlarmConfiguration.objects.filter(
-                farm=item.farm,
-                alarm_type='STOCK',
-                is_active=True
-            )
-            logger.info(f"[ALARM CHECK] Configuraciones STOCK encontradas: {stock_configs.count()}")
-            
-            for config in stock_configs:
-                logger.info(f"[ALARM CHECK] Evaluando alarmas para farm: {item.farm.name}, item: {item.name}")
-                logger.info(f"[ALARM CHECK] Stock status: {item.stock_status}")
-                created = AlarmEvaluationEngine._evaluate_stock_alarms(item.farm, config)
-                logger.info(f"[ALARM CHECK] Alarmas creadas: {created}")
-        except Exception as e:
-            logger.exception(f"[ALARM CHECK] Error al evaluar alarmas: {e}")
+            StockAlarmService.evaluate(farm_ids=[item.farm_id])
+        except Exception:
+            logger.exception('Error al evaluar alarmas de stock del item %s', item.pk)
         
         return Response(InventoryItemSerializer(item).data)
 
@@ -238,47 +248,12 @@ class InventoryViewSet(RoleFilteredMixin, viewsets.ModelViewSet):
         serializer = BulkFoodConsumptionSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        results = []
-        
-        with transaction.atomic():
-            for consumption_data in serializer.validated_data['consumption_records']:
-                try:
-                    # Obtener objetos
-                    flock = Flock.objects.get(id=consumption_data['flock_id'])
-                    item = InventoryItem.objects.get(id=consumption_data['inventory_item_id'])
-                    
-                    # Verificar permisos
-                    if not CanManageInventory().has_object_permission(request, self, item):
-                        raise PermissionError('Sin permisos para este inventario')
-                    
-                    # Realizar consumo FIFO
-                    consumption_record, fifo_details = item.consume_fifo(
-                        quantity_to_consume=consumption_data['quantity_consumed'],
-                        flock=flock,
-                        user=request.user
-                    )
-                    
-                    # Configurar campos adicionales
-                    if consumption_data.get('date'):
-                        consumption_record.date = consumption_data['date']
-                    if consumption_data.get('client_id'):
-                        consumption_record.client_id = consumption_data['client_id']
-                    consumption_record.save()
-                    
-                    results.append({
-                        'client_id': consumption_data.get('client_id'),
-                        'server_id': consumption_record.id,
-                        'status': 'success',
-                        'fifo_details': fifo_details
-                    })
-                    
-                except Exception as e:
-                    results.append({
-                        'client_id': consumption_data.get('client_id'),
-                        'server_id': None,
-                        'status': 'error',
-                        'error': str(e)
-                    })
+        # Asignación FIFO agrupada por item: un bloqueo de lotes y escrituras en lote por item
+        results = FIFOConsumptionService.consume_batch(
+            serializer.validated_data['consumption_records'],
+            request.user,
+            can_manage=lambda item: CanManageInventory().has_object_permission(request, self, item),
+        )
         
         return Response({
             'total': len(serializer.validated_data['consumption_records']),
@@ -311,6 +286,32 @@ class FoodBatchViewSet(viewsets.ReadOnlyModelViewSet):
         # Default: restricción por galpones asignados
         return base_qs.filter(inventory_item__shed__assigned_worker=user).order_by('-entry_date')
 
+    @action(detail=True, methods=['get'])
+    def recall(self, request, pk=None):
+        """Lotes de aves que consumieron de este lote de alimento (retiro de proveedor)"""
+        batch = self.get_object()
+        flocks = FoodTraceabilityService.recall(batch.pk)
+        return Response({
+            'batch_id': batch.pk,
+            'supplier': batch.supplier,
+            'lot_number': batch.lot_number,
+            'total_consumed': sum(row['quantity'] for row in flocks),
+            'flocks': flocks,
+        })
+
+    @action(detail=False, methods=['get'])
+    def lineage(self, request):
+        """Lotes de alimento que alimentaron a un lote de aves (?flock=<id>)"""
+        try:
+            flock_id = int(request.query_params['flock'])
+        except (KeyError, TypeError, ValueError):
+            return Response({'error': 'Parámetro flock requerido'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'flock_id': flock_id,
+            'batches': FoodTraceabilityService.lineage(flock_id, self.get_queryset()),
+        })
+
 
 class FoodConsumptionRecordViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet para registros de consumo FIFO (solo lectura, creación via InventoryViewSet)"""
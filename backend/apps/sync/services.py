@@ -61,13 +61,12 @@ class ConflictResolutionService:
             priority=analysis.get('priority', 'MEDIUM')
         )
 
-        # Notify farm manager (if available) using alarms notification adapters
+        # Notify farm manager (if available) through the alarms notification outbox
         try:
             if farm and getattr(farm, 'farm_manager', None):
-                from apps.alarms.notifications import get_default_adapter
+                from apps.alarms.outbox import NotificationOutboxService
                 from apps.alarms.models import Alarm
 
-                adapter = get_default_adapter()
                 manager = farm.farm_manager
                 # create a lightweight Alarm so adapters that log notifications have an Alarm to link
                 alarm = Alarm.objects.create(
@@ -81,7 +80,7 @@ class ConflictResolutionService:
                     'title': f'Conflicto de sync: {conflict.record_type}',
                     'body': f'Tipo: {conflict.conflict_type} - Prioridad: {conflict.priority}'
                 }
-                adapter.send(alarm, manager, payload=payload)
+                NotificationOutboxService.enqueue([(alarm, manager)], payload=payload)
         except Exception:
             logger.exception('Failed notifying farm manager for conflict %s', conflict.id)
 
@@ -111,10 +110,9 @@ class ConflictResolutionService:
 
         # Optionally notify reporter and farm manager about resolution
         try:
-            from apps.alarms.notifications import get_default_adapter
+            from apps.alarms.outbox import NotificationOutboxService
             from apps.alarms.models import Alarm
 
-            adapter = get_default_adapter()
             # create a lightweight Alarm representing the resolution notification
             alarm = Alarm.objects.create(
                 alarm_type=(conflict.record_type or 'SYNC').upper(),
@@ -124,10 +122,13 @@ class ConflictResolutionService:
                 flock=getattr(conflict, 'flock', None),
             )
 
-            if conflict.reported_by:
-                adapter.send(alarm, conflict.reported_by, payload={'title': 'Conflicto resuelto', 'body': str(result)})
+            recipients = [conflict.reported_by]
             if conflict.farm and getattr(conflict.farm, 'farm_manager', None):
-                adapter.send(alarm, conflict.farm.farm_manager, payload={'title': 'Conflicto resuelto', 'body': str(result)})
+                recipients.append(conflict.farm.farm_manager)
+            NotificationOutboxService.enqueue(
+                [(alarm, r) for r in recipients if r],
+                payload={'title': 'Conflicto resuelto', 'body': str(result)},
+            )
         except Exception:
             logger.exception('Failed to send resolution notifications for conflict %s', conflict.id)
 
@@ -6,6 +6,7 @@ from django.contrib.auth import get_user_model
 from apps.farms.models import Farm, Shed
 from apps.flocks.models import Flock, MortalityRecord
 from apps.alarms.models import NotificationLog
+from apps.alarms.outbox import NotificationOutboxService
 from apps.sync.models import SyncConflict
 
 User = get_user_model()
@@ -41,7 +42,8 @@ class SyncConflictAPITests(APITestCase):
         self.assertEqual(mr.deaths, 3)
         self.assertEqual(self.flock.current_quantity, 27)
 
-        # check notification logs for both manager and reporter
+        # notifications go through the outbox; deliver them and check logs for both manager and reporter
+        NotificationOutboxService.drain()
         ml = NotificationLog.objects.filter(recipient=self.manager)
         rl = NotificationLog.objects.filter(recipient=self.reporter)
         self.assertTrue(ml.exists())
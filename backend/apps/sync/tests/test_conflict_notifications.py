@@ -5,6 +5,7 @@ from django.utils import timezone
 from apps.farms.models import Farm, Shed
 from apps.flocks.models import Flock
 from apps.alarms.models import NotificationLog
+from apps.alarms.outbox import NotificationOutboxService
 from apps.sync.models import SyncConflict
 from apps.sync.services import ConflictResolutionService
 
@@ -51,7 +52,8 @@ class ConflictNotificationTests(TestCase):
         self.flock.refresh_from_db()
         self.assertEqual(self.flock.current_quantity, 48)
 
-        # Ensure NotificationLog entries were created for the farm manager (LocalFallbackAdapter writes logs)
+        # Deliver the outbox, then ensure NotificationLog entries were created (LocalFallbackAdapter writes logs)
+        NotificationOutboxService.drain()
         # Expect logs for both manager and reporter
         manager_logs = NotificationLog.objects.filter(recipient=self.manager)
         reporter_logs = NotificationLog.objects.filter(recipient=self.reporter)
@@ -22,6 +22,14 @@ app.conf.beat_schedule = {
         'task': 'apps.alarms.tasks.evaluate_all_alarms_task',
         'schedule': 3600.0,  # Cada hora en segundos
     },
+    'evaluate-weight-deviations-every-5-minutes': {
+        'task': 'apps.alarms.tasks.evaluate_weight_deviations_task',
+        'schedule': 300.0,  # Cada 5 minutos
+    },
+    'deliver-notifications-every-minute': {
+        'task': 'apps.alarms.tasks.deliver_notifications_task',
+        'schedule': 60.0,  # Cada minuto (además del disparo tras cada commit)
+    },
     'escalate-alarms-every-4-hours': {
         'task': 'apps.alarms.tasks.escalate_unresolved_alarms_task',
         'schedule': 14400.0,  # Cada 4 horas
@@ -30,6 +38,10 @@ app.conf.beat_schedule = {
         'task': 'apps.inventory.tasks.update_all_inventory_metrics_task',
         'schedule': 86400.0,  # Cada día
     },
+    'reconcile-flock-headcounts-daily': {
+        'task': 'apps.flocks.tasks.reconcile_flock_headcounts_task',
+        'schedule': crontab(hour=3, minute=0),  # Todos los días a las 3:00 AM
+    },
     'check-stock-alerts-every-6-hours': {
         'task': 'apps.inventory.tasks.check_stock_alerts_task',
         'schedule': 21600.0,  # Cada 6 horas
@@ -203,6 +203,27 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Evaluación periódica de alarmas: 'chord' (una tarea por granja), 'threads' (pool en
+# el proceso, para despliegues sin workers extra) o 'serial'
+ALARM_EVALUATION_MODE = os.environ.get('ALARM_EVALUATION_MODE', 'chord')
+ALARM_EVALUATION_WORKERS = int(os.environ.get('ALARM_EVALUATION_WORKERS', '4'))
+# Repartir por granja × tipo de configuración en lugar de por granja
+ALARM_EVALUATION_SPLIT_BY_TYPE = os.environ.get('ALARM_EVALUATION_SPLIT_BY_TYPE', 'False').lower() == 'true'
+# Granjas cuya evaluación supere este tiempo se registran como lentas
+ALARM_SLOW_FARM_SECONDS = int(os.environ.get('ALARM_SLOW_FARM_SECONDS', '30'))
+# Filas de la bandeja de salida de notificaciones que toma cada ronda del worker
+ALARM_NOTIFICATION_BATCH_SIZE = int(os.environ.get('ALARM_NOTIFICATION_BATCH_SIZE', '100'))
+# Reintentos de una notificación fallida; la espera se duplica en cada intento
+ALARM_NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('ALARM_NOTIFICATION_MAX_ATTEMPTS', '5'))
+ALARM_NOTIFICATION_BACKOFF_SECONDS = int(os.environ.get('ALARM_NOTIFICATION_BACKOFF_SECONDS', '60'))
+# Plazo de una fila reclamada por un worker; si el worker muere, vuelve a la cola al vencer
+ALARM_NOTIFICATION_LEASE_SECONDS = int(os.environ.get('ALARM_NOTIFICATION_LEASE_SECONDS', '300'))
+# Con el adaptador de correo, unir en un solo mensaje las alarmas de un destinatario en cada ronda
+ALARMS_EMAIL_DIGEST = os.environ.get('ALARMS_EMAIL_DIGEST', 'False').lower() == 'true'
+
+# Edad máxima (días) que acepta la analítica de crecimiento; acota el tamaño de las matrices lote × edad
+FLOCK_GROWTH_MAX_AGE_DAYS = int(os.environ.get('FLOCK_GROWTH_MAX_AGE_DAYS', '120'))
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",